@@ -1,4 +1,6 @@
 class Volume:
+    __slots__ = ("capacity_bytes", "id", "volume_name", "array_address", "pool_name", "array_type")
+
     def __init__(self, vol_size_bytes, vol_id, vol_name, array_address, pool_name, array_type):
         self.capacity_bytes = vol_size_bytes
         self.id = vol_id
@@ -9,6 +11,9 @@ class Volume:
 
 
 class Snapshot:
+    __slots__ = ("capacity_bytes", "id", "snapshot_name", "array_address", "volume_name", "is_ready",
+                 "array_type")
+
     def __init__(self, capacity_bytes, snapshot_id, snapshot_name, array_address, volume_name, is_ready, array_type):
         self.capacity_bytes = capacity_bytes
         self.id = snapshot_id
@@ -20,6 +25,8 @@ class Snapshot:
 
 
 class Host:
+    __slots__ = ("id", "name", "iscsi_names", "wwns")
+
     def __init__(self, host_id, host_name, iscsi_names, wwns):
         self.id = host_id
         self.name = host_name
@@ -1,47 +1,202 @@
-from threading import Lock
+from collections import deque, OrderedDict
+from concurrent import futures
+from contextlib import closing
+from hashlib import sha256
+from threading import Lock, Event
+from time import time
+import errno
+import selectors
 import socket
 
 from controller.common.csi_logger import get_stdout_logger
-from controller.array_action.errors import NoConnectionAvailableException, FailedToFindStorageSystemType
+from controller.common.ttl_cache import TTLCache
+from controller.array_action.config import CONNECTION_POOL_IDLE_TTL_IN_SECONDS, CONNECTION_WAIT_TIMEOUT_IN_SECONDS, \
+    CONNECTION_WAIT_POLL_INTERVAL_IN_SECONDS, CONNECTION_WAITERS_PER_CONNECTION, ARRAY_TYPE_CACHE_TTL_IN_SECONDS, \
+    ARRAY_TYPE_NEGATIVE_CACHE_TTL_IN_SECONDS
+from controller.array_action.errors import NoConnectionAvailableException, FailedToFindStorageSystemType, \
+    BaseArrayActionException
 from controller.array_action.array_mediator_xiv import XIVArrayMediator
 from controller.array_action.array_mediator_svc import SVCArrayMediator
 from controller.array_action.array_mediator_ds8k import DS8KArrayMediator
 
 connection_lock_dict = {}
+# number of live connections (borrowed and idle) per endpoint key, bounded by the mediator max_connections
 array_connections_dict = {}
+# idle connections per pool key, each one is a [mediator, time returned to the pool] pair, most recent last
+idle_connections_dict = {}
+# FIFO queue of the threads waiting for a connection per endpoint key, each one is represented by its wake up event
+connection_waiters_dict = {}
+# detected array type per endpoint key, None when no array type was found on the endpoints
+array_types_cache = TTLCache(ARRAY_TYPE_CACHE_TTL_IN_SECONDS)
+_ARRAY_TYPE_NOT_CACHED = object()
+connection_waiters_per_connection = CONNECTION_WAITERS_PER_CONNECTION
+
+_connection_lock_dict_lock = Lock()
 
 logger = get_stdout_logger()
 
 
-def _socket_connect_test(host, port, timeout=1):
+class ConnectionPoolStats(object):
+
+    def __init__(self):
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.wait_time_in_seconds = 0.0
+
+    def add(self, hit, wait_time_in_seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.wait_time_in_seconds += wait_time_in_seconds
+
+    def add_evictions(self, count):
+        with self._lock:
+            self.evictions += count
+
+    def as_dict(self):
+        with self._lock:
+            borrows = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": float(self.hits) / borrows if borrows else 0.0,
+                    "wait_time_in_seconds": self.wait_time_in_seconds}
+
+
+pool_stats = ConnectionPoolStats()
+
+
+def set_connection_waiters_per_connection(waiters_per_connection):
+    global connection_waiters_per_connection
+    connection_waiters_per_connection = waiters_per_connection
+
+
+def get_connection_pool_stats():
+    """
+    :return: dict with the connection pool counters (hits, misses, evictions, hit_rate and wait_time_in_seconds)
+    """
+    return pool_stats.as_dict()
+
+
+def _resolve_hosts(hosts, timeout):
     """
-    function to test socket connection to host:port.
+    resolve all the host names at once, each one in its own thread since getaddrinfo has no timeout.
 
-    :param host: ip address or host name
-    :param port: port
-    :param timeout: connection timeout
+    :param hosts: list of host names or ip addresses
+    :param timeout: resolution timeout
 
-    :return:  0 - on successful connection
-             -1 - on any exception, or specific connection errors with that error number
-             other values - on other connection errors
+    :return: dict of the ipv4 address per host, without the hosts that could not be resolved until the timeout
     """
+    if not hosts:
+        return {}
+    executor = futures.ThreadPoolExecutor(max_workers=len(hosts))
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        ret = sock.connect_ex((host, port))
-        sock.close()
-        return ret
-    except socket.gaierror as e:
-        logger.debug('could not resolve hostname "{HOST}": {ERROR}'.format(HOST=host, ERROR=e))
-        return -1
-    except Exception as e:
-        logger.debug('socket_connect {}'.format(e))
-        return -1
+        hosts_by_resolution = {executor.submit(socket.getaddrinfo, host, None, socket.AF_INET, socket.SOCK_STREAM): host
+                               for host in hosts}
+        done, not_done = futures.wait(hosts_by_resolution, timeout=timeout)
+    finally:
+        # a resolution that did not end until the timeout is left to end in the background
+        executor.shutdown(wait=False)
+
+    ip_addresses = {}
+    for resolution in done:
+        host = hosts_by_resolution[resolution]
+        try:
+            ip_addresses[host] = resolution.result()[0][4][0]
+        except socket.gaierror as e:
+            logger.debug('could not resolve hostname "{HOST}": {ERROR}'.format(HOST=host, ERROR=e))
+        except Exception as e:
+            logger.debug('socket_connect {}'.format(e))
+    for resolution in not_done:
+        logger.debug('resolving hostname "{}" timed out'.format(hosts_by_resolution[resolution]))
+    return ip_addresses
+
+
+def _socket_connect_tests(host_ports, timeout=1):
+    """
+    generator to test socket connections to all the host:port pairs at once.
+    the host names are resolved together first, each one once, and then the connections are started together with
+    non-blocking sockets, so testing all of them takes one resolution timeout and one connection timeout at most.
+
+    :param host_ports: list of (host, port) pairs, host is an ip address or host name
+    :param timeout: timeout of the host names resolution, and then of the connections
+
+    :return: yields a (host, port, is_open) tuple for each pair as soon as its connection is settled,
+             the pairs that were not resolved or connected until the timeout are yielded as not open
+    """
+    ip_addresses = _resolve_hosts(list(OrderedDict.fromkeys(host for host, _ in host_ports)), timeout)
+    selector = selectors.DefaultSelector()
+    sockets = []
+    deadline = time() + timeout
+    try:
+        for host, port in host_ports:
+            if host not in ip_addresses:
+                yield host, port, False
+                continue
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sockets.append(sock)
+                sock.setblocking(False)
+                ret = sock.connect_ex((ip_addresses[host], port))
+            except Exception as e:
+                logger.debug('socket_connect {}'.format(e))
+                yield host, port, False
+                continue
+            if ret in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                selector.register(sock, selectors.EVENT_WRITE, (host, port))
+            else:
+                yield host, port, ret == 0
+
+        while selector.get_map():
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                selector.unregister(key.fileobj)
+                host, port = key.data
+                yield host, port, key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+
+        for key in list(selector.get_map().values()):
+            host, port = key.data
+            logger.debug("connection to {}:{} timed out".format(host, port))
+            yield host, port, False
+    finally:
+        selector.close()
+        for sock in sockets:
+            sock.close()
+
+
+def _get_connection_lock(endpoint_key):
+    with _connection_lock_dict_lock:
+        if endpoint_key not in connection_lock_dict:
+            connection_lock_dict[endpoint_key] = Lock()
+        return connection_lock_dict[endpoint_key]
+
+
+def _hash_credentials(user, password):
+    return sha256("{0}:{1}".format(user, password).encode()).hexdigest()
+
+
+def _close_connections(mediators):
+    for mediator in mediators:
+        try:
+            mediator.disconnect()
+        except Exception as ex:
+            logger.warning("failed to close pooled connection : {}".format(ex))
 
 
 class ArrayConnectionManager(object):
 
-    def __init__(self, user, password, endpoint, array_type=None):  # TODO return the params back.
+    def __init__(self, user, password, endpoint, array_type=None, connection_timeout=None, is_active=None):
+        """
+        :param connection_timeout: seconds to wait in the endpoint queue for a free connection,
+                                   CONNECTION_WAIT_TIMEOUT_IN_SECONDS if not given
+        :param is_active: callable that returns False once the request was cancelled, to stop waiting for a connection
+        """
         self.array_mediator_class_dict = {
             XIVArrayMediator.array_type: XIVArrayMediator,
             SVCArrayMediator.array_type: SVCArrayMediator,
@@ -53,11 +208,17 @@ class ArrayConnectionManager(object):
         self.password = password
         self.endpoints = endpoint
         self.endpoint_key = ",".join(self.endpoints)
+        self.connection_timeout = CONNECTION_WAIT_TIMEOUT_IN_SECONDS if connection_timeout is None \
+            else connection_timeout
+        self.is_active = is_active
+        self.pool_key = (self.endpoint_key, self.user, _hash_credentials(self.user, self.password))
 
         if self.array_type is None:
             self.array_type = self.detect_array_type()
+        elif self.array_type in self.array_mediator_class_dict:
+            # the array type is known from the volume id, so it can spare the detection of later requests
+            array_types_cache.set(self.endpoint_key, self.array_type)
 
-        connection_lock_dict[self.endpoint_key] = Lock()
         self.med_class = None
         self.connected = False
 
@@ -67,63 +228,262 @@ class ArrayConnectionManager(object):
         return arr_connection
 
     def __exit__(self, type, value, traceback):
-        logger.debug("closing the connection")
-        with connection_lock_dict[self.endpoint_key]:  # TODO: when moving to python 3 add tiemout!
-            if self.connected:
-                self.med_class.disconnect()
-                logger.debug("reducing the connection count")
-                if array_connections_dict[self.endpoint_key] == 1:
-                    del array_connections_dict[self.endpoint_key]
-                else:
-                    array_connections_dict[self.endpoint_key] -= 1
-                logger.debug("removing the connection  : {}".format(array_connections_dict))
-                self.connected = False
+        if not self.connected:
+            return
+        self.connected = False
+        if type and not isinstance(value, BaseArrayActionException):
+            # the session state is unknown after an unexpected error, so it is not reused
+            logger.debug("closing the connection")
+            self._release_connection(self.med_class)
+        else:
+            logger.debug("returning the connection to the pool")
+            self._return_connection(self.med_class)
 
     def get_array_connection(self):
         logger.debug("get array connection")
         med_class = self.array_mediator_class_dict[self.array_type]
 
-        with connection_lock_dict[self.endpoint_key]:  # TODO: when moving to python 3 - add timeout to the lock!
-            if self.endpoint_key in array_connections_dict:
-
-                if array_connections_dict[self.endpoint_key] < med_class.max_connections:
-                    logger.debug("adding new connection ")
-                    array_connections_dict[self.endpoint_key] += 1
-
-                else:
-                    logger.error("failed to get connection. current connections: {}".format(array_connections_dict))
+        start_time = time()
+        deadline = start_time + self.connection_timeout
+        waiter = None
+        try:
+            while True:
+                with _get_connection_lock(self.endpoint_key):
+                    acquired, mediator, connections_to_close = self._try_acquire_connection(med_class, waiter)
+                    if acquired:
+                        self._remove_waiter(waiter)
+                        waiter = None
+                        logger.debug("got connection lock. array connection dict is: {}".format(
+                            array_connections_dict))
+                        break
+                    is_wait_queue_full = waiter is None and self._is_wait_queue_full(med_class)
+                    if waiter is None and not is_wait_queue_full:
+                        waiter = Event()
+                        connection_waiters_dict.setdefault(self.endpoint_key, deque()).append(waiter)
+                        logger.debug("waiting for a connection to endpoint : {}".format(self.endpoint_key))
+                _close_connections(connections_to_close)
+                if is_wait_queue_full:
+                    logger.error("too many requests are waiting for a connection to endpoint : {}".format(
+                        self.endpoint_key))
                     raise NoConnectionAvailableException(self.endpoint_key)
-            else:
-                logger.debug("adding new connection to new endpoint : {}".format(self.endpoint_key))
-                array_connections_dict[self.endpoint_key] = 1
+                self._wait_for_connection(waiter, deadline)
+        finally:
+            if waiter is not None:
+                with _get_connection_lock(self.endpoint_key):
+                    self._remove_waiter(waiter)
+        pool_stats.add(hit=mediator is not None, wait_time_in_seconds=time() - start_time)
+        _close_connections(connections_to_close)
+
+        if mediator is not None and not mediator.is_connected():
+            logger.debug("pooled connection is no longer connected, opening a new one")
+            _close_connections([mediator])
+            mediator = None
 
-            logger.debug("got connection lock. array connection dict is: {}".format(array_connections_dict))
+        if mediator is None:
             try:
-                self.med_class = med_class(self.user, self.password, self.endpoints)
+                mediator = med_class(self.user, self.password, self.endpoints)
             except Exception as ex:
-                if array_connections_dict[self.endpoint_key] == 1:
-                    del array_connections_dict[self.endpoint_key]
-                else:
-                    array_connections_dict[self.endpoint_key] -= 1
-
+                self._unreserve_connection()
+                # the endpoints may have been replaced by another storage system type
+                array_types_cache.pop(self.endpoint_key)
                 raise ex
 
-            self.connected = True
+        self.med_class = mediator
+        self.connected = True
+
+        return self.med_class
+
+    def _try_acquire_connection(self, med_class, waiter):
+        """
+        Take an idle connection or reserve a new one, unless other threads are waiting ahead of this one.
+        Must be called while holding the endpoint connection lock.
+
+        :return: (acquired, pooled mediator or None, list of mediators to be closed by the caller outside of the lock)
+        """
+        waiters = connection_waiters_dict.get(self.endpoint_key)
+        if waiters and waiters[0] is not waiter:
+            return False, None, []
+        if waiter is not None:
+            waiter.clear()
+        connections_to_close = self._pop_expired_connections()
+        mediator = self._pop_idle_connection()
+        if mediator is not None:
+            return True, mediator, connections_to_close
+        evicted = self._reserve_connection(med_class)
+        if evicted is None:
+            return False, None, connections_to_close
+        return True, None, connections_to_close + evicted
+
+    def _is_wait_queue_full(self, med_class):
+        # the waiting requests of each array are capped by its max_connections, so that a slow array does not hold
+        # all the server workers
+        if not connection_waiters_per_connection:
+            return False
+        waiters = connection_waiters_dict.get(self.endpoint_key, ())
+        return len(waiters) >= med_class.max_connections * connection_waiters_per_connection
+
+    def _wait_for_connection(self, waiter, deadline):
+        """
+        Block until the waiter is woken up, the deadline passes or the request is cancelled.
+        The wait is done in slices so that a cancelled request stops waiting without being woken up.
+        """
+        remaining = deadline - time()
+        if remaining <= 0:
+            logger.error("failed to get connection. current connections: {}".format(array_connections_dict))
+            raise NoConnectionAvailableException(self.endpoint_key)
+        if self.is_active and not self.is_active():
+            logger.debug("request was cancelled while waiting for a connection")
+            raise NoConnectionAvailableException(self.endpoint_key)
+        waiter.wait(min(remaining, CONNECTION_WAIT_POLL_INTERVAL_IN_SECONDS))
+
+    def _remove_waiter(self, waiter):
+        waiters = connection_waiters_dict.get(self.endpoint_key)
+        if waiters is None:
+            return
+        if waiter is not None and waiter in waiters:
+            waiters.remove(waiter)
+        if waiters:
+            # the new head may be able to get a connection as well
+            waiters[0].set()
+        else:
+            del connection_waiters_dict[self.endpoint_key]
 
-            return self.med_class
+    def _notify_waiter(self):
+        waiters = connection_waiters_dict.get(self.endpoint_key)
+        if waiters:
+            waiters[0].set()
+
+    def _pop_expired_connections(self):
+        """
+        Remove the idle connections of this endpoint that were not used for the idle TTL.
+        Must be called while holding the endpoint connection lock.
+
+        :return: list of the removed mediators, to be closed by the caller outside of the lock
+        """
+        expired = []
+        expiration_time = time() - CONNECTION_POOL_IDLE_TTL_IN_SECONDS
+        for pool_key in [key for key in idle_connections_dict if key[0] == self.endpoint_key]:
+            idle_connections = idle_connections_dict[pool_key]
+            while idle_connections and idle_connections[0][1] < expiration_time:
+                expired.append(idle_connections.pop(0)[0])
+            if not idle_connections:
+                del idle_connections_dict[pool_key]
+        self._remove_connections_count(len(expired))
+        pool_stats.add_evictions(len(expired))
+        return expired
+
+    def _pop_idle_connection(self):
+        idle_connections = idle_connections_dict.get(self.pool_key)
+        if not idle_connections:
+            return None
+        mediator, _ = idle_connections.pop()
+        if not idle_connections:
+            del idle_connections_dict[self.pool_key]
+        logger.debug("reusing pooled connection to endpoint : {}".format(self.endpoint_key))
+        return mediator
+
+    def _reserve_connection(self, med_class):
+        """
+        Count a new connection for this endpoint, evicting an idle connection that was opened with other credentials
+        when the endpoint is already at max_connections.
+        Must be called while holding the endpoint connection lock.
+
+        :return: list of evicted mediators, to be closed by the caller outside of the lock,
+                 or None if all the endpoint connections are in use
+        """
+        evicted = []
+        if array_connections_dict.get(self.endpoint_key, 0) >= med_class.max_connections:
+            evicted = self._pop_other_idle_connection()
+            if not evicted:
+                return None
+            pool_stats.add_evictions(len(evicted))
+        else:
+            logger.debug("adding new connection to endpoint : {}".format(self.endpoint_key))
+            array_connections_dict[self.endpoint_key] = array_connections_dict.get(self.endpoint_key, 0) + 1
+        return evicted
+
+    def _pop_other_idle_connection(self):
+        for pool_key in [key for key in idle_connections_dict if key[0] == self.endpoint_key]:
+            idle_connections = idle_connections_dict[pool_key]
+            mediator, _ = idle_connections.pop(0)
+            if not idle_connections:
+                del idle_connections_dict[pool_key]
+            return [mediator]
+        return []
+
+    def _unreserve_connection(self):
+        with _get_connection_lock(self.endpoint_key):
+            self._remove_connections_count(1)
+            self._notify_waiter()
+
+    def _remove_connections_count(self, count):
+        if not count:
+            return
+        logger.debug("reducing the connection count")
+        if array_connections_dict[self.endpoint_key] <= count:
+            del array_connections_dict[self.endpoint_key]
+        else:
+            array_connections_dict[self.endpoint_key] -= count
+        logger.debug("removing the connection  : {}".format(array_connections_dict))
+
+    def _return_connection(self, mediator):
+        with _get_connection_lock(self.endpoint_key):
+            # the idle connections also expire while no connection is taken from the pool
+            connections_to_close = self._pop_expired_connections()
+            idle_connections_dict.setdefault(self.pool_key, []).append([mediator, time()])
+            self._notify_waiter()
+        _close_connections(connections_to_close)
+
+    def _release_connection(self, mediator):
+        self._unreserve_connection()
+        _close_connections([mediator])
 
     def detect_array_type(self):
+        cached_array_type = array_types_cache.get(self.endpoint_key, _ARRAY_TYPE_NOT_CACHED)
+        if cached_array_type is None:
+            logger.debug("storage array type was not found recently for : {0}".format(self.endpoint_key))
+            raise FailedToFindStorageSystemType(self.endpoints)
+        if cached_array_type is not _ARRAY_TYPE_NOT_CACHED:
+            logger.debug("storage array type is : {0} (cached)".format(cached_array_type))
+            return cached_array_type
+
+        try:
+            array_type = self._detect_array_type()
+        except FailedToFindStorageSystemType:
+            array_types_cache.set(self.endpoint_key, None, ARRAY_TYPE_NEGATIVE_CACHE_TTL_IN_SECONDS)
+            raise
+        array_types_cache.set(self.endpoint_key, array_type)
+        return array_type
+
+    def _detect_array_type(self):
         logger.debug("detecting array connection type")
 
         # Don't change the order here since svc port (22) is also opened in ds8k.
-        for storage_type, port in [(XIVArrayMediator.array_type, XIVArrayMediator.port),
-                                   (DS8KArrayMediator.array_type, DS8KArrayMediator.port),
-                                   (SVCArrayMediator.array_type, SVCArrayMediator.port),
-                                   ]:
-
-            for endpoint in self.endpoints:
-                if _socket_connect_test(endpoint, port) == 0:
-                    logger.debug("storage array type is : {0}".format(storage_type))
-                    return storage_type
+        storage_types_by_priority = [(XIVArrayMediator.array_type, XIVArrayMediator.port),
+                                     (DS8KArrayMediator.array_type, DS8KArrayMediator.port),
+                                     (SVCArrayMediator.array_type, SVCArrayMediator.port),
+                                     ]
+
+        endpoints = list(OrderedDict.fromkeys(self.endpoints))
+        storage_type_by_port = {port: storage_type for storage_type, port in storage_types_by_priority}
+        untested_endpoints_by_storage_type = {storage_type: set(endpoints)
+                                              for storage_type, _ in storage_types_by_priority}
+        found_storage_types = set()
+        host_ports = [(endpoint, port) for _, port in storage_types_by_priority for endpoint in endpoints]
+
+        with closing(_socket_connect_tests(host_ports)) as connect_tests:
+            for endpoint, port, is_open in connect_tests:
+                storage_type = storage_type_by_port[port]
+                untested_endpoints_by_storage_type[storage_type].discard(endpoint)
+                if is_open:
+                    found_storage_types.add(storage_type)
+
+                # a storage type is settled only when none of the storage types before it can still be found
+                for storage_type, _ in storage_types_by_priority:
+                    if storage_type in found_storage_types:
+                        logger.debug("storage array type is : {0}".format(storage_type))
+                        return storage_type
+                    if untested_endpoints_by_storage_type[storage_type]:
+                        break
 
         raise FailedToFindStorageSystemType(self.endpoints)
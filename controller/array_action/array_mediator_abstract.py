@@ -1,10 +1,10 @@
 from abc import ABC
-from retry import retry
 
 import controller.array_action.errors as controller_errors
 from controller.array_action.array_mediator_interface import ArrayMediator
 from controller.array_action.config import FC_CONNECTIVITY_TYPE, ISCSI_CONNECTIVITY_TYPE
-from controller.array_action.errors import NoConnectionAvailableException, UnsupportedConnectivityTypeError
+from controller.array_action.errors import UnsupportedConnectivityTypeError
+from controller.array_action.object_locks import host_locks
 from controller.common.csi_logger import get_stdout_logger
 from controller.controller_server import utils
 
@@ -13,8 +13,66 @@ logger = get_stdout_logger()
 
 class ArrayMediatorAbstract(ArrayMediator, ABC):
 
-    @retry(NoConnectionAvailableException, tries=11, delay=1)
-    def map_volume_by_initiators(self, vol_id, initiators):
+    def map_volume_by_initiators(self, vol_id, initiators, lock_timeout=None):
+        """
+        Args:
+            lock_timeout : max seconds to wait for the host mappings lock, the default lock timeout if not given
+        """
+        host_name, connectivity_type, array_initiators = self._get_host_connectivity(initiators)
+
+        # the free lun of the host is chosen by its current mappings, so the mappings to the host are serialized
+        with self._lock_host_mappings(host_name, lock_timeout):
+            lun = self._get_host_lun(vol_id, host_name)
+            if lun is None:
+                logger.debug(
+                    "no mappings were found for volume. mapping vol : {0} to host : {1}".format(
+                        vol_id, host_name))
+                lun = self._map_volume_with_retries(vol_id, host_name)
+
+        return lun, connectivity_type, array_initiators
+
+    def map_volumes_by_initiators(self, vol_ids, initiators, lock_timeout=None):
+        """
+        Map a batch of volumes to the host of the initiators, which is found once for the whole batch.
+
+        Args:
+            lock_timeout : max seconds to wait for the host mappings lock, the default lock timeout if not given
+
+        Returns:
+            ((lun, connectivity_type, array_initiators), exception) pair per volume
+        """
+        host_name, connectivity_type, array_initiators = self._get_host_connectivity(initiators)
+        logger.debug("mapping {0} volumes to host : {1}".format(len(vol_ids), host_name))
+
+        results = [None] * len(vol_ids)
+        unmapped_indexes = []
+        with self._lock_host_mappings(host_name, lock_timeout):
+            for index, vol_id in enumerate(vol_ids):
+                try:
+                    lun = self._get_host_lun(vol_id, host_name)
+                except Exception as ex:
+                    results[index] = (None, ex)
+                    continue
+                if lun is None:
+                    unmapped_indexes.append(index)
+                else:
+                    results[index] = ((lun, connectivity_type, array_initiators), None)
+            luns_and_exceptions = self._map_volumes([vol_ids[index] for index in unmapped_indexes], host_name)
+
+        for index, (lun, exception) in zip(unmapped_indexes, luns_and_exceptions):
+            if exception is not None:
+                results[index] = (None, exception)
+            else:
+                results[index] = ((lun, connectivity_type, array_initiators), None)
+        return results
+
+    def _get_host_connectivity(self, initiators):
+        """
+        Returns:
+            host_name         : name of the host of the initiators
+            connectivity_type : the chosen connectivity type to the host
+            array_initiators  : the array fc wwns or iscsi targets of the connectivity type
+        """
         host_name, connectivity_types = self.get_host_by_host_identifiers(initiators)
 
         logger.debug(
@@ -29,7 +87,16 @@ class ArrayMediatorAbstract(ArrayMediator, ABC):
             array_initiators = self.get_iscsi_targets_by_iqn()
         else:
             raise UnsupportedConnectivityTypeError(connectivity_type)
+        return host_name, connectivity_type, array_initiators
+
+    def _get_host_lun(self, vol_id, host_name):
+        """
+        Returns:
+            the lun of the volume mapping to the host, or None if the volume is not mapped
 
+        Raises:
+            VolumeMappedToMultipleHostsError if the volume is mapped to another host
+        """
         mappings = self.get_volume_mappings(vol_id)
         if len(mappings) >= 1:
             logger.debug(
@@ -38,13 +105,11 @@ class ArrayMediatorAbstract(ArrayMediator, ABC):
                 mapping = list(mappings)[0]
                 if mapping == host_name:
                     logger.debug("idempotent case - volume is already mapped to host.")
-                    return mappings[mapping], connectivity_type, array_initiators
+                    return mappings[mapping]
             raise controller_errors.VolumeMappedToMultipleHostsError(mappings)
+        return None
 
-        logger.debug(
-            "no mappings were found for volume. mapping vol : {0} to host : {1}".format(
-                vol_id, host_name))
-
+    def _map_volume_with_retries(self, vol_id, host_name):
         try:
             lun = self.map_volume(vol_id, host_name)
             logger.debug("lun : {}".format(lun))
@@ -62,11 +127,59 @@ class ArrayMediatorAbstract(ArrayMediator, ABC):
                                                                      inner_ex))
             else:  # will get here only if the for statement is false.
                 raise ex
+        return lun
 
-        return lun, connectivity_type, array_initiators
+    def _map_volumes(self, vol_ids, host_name):
+        """
+        Map the volumes to the host, while holding the host mappings lock.
+
+        Returns:
+            (lun, exception) pair per volume
+        """
+        results = []
+        for vol_id in vol_ids:
+            try:
+                results.append((self._map_volume_with_retries(vol_id, host_name), None))
+            except Exception as ex:
+                results.append((None, ex))
+        return results
+
+    def _lock_host_mappings(self, host_name, timeout=None):
+        # host names are unique only within an array
+        return host_locks.lock((self._get_array_key(), host_name), timeout)
+
+    def _get_array_key(self):
+        """
+        Returns:
+            key of the array, shared by all the connections to it
+        """
+        return str(self.endpoint)
 
-    @retry(NoConnectionAvailableException, tries=11, delay=1)
     def unmap_volume_by_initiators(self, vol_id, initiators):
         host_name, _ = self.get_host_by_host_identifiers(initiators)
 
         self.unmap_volume(vol_id, host_name)
+
+    def unmap_volumes_by_initiators(self, vol_ids, initiators):
+        """
+        Unmap a batch of volumes from the host of the initiators, which is found once for the whole batch.
+
+        Returns:
+            (None, exception) pair per volume
+        """
+        host_name, _ = self.get_host_by_host_identifiers(initiators)
+        logger.debug("un-mapping {0} volumes from host : {1}".format(len(vol_ids), host_name))
+        return self._unmap_volumes(vol_ids, host_name)
+
+    def _unmap_volumes(self, vol_ids, host_name):
+        """
+        Returns:
+            (None, exception) pair per volume
+        """
+        results = []
+        for vol_id in vol_ids:
+            try:
+                results.append((self.unmap_volume(vol_id, host_name), None))
+            except Exception as ex:
+                results.append((None, ex))
+        return results
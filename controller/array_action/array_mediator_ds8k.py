@@ -6,7 +6,11 @@ from controller.common.csi_logger import get_stdout_logger
 from controller.common import settings
 from controller.array_action.array_mediator_abstract import ArrayMediatorAbstract
 from controller.array_action.utils import classproperty
-from controller.array_action.ds8k_rest_client import RESTClient, scsilun_to_int
+from controller.array_action.ds8k_rest_client import get_rest_client, scsilun_to_int
+from controller.array_action.ds8k_hosts_cache import get_hosts_cache
+from controller.array_action.ds8k_mappings_index import get_mappings_index
+from controller.array_action.ds8k_system_info_cache import get_system_info_cache
+from controller.array_action.ds8k_volume_names_index import get_volume_names_index
 import controller.array_action.errors as array_errors
 from controller.array_action import config
 from controller.array_action.array_action_types import Volume
@@ -127,12 +131,9 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
 
     def _connect(self):
         try:
-            self.client = RESTClient(service_address=self.service_address,
-                                     user=self.user,
-                                     password=self.password,
-                                     )
+            self.client = get_rest_client(self.service_address, self.user, self.password, self.max_connections)
 
-            self.system_info = self.get_system_info()
+            self.system_info = get_system_info_cache(self.service_address).get(self.get_system_info)
 
             if parse(self.version) < parse(self.SUPPORTED_FROM_VERSION):
                 raise array_errors.UnsupportedStorageVersionError(
@@ -157,9 +158,16 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
     def disconnect(self):
         pass
 
+    def is_connected(self):
+        # the rest client is shared between the connections to the array, and re-authenticates when its token expires.
+        return self.client is not None
+
     def get_system_info(self):
         return self.client.get_system()
 
+    def _get_array_key(self):
+        return self.service_address
+
     @property
     def identifier(self):
         return self.system_info.id
@@ -176,6 +184,15 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
     def wwnn(self):
         return self.system_info.wwnn
 
+    def _get_mappings_index(self):
+        return get_mappings_index(self.service_address, self.user)
+
+    def _get_volume_names_index(self):
+        return get_volume_names_index(self.service_address, self.user)
+
+    def _get_hosts_cache(self):
+        return get_hosts_cache(self.service_address, self.user)
+
     def _generate_volume_scsi_identifier(self, volume_id):
         return '6{}000000000000{}'.format(self.wwnn[1:], volume_id)
 
@@ -198,7 +215,7 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
                 return "ese"
         return "none"
 
-    def create_volume(self, name, size_in_bytes, capabilities, pool_id, volume_prefix=""):
+    def create_volume(self, name, size_in_bytes, capabilities, pool_id, volume_prefix="", raise_if_exists=False):
         logger.info(
             "Creating volume with name: {}, size: {}, in pool: {}, "
             "with capabilities: {}".format(
@@ -228,12 +245,28 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
                     volume_prefix=volume_prefix
                 )
                 logger.info("Found volume {}".format(name))
+                if raise_if_exists:
+                    raise array_errors.VolumeAlreadyExists(name, self.service_address)
                 return vol
             except array_errors.VolumeNotFoundError:
-                vol = self.client.create_volume(**cli_kwargs)
+                try:
+                    vol = self.client.create_volume(**cli_kwargs)
+                except Exception:
+                    # the volume may be created although the request failed, so it is looked up again on a retry
+                    self._get_volume_names_index().mark_stale(pool_id)
+                    raise
+                self._get_volume_names_index().add(pool_id, cli_kwargs['name'], vol.id)
 
                 logger.info("finished creating volume {}".format(name))
-                return self._generate_volume_response(self.client.get_volume(vol.id))
+                # the volume is not got again, its fields other than the id are known from the creation
+                return Volume(
+                    vol_size_bytes=int(size_in_bytes),
+                    vol_id=self._generate_volume_scsi_identifier(vol.id),
+                    vol_name=cli_kwargs['name'],
+                    array_address=self.service_address,
+                    pool_name=pool_id,
+                    array_type=self.array_type
+                )
         except exceptions.NotFound as ex:
             if ERROR_CODE_RESOURCE_NOT_EXISTS in str(ex.message).upper():
                 raise array_errors.PoolDoesNotExist(pool_id, self.identifier)
@@ -258,12 +291,17 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
 
     def delete_volume(self, volume_id):
         logger.info("Deleting volume {}".format(volume_id))
+        array_volume_id = get_volume_id_from_scsi_identifier(volume_id)
         try:
             self.client.delete_volume(
-                volume_id=get_volume_id_from_scsi_identifier(volume_id)
+                volume_id=array_volume_id
             )
+            self._get_mappings_index().remove(array_volume_id)
+            self._get_volume_names_index().remove(array_volume_id)
             logger.info("Finished deleting volume {}".format(volume_id))
         except exceptions.NotFound:
+            self._get_mappings_index().remove(array_volume_id)
+            self._get_volume_names_index().remove(array_volume_id)
             raise array_errors.VolumeNotFoundError(volume_id)
         except exceptions.ClientException as ex:
             logger.error(
@@ -283,23 +321,30 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
             )
             raise array_errors.VolumeNotFoundError(name)
 
-        volume_candidates = []
-
         if config.CONTEXT_POOL in volume_context:
+            pool_id = volume_context[config.CONTEXT_POOL]
+            volume_name = shorten_volume_name(name, volume_prefix)
+            volume_names_index = self._get_volume_names_index()
             try:
-                volume_candidates = self.client.get_volumes_by_pool(
-                    volume_context[config.CONTEXT_POOL]
-                )
+                volume_id = volume_names_index.get_volume_id(pool_id, volume_name,
+                                                             lambda: self.client.get_volumes_by_pool(pool_id))
             except exceptions.NotFound as ex:
                 if ERROR_CODE_RESOURCE_NOT_EXISTS in str(ex.message).upper():
-                    raise array_errors.PoolDoesNotExist(volume_context[config.CONTEXT_POOL], self.identifier)
+                    raise array_errors.PoolDoesNotExist(pool_id, self.identifier)
                 else:
                     raise ex
 
-        for vol in volume_candidates:
-            if vol.name == shorten_volume_name(name, volume_prefix):
-                logger.debug("Found volume: {}".format(vol))
-                return self._generate_volume_response(vol)
+            if volume_id is not None:
+                try:
+                    vol = self.client.get_volume(volume_id)
+                except exceptions.NotFound:
+                    vol = None
+                # the pool ids are case insensitive
+                if vol is not None and vol.name == volume_name and vol.pool.upper() == pool_id.upper():
+                    logger.debug("Found volume: {}".format(vol))
+                    return self._generate_volume_response(vol)
+                logger.debug("volume {} was deleted, renamed or moved, removing it from the index".format(volume_id))
+                volume_names_index.remove(volume_id)
 
         raise array_errors.VolumeNotFoundError(name)
 
@@ -311,13 +356,7 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
         logger.debug("Getting volume mappings for volume {}".format(volume_id))
         volume_id = get_volume_id_from_scsi_identifier(volume_id)
         try:
-            host_name_to_lun_id = {}
-            for host in self.client.get_hosts():
-                host_mappings = host.mappings_briefs
-                for mapping in host_mappings:
-                    if volume_id == mapping["volume_id"]:
-                        host_name_to_lun_id[host.name] = scsilun_to_int(mapping["lunid"])
-                        break
+            host_name_to_lun_id = self._get_mappings_index().get_mappings(volume_id, self.client.get_hosts)
             logger.debug("Found volume mappings: {}".format(host_name_to_lun_id))
             return host_name_to_lun_id
         except exceptions.ClientException as ex:
@@ -333,14 +372,19 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
             mapping = self.client.map_volume_to_host(host_name, array_volume_id)
             lun = scsilun_to_int(mapping.lunid)
             logger.debug("Successfully mapped volume to host with lun {}".format(lun))
+            self._get_mappings_index().add(array_volume_id, host_name, lun)
             return lun
         except exceptions.NotFound:
+            self._get_hosts_cache().clear()
             raise array_errors.HostNotFoundError(host_name)
         except exceptions.ClientException as ex:
             # [BE586015] addLunMappings Volume group operation failure: volume does not exist.
             if ERROR_CODE_VOLUME_NOT_FOUND_FOR_MAPPING in str(ex.message).upper():
+                self._get_mappings_index().remove(array_volume_id)
                 raise array_errors.VolumeNotFoundError(volume_id)
             else:
+                # the mappings may have been changed by others, the index is rebuilt on the next check
+                self._get_mappings_index().invalidate()
                 raise array_errors.MappingError(volume_id, host_name, ex.details)
 
     def unmap_volume(self, volume_id, host_name):
@@ -359,9 +403,13 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
                     lunid=lunid
                 )
                 logger.debug("Successfully unmapped volume from host with lun {}.".format(lunid))
+                self._get_mappings_index().remove(array_volume_id, host_name)
             else:
+                self._get_mappings_index().remove(array_volume_id, host_name)
                 raise array_errors.VolumeNotFoundError(volume_id)
         except exceptions.NotFound:
+            self._get_mappings_index().invalidate()
+            self._get_hosts_cache().clear()
             raise array_errors.HostNotFoundError(host_name)
         except exceptions.ClientException as ex:
             raise array_errors.UnMappingError(volume_id, host_name, ex.details)
@@ -387,6 +435,7 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
             logger.debug("Found wwpns: {}".format(wwpns))
             return wwpns
         except exceptions.NotFound:
+            self._get_hosts_cache().clear()
             raise array_errors.HostNotFoundError(host_name)
         except exceptions.ClientException as ex:
             logger.error(
@@ -396,13 +445,15 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
 
     def get_host_by_host_identifiers(self, initiators):
         logger.debug("Getting host by initiators: {}".format(initiators))
+        wwpns = [wwpn.lower() for wwpn in initiators.fc_wwns if wwpn]
+        hosts_cache = self._get_hosts_cache()
         found = ""
-        for host in self.client.get_hosts():
-            host_ports = host.host_ports_briefs
-            wwpns = [p["wwpn"] for p in host_ports]
-            if initiators.is_array_wwns_match(wwpns):
-                found = host.name
+        for wwpn in wwpns:
+            found = hosts_cache.get(wwpn, "")
+            if found:
                 break
+        else:
+            found = self._get_host_name_by_wwpns(wwpns)
         if found:
             logger.debug("found host {0} with fc wwpns: {1}".format(found, initiators.fc_wwns))
             return found, [config.FC_CONNECTIVITY_TYPE]
@@ -410,6 +461,19 @@ class DS8KArrayMediator(ArrayMediatorAbstract):
             logger.debug("can not found host by initiators: {0} ".format(initiators))
             raise array_errors.HostNotFoundError(initiators)
 
+    def _get_host_name_by_wwpns(self, wwpns):
+        hosts_cache = self._get_hosts_cache()
+        for wwpn in wwpns:
+            try:
+                host_name = self.client.get_host_port(wwpn).host
+            except exceptions.NotFound:
+                logger.debug("host port {} was not found".format(wwpn))
+                continue
+            if host_name:
+                hosts_cache.set(wwpn, host_name)
+                return host_name
+        return ""
+
     def validate_supported_capabilities(self, capabilities):
         logger.debug("Validating capabilities: {0}".format(capabilities))
 
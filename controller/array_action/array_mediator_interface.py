@@ -30,7 +30,18 @@ class ArrayMediator(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def create_volume(self, vol_name, size_in_bytes, capabilities, pool, volume_prefix=""):
+    def is_connected(self):
+        """
+        This function checks whether the storage system connection that was opened in the init phase is still usable.
+        It is called before a pooled connection is reused, so it should not issue commands to the storage system.
+
+        Returns:
+            True if the connection can be reused, False otherwise
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_volume(self, vol_name, size_in_bytes, capabilities, pool, volume_prefix="", raise_if_exists=False):
         """
         This function should create a volume in the storage system.
 
@@ -40,6 +51,8 @@ class ArrayMediator(ABC):
             capabilities  : dict of capabilities {<capbility_name>:<value>}
             pool          : pool name to create the volume in
             volume_prefix : name prefix of the volume
+            raise_if_exists : raise VolumeAlreadyExists when the volume is found before it is created, instead of
+                              returning it. Storage systems with unique volume names always raise.
 
         Returns:
             volume_id : the volume WWN.
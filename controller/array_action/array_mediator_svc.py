@@ -1,3 +1,4 @@
+import re
 from collections import defaultdict
 from io import StringIO
 
@@ -9,8 +10,12 @@ import controller.array_action.config as config
 import controller.array_action.errors as controller_errors
 from controller.array_action.array_action_types import Volume, Host
 from controller.array_action.array_mediator_abstract import ArrayMediatorAbstract
+from controller.array_action.lun_allocator import get_lun_allocator
 from controller.array_action.svc_cli_result_reader import SVCListResultsReader
+from controller.array_action.svc_hosts_index import get_hosts_index
 from controller.array_action.utils import classproperty, bytes_to_string
+from controller.array_action.volume_names_memo import get_volume_names_memo, \
+    invalidate_volume_name_on_not_found
 from controller.common.csi_logger import get_stdout_logger
 
 array_connections_dict = {}
@@ -31,7 +36,20 @@ HOST_ID_PARAM = 'id'
 HOST_NAME_PARAM = 'name'
 HOST_ISCSI_NAMES_PARAM = 'iscsi_name'
 HOST_WWPNS_PARAM = 'WWPN'
+HOST_DETAILS_PARAMS = (HOST_NAME_PARAM, HOST_ISCSI_NAMES_PARAM, HOST_WWPNS_PARAM)
 HOSTS_LIST_ERR_MSG_MAX_LENGTH = 300
+MAP_VOLUME_CMD_FORMAT = 'mkvdiskhostmap -force -host {HOST_NAME} -scsi {LUN} {VOLUME_NAME};'
+UNMAP_VOLUME_CMD_FORMAT = 'rmvdiskhostmap -host {HOST_NAME} {VOLUME_NAME};'
+# e.g. Virtual Disk to Host map, id [1], successfully created
+MAPPING_RESULT_LUN_PATTERN = re.compile(r'id \[(\d+)\]')
+
+# when set, mkvdiskhostmap is sent without a scsi id and the array assigns the lun
+array_assigned_lun = False
+
+
+def set_array_assigned_lun(is_enabled):
+    global array_assigned_lun
+    array_assigned_lun = is_enabled
 
 
 def is_warning_message(ex):
@@ -139,6 +157,13 @@ class SVCArrayMediator(ArrayMediatorAbstract):
         if self.client:
             self.client.close()
 
+    def is_connected(self):
+        if not (self.client and self.client.transport and self.client.transport.is_connected()):
+            return False
+        # the connected flag of the client is not cleared when the array closes the ssh session
+        ssh_transport = self.client.transport.transport.get_transport()
+        return bool(ssh_transport and ssh_transport.is_active())
+
     def _generate_volume_response(self, cli_volume):
         return Volume(
             int(cli_volume.capacity),
@@ -167,7 +192,9 @@ class SVCArrayMediator(ArrayMediatorAbstract):
         if not cli_volume:
             raise controller_errors.VolumeNotFoundError(volume_name)
         logger.debug("cli volume returned : {}".format(cli_volume))
-        return self._generate_volume_response(cli_volume)
+        array_vol = self._generate_volume_response(cli_volume)
+        get_volume_names_memo(self.endpoint)[array_vol.id] = array_vol.volume_name
+        return array_vol
 
     def get_volume_name(self, volume_id):
         # TODO: CSI-1024
@@ -198,6 +225,12 @@ class SVCArrayMediator(ArrayMediatorAbstract):
         return size_in_bytes
 
     def _get_vol_by_wwn(self, volume_id):
+        volume_names_memo = get_volume_names_memo(self.endpoint)
+        vol_name = volume_names_memo.get(volume_id)
+        if vol_name:
+            logger.debug("found volume name of the request : {0}".format(vol_name))
+            return vol_name
+
         filter_value = 'vdisk_UID=' + volume_id
         vol_by_wwn = self.client.svcinfo.lsvdisk(
             filtervalue=filter_value).as_single_element
@@ -206,9 +239,10 @@ class SVCArrayMediator(ArrayMediatorAbstract):
 
         vol_name = vol_by_wwn.name
         logger.debug("found volume name : {0}".format(vol_name))
+        volume_names_memo[volume_id] = vol_name
         return vol_name
 
-    def create_volume(self, name, size_in_bytes, capabilities, pool, volume_prefix=""):
+    def create_volume(self, name, size_in_bytes, capabilities, pool, volume_prefix="", raise_if_exists=False):
         logger.info("creating volume with name : {}. size : {} . in pool : {} "
                     "with capabilities : {}".format(name, size_in_bytes, pool,
                                                     capabilities))
@@ -217,7 +251,7 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             cli_kwargs = build_kwargs_from_capabilities(capabilities, pool,
                                                         name, size)
             self.client.svctask.mkvolume(**cli_kwargs)
-            vol = self.get_volume(name)
+            vol = self._get_created_volume(name, pool)
             logger.info("finished creating cli volume : {}".format(vol))
             return vol
         except (svc_errors.CommandExecutionError, CLIFailureError) as ex:
@@ -239,6 +273,18 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             logger.exception(ex)
             raise ex
 
+    def _get_created_volume(self, volume_name, pool):
+        # only the uid and the actual capacity are missing after the creation, so the concise view is enough
+        cli_volume = self.client.svcinfo.lsvdisk(bytes=True,
+                                                 filtervalue='name={}'.format(volume_name)).as_single_element
+        if not cli_volume:
+            raise controller_errors.VolumeNotFoundError(volume_name)
+        array_vol = Volume(int(cli_volume.capacity), cli_volume.vdisk_UID, volume_name, self.endpoint, pool,
+                           self.array_type)
+        get_volume_names_memo(self.endpoint)[array_vol.id] = array_vol.volume_name
+        return array_vol
+
+    @invalidate_volume_name_on_not_found
     def delete_volume(self, volume_id):
         logger.info("Deleting volume with id : {0}".format(volume_id))
         vol_name = self._get_vol_by_wwn(volume_id)
@@ -256,6 +302,7 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             logger.exception(ex)
             raise ex
 
+        get_volume_names_memo(self.endpoint).pop(volume_id, None)
         logger.info("Finished volume deletion. id : {0}".format(volume_id))
 
     def get_snapshot(self, snapshot_name):
@@ -268,17 +315,7 @@ class SVCArrayMediator(ArrayMediatorAbstract):
 
     def get_host_by_host_identifiers(self, initiators):
         logger.debug("Getting host name for initiators : {0}".format(initiators))
-        detailed_hosts_list = self._get_detailed_hosts_list()
-        iscsi_host, fc_host = None, None
-        for host in detailed_hosts_list:
-            if initiators.is_array_iscsi_iqns_match(host.iscsi_names):
-                iscsi_host = host.name
-                logger.debug("found iscsi iqn in list : {0} for host : "
-                             "{1}".format(initiators.iscsi_iqn, iscsi_host))
-            if initiators.is_array_wwns_match(host.wwns):
-                fc_host = host.name
-                logger.debug("found fc wwns in list : {0} for host : "
-                             "{1}".format(initiators.fc_wwns, fc_host))
+        iscsi_host, fc_host = self._find_host_names_by_initiators(initiators)
         if iscsi_host and fc_host:
             if iscsi_host == fc_host:
                 return fc_host, [config.ISCSI_CONNECTIVITY_TYPE,
@@ -295,14 +332,73 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             logger.debug("can not found host by using initiators: {0} ".format(initiators))
             raise controller_errors.HostNotFoundError(initiators)
 
+    def _find_host_names_by_initiators(self, initiators):
+        """
+        Find the hosts of the initiators in the array hosts index.
+        The index is built on first use, new array hosts are added to it when some of the initiators are not found,
+        and it is rebuilt when the found hosts do not hold the initiators anymore.
+        The found hosts are always re-queried or freshly listed, and no host found means that the index was just
+        rebuilt, so the index does not need to be invalidated when the hosts are not found or are ambiguous.
+
+        Returns:
+            iscsi_host : name of the host with the initiators iscsi iqn, or None
+            fc_host    : name of a host with one of the initiators fc wwns, or None
+        """
+        hosts_index = get_hosts_index(self.endpoint, self.user)
+        if not hosts_index.is_built:
+            hosts_index.build(self._get_detailed_hosts_list())
+            return hosts_index.find_host_names(initiators)
+
+        iscsi_host, fc_host = hosts_index.find_host_names(initiators)
+        # an initiator that is missing from the index may belong to a new host, even if the other one was found
+        if (initiators.iscsi_iqn and not iscsi_host) or (any(initiators.fc_wwns) and not fc_host):
+            logger.debug("initiators were not all found in hosts index, looking for new hosts")
+            self._add_new_hosts_to_index(hosts_index)
+            iscsi_host, fc_host = hosts_index.find_host_names(initiators)
+        if (iscsi_host or fc_host) and self._are_indexed_hosts_valid(hosts_index, initiators, iscsi_host, fc_host):
+            # the found hosts were refreshed in the index, so they may hold more of the initiators now
+            return hosts_index.find_host_names(initiators)
+
+        # the initiators may have moved between hosts or have been added to an existing host
+        logger.debug("hosts index is stale, rebuilding it")
+        hosts_index.build(self._get_detailed_hosts_list())
+        return hosts_index.find_host_names(initiators)
+
+    def _add_new_hosts_to_index(self, hosts_index):
+        host_ids = set(host.get(HOST_ID_PARAM) for host in self.client.svcinfo.lshost())
+        indexed_host_ids = hosts_index.get_host_ids()
+        hosts_index.remove(indexed_host_ids - host_ids)
+        new_host_ids = host_ids - indexed_host_ids
+        if new_host_ids:
+            logger.debug("adding {0} new hosts to hosts index".format(len(new_host_ids)))
+            hosts_index.update(self._get_detailed_hosts_by_ids(new_host_ids))
+
+    def _are_indexed_hosts_valid(self, hosts_index, initiators, iscsi_host, fc_host):
+        """
+        Re-query only the hosts found in the index, to verify that they still hold the initiators.
+        """
+        host_names = set(host_name for host_name in (iscsi_host, fc_host) if host_name)
+        host_ids = [hosts_index.get_host_id(host_name) for host_name in host_names]
+        hosts_by_name = {host.name: host for host in self._get_detailed_hosts_by_ids(host_ids)}
+        if iscsi_host and not (iscsi_host in hosts_by_name and
+                               initiators.is_array_iscsi_iqns_match(hosts_by_name[iscsi_host].iscsi_names)):
+            return False
+        if fc_host and not (fc_host in hosts_by_name and initiators.is_array_wwns_match(hosts_by_name[fc_host].wwns)):
+            return False
+        hosts_index.update(hosts_by_name.values())
+        return True
+
     def _get_detailed_hosts_list(self):
         logger.debug("Getting detailed hosts list on array {0}".format(self.endpoint))
         hosts_list = self.client.svcinfo.lshost()
         if not hosts_list:
             return []
 
+        return self._get_detailed_hosts_by_ids([host.get(HOST_ID_PARAM) for host in hosts_list])
+
+    def _get_detailed_hosts_by_ids(self, host_ids):
         # get all hosts details by sending a single batch of commands, in which each command is per host
-        detailed_hosts_list_cmd = self._get_detailed_hosts_list_cmd(hosts_list)
+        detailed_hosts_list_cmd = self._get_detailed_hosts_list_cmd(host_ids)
         logger.debug("Sending getting detailed hosts list commands batch")
         detailed_hosts_list_output, detailed_hosts_list_errors = self._send_raw_cli_command(detailed_hosts_list_cmd)
         if detailed_hosts_list_errors:
@@ -312,7 +408,7 @@ class SVCArrayMediator(ArrayMediatorAbstract):
 
     def _get_detailed_hosts_by_raw_output(self, detailed_hosts_list_raw_output):
         logger.debug("Reading detailed hosts list commands batch response")
-        hosts_reader = SVCListResultsReader(detailed_hosts_list_raw_output)
+        hosts_reader = SVCListResultsReader(detailed_hosts_list_raw_output, fields=HOST_DETAILS_PARAMS)
         res = []
         for host_details in hosts_reader:
             host_id = host_details.get(HOST_ID_PARAM)
@@ -323,25 +419,29 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             res.append(host)
         return res
 
-    def _get_detailed_hosts_list_cmd(self, host_list):
+    def _get_detailed_hosts_list_cmd(self, host_ids):
         writer = StringIO()
-        for host in host_list:
-            host_id = host.get(HOST_ID_PARAM)
+        for host_id in host_ids:
             writer.write(LIST_HOSTS_CMD_FORMAT.format(HOST_ID=host_id))
         return writer.getvalue()
 
     def _send_raw_cli_command(self, cmd):
+        """
+        Returns:
+            the command output as bytes, to be streamed by SVCListResultsReader without decoding it at once,
+            and the command errors as a truncated string
+        """
         output_as_bytes, errors_as_bytes = self.client.send_raw_command(cmd)
-        output_as_str = bytes_to_string(output_as_bytes)
         errors_as_str = bytes_to_string(errors_as_bytes)
         formatted_errors_as_str = self._truncate_error_msg(errors_as_str)
-        return output_as_str, formatted_errors_as_str
+        return output_as_bytes, formatted_errors_as_str
 
     def _truncate_error_msg(self, detailed_host_list_errors):
         if len(detailed_host_list_errors) <= HOSTS_LIST_ERR_MSG_MAX_LENGTH:
             return detailed_host_list_errors
         return "{0} ...".format(detailed_host_list_errors[HOSTS_LIST_ERR_MSG_MAX_LENGTH])
 
+    @invalidate_volume_name_on_not_found
     def get_volume_mappings(self, volume_id):
         logger.debug("Getting volume mappings for volume id : "
                      "{0}".format(volume_id))
@@ -373,38 +473,43 @@ class SVCArrayMediator(ArrayMediatorAbstract):
 
         return luns_in_use
 
+    def _get_lun_allocator(self, host_name):
+        return get_lun_allocator(self.endpoint, host_name, self.MIN_LUN_NUMBER, self.MAX_LUN_NUMBER)
+
     def get_first_free_lun(self, host_name):
         logger.debug("getting first free lun id for "
                      "host :{0}".format(host_name))
-        lun = None
-        luns_in_use = self._get_used_lun_ids_from_host(host_name)
         # Today we have SS_MAX_HLUN_MAPPINGS_PER_HOST as 2048 on high end
         # platforms (SVC / V7000 etc.) and 512 for the lower
         # end platforms (V3500 etc.). This limits the number of volumes that
         # can be mapped to a single host. (Note that some hosts such as linux
         # do not support more than 255 or 511 mappings today irrespective of
         # our constraint).
-        for candidate in range(self.MIN_LUN_NUMBER, self.MAX_LUN_NUMBER + 1):
-            if str(candidate) not in luns_in_use:
-                logger.debug("First available LUN number for {0} is "
-                             "{1}".format(host_name, str(candidate)))
-                lun = str(candidate)
-                break
-        if not lun:
+        lun = self._get_lun_allocator(host_name).reserve(lambda: self._get_used_lun_ids_from_host(host_name))
+        if lun is None:
             raise controller_errors.NoAvailableLunError(host_name)
         logger.debug("The first available lun is : {0}".format(lun))
-        return lun
+        return str(lun)
 
+    @invalidate_volume_name_on_not_found
     def map_volume(self, volume_id, host_name):
         logger.debug("mapping volume : {0} to host : "
                      "{1}".format(volume_id, host_name))
         vol_name = self._get_vol_by_wwn(volume_id)
+
+        if array_assigned_lun:
+            return self._map_volume_with_array_assigned_lun(volume_id, vol_name, host_name)
+        return self._map_volume_with_free_lun(vol_name, host_name)
+
+    def _map_volume_with_free_lun(self, vol_name, host_name):
         cli_kwargs = {
             'host': host_name,
             'object_id': vol_name,
             'force': True
         }
 
+        lun_allocator = self._get_lun_allocator(host_name)
+        lun = None
         try:
             lun = self.get_first_free_lun(host_name)
             cli_kwargs.update({'scsi': lun})
@@ -413,20 +518,176 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             if not is_warning_message(ex.my_message):
                 logger.error(msg="Map volume {0} to host {1} failed. Reason "
                                  "is: {2}".format(vol_name, host_name, ex))
+                if lun is not None:
+                    lun_allocator.release(int(lun))
                 if NAME_NOT_MEET in ex.my_message:
                     raise controller_errors.HostNotFoundError(host_name)
                 if SPECIFIED_OBJ_NOT_EXIST in ex.my_message:
                     raise controller_errors.VolumeNotFoundError(vol_name)
                 if VOL_ALREADY_MAPPED in ex.my_message:
+                    # the used luns are reloaded from the array before the retry
+                    lun_allocator.invalidate()
                     raise controller_errors.LunAlreadyInUseError(lun,
                                                                  host_name)
                 raise controller_errors.MappingError(vol_name, host_name, ex)
         except Exception as ex:
             logger.exception(ex)
+            if lun is not None:
+                lun_allocator.release(int(lun))
             raise ex
 
+        lun_allocator.confirm(int(lun), vol_name)
         return str(lun)
 
+    def _map_volumes(self, vol_ids, host_name):
+        """
+        Map the volumes to the host with a single raw command batch, each volume with a lun reserved in advance.
+        The volumes whose mapping was not reported as created are mapped separately, to get their specific errors.
+        When the array assigns the luns, the volumes are mapped one by one.
+
+        Returns:
+            (lun, exception) pair per volume
+        """
+        if array_assigned_lun or len(vol_ids) <= 1:
+            return super()._map_volumes(vol_ids, host_name)
+
+        results = [None] * len(vol_ids)
+        reserved_mappings = []
+        lun_allocator = self._get_lun_allocator(host_name)
+        try:
+            for index, vol_id in enumerate(vol_ids):
+                try:
+                    vol_name = self._get_vol_by_wwn(vol_id)
+                    reserved_mappings.append((index, vol_name, self.get_first_free_lun(host_name)))
+                except controller_errors.BaseArrayActionException as ex:
+                    if isinstance(ex, controller_errors.VolumeNotFoundError):
+                        get_volume_names_memo(self.endpoint).pop(vol_id, None)
+                    results[index] = (None, ex)
+            if not reserved_mappings:
+                return results
+
+            cmd = "".join(MAP_VOLUME_CMD_FORMAT.format(HOST_NAME=host_name, LUN=lun, VOLUME_NAME=vol_name)
+                          for _, vol_name, lun in reserved_mappings)
+            output, errors = self._send_raw_cli_command(cmd)
+        except Exception:
+            for _, _, lun in reserved_mappings:
+                lun_allocator.release(int(lun))
+            raise
+        if errors:
+            logger.warning("Errors returned from the map volumes batch to host {0}: {1}".format(host_name, errors))
+
+        created_luns = set(MAPPING_RESULT_LUN_PATTERN.findall(bytes_to_string(output)))
+        failed_indexes = []
+        for index, vol_name, lun in reserved_mappings:
+            if lun in created_luns:
+                lun_allocator.confirm(int(lun), vol_name)
+                results[index] = (lun, None)
+            else:
+                lun_allocator.release(int(lun))
+                failed_indexes.append(index)
+        failed_results = super()._map_volumes([vol_ids[index] for index in failed_indexes], host_name)
+        for index, result in zip(failed_indexes, failed_results):
+            results[index] = result
+        return results
+
+    def _map_volume_with_array_assigned_lun(self, volume_id, vol_name, host_name):
+        cli_kwargs = {
+            'host': host_name,
+            'object_id': vol_name,
+            'force': True
+        }
+        try:
+            mapping_result = self.client.svctask.mkvdiskhostmap(**cli_kwargs)
+        except (svc_errors.CommandExecutionError, CLIFailureError) as ex:
+            if is_warning_message(ex.my_message) or VOL_ALREADY_MAPPED in ex.my_message:
+                # the lun of the existing mapping is read from the volume mappings
+                mapping_result = None
+            else:
+                logger.error(msg="Map volume {0} to host {1} failed. Reason "
+                                 "is: {2}".format(vol_name, host_name, ex))
+                if NAME_NOT_MEET in ex.my_message:
+                    raise controller_errors.HostNotFoundError(host_name)
+                if SPECIFIED_OBJ_NOT_EXIST in ex.my_message:
+                    raise controller_errors.VolumeNotFoundError(vol_name)
+                raise controller_errors.MappingError(vol_name, host_name, ex)
+        except Exception as ex:
+            logger.exception(ex)
+            raise ex
+
+        lun = self._get_lun_from_mapping_result(mapping_result)
+        if lun is None:
+            logger.debug("lun was not found in the mapping result, getting it from the volume mappings")
+            lun = self.get_volume_mappings(volume_id).get(host_name)
+            if lun is None:
+                raise controller_errors.MappingError(vol_name, host_name, "lun of the mapping was not found")
+        logger.debug("the array assigned lun : {0}".format(lun))
+        return str(lun)
+
+    def _get_lun_from_mapping_result(self, mapping_result):
+        raw_result = getattr(mapping_result, "response", None)
+        if isinstance(raw_result, tuple):
+            raw_result = raw_result[0]
+        if isinstance(raw_result, bytes):
+            raw_result = bytes_to_string(raw_result)
+        if not isinstance(raw_result, str):
+            return None
+        match = MAPPING_RESULT_LUN_PATTERN.search(raw_result)
+        return match.group(1) if match else None
+
+    def _unmap_volumes(self, vol_ids, host_name):
+        """
+        Unmap the volumes from the host with a single raw command batch.
+        The volumes which are still mapped to the host after the batch are unmapped separately, to get their specific
+        errors.
+
+        Returns:
+            (None, exception) pair per volume
+        """
+        if len(vol_ids) <= 1:
+            return super()._unmap_volumes(vol_ids, host_name)
+
+        results = [None] * len(vol_ids)
+        vol_names_by_index = {}
+        for index, vol_id in enumerate(vol_ids):
+            try:
+                vol_names_by_index[index] = self._get_vol_by_wwn(vol_id)
+            except controller_errors.VolumeNotFoundError as ex:
+                get_volume_names_memo(self.endpoint).pop(vol_id, None)
+                results[index] = (None, ex)
+        if not vol_names_by_index:
+            return results
+
+        cmd = "".join(UNMAP_VOLUME_CMD_FORMAT.format(HOST_NAME=host_name, VOLUME_NAME=vol_name)
+                      for vol_name in vol_names_by_index.values())
+        _, errors = self._send_raw_cli_command(cmd)
+        mapped_vol_names = set()
+        if errors:
+            logger.warning("Errors returned from the unmap volumes batch from host {0}: {1}".format(host_name, errors))
+            mapped_vol_names = self._get_mapped_vol_names_from_host(host_name)
+
+        lun_allocator = self._get_lun_allocator(host_name)
+        for index, vol_name in vol_names_by_index.items():
+            if vol_name in mapped_vol_names:
+                results[index] = self._unmap_volume_separately(vol_ids[index], host_name)
+            else:
+                lun_allocator.release_volume(vol_name)
+                results[index] = (None, None)
+        return results
+
+    def _get_mapped_vol_names_from_host(self, host_name):
+        try:
+            return {mapping.get('vdisk_name', '') for mapping in self.client.svcinfo.lshostvdiskmap(host=host_name)}
+        except (svc_errors.CommandExecutionError, CLIFailureError) as ex:
+            logger.error(ex)
+            raise controller_errors.HostNotFoundError(host_name)
+
+    def _unmap_volume_separately(self, vol_id, host_name):
+        try:
+            return self.unmap_volume(vol_id, host_name), None
+        except Exception as ex:
+            return None, ex
+
+    @invalidate_volume_name_on_not_found
     def unmap_volume(self, volume_id, host_name):
         logger.debug("un-mapping volume : {0} from host : "
                      "{1}".format(volume_id, host_name))
@@ -448,6 +709,7 @@ class SVCArrayMediator(ArrayMediatorAbstract):
                 if OBJ_NOT_FOUND in ex.my_message:
                     raise controller_errors.VolumeNotFoundError(vol_name)
                 if VOL_ALREADY_UNMAPPED in ex.my_message:
+                    self._get_lun_allocator(host_name).release_volume(vol_name)
                     raise controller_errors.VolumeAlreadyUnmappedError(
                         vol_name)
                 raise controller_errors.UnMappingError(vol_name,
@@ -456,6 +718,8 @@ class SVCArrayMediator(ArrayMediatorAbstract):
             logger.exception(ex)
             raise ex
 
+        self._get_lun_allocator(host_name).release_volume(vol_name)
+
     def _get_array_iqns_by_node_id(self):
         logger.debug("Getting array nodes id and iscsi name")
         try:
@@ -1,5 +1,3 @@
-from random import randint
-
 from pyxcli import errors as xcli_errors
 from pyxcli.client import XCLIClient
 
@@ -7,7 +5,10 @@ import controller.array_action.errors as controller_errors
 from controller.array_action.array_action_types import Volume, Snapshot
 from controller.array_action.array_mediator_abstract import ArrayMediatorAbstract
 from controller.array_action.config import FC_CONNECTIVITY_TYPE, ISCSI_CONNECTIVITY_TYPE
+from controller.array_action.lun_allocator import get_lun_allocator
 from controller.array_action.utils import classproperty
+from controller.array_action.volume_names_memo import get_volume_names_memo, \
+    invalidate_volume_name_on_not_found
 from controller.common.csi_logger import get_stdout_logger
 from controller.common.utils import string_to_array
 
@@ -84,6 +85,9 @@ class XIVArrayMediator(ArrayMediatorAbstract):
         if self.client and self.client.is_connected():
             self.client.close()
 
+    def is_connected(self):
+        return bool(self.client and self.client.is_connected())
+
     def _convert_size_blocks_to_bytes(self, size_in_blocks):
         return int(size_in_blocks) * self.BLOCK_SIZE_IN_BYTES
 
@@ -117,6 +121,7 @@ class XIVArrayMediator(ArrayMediatorAbstract):
             raise controller_errors.VolumeNotFoundError(volume_name)
 
         array_vol = self._generate_volume_response(cli_volume)
+        get_volume_names_memo(self.endpoint)[array_vol.id] = array_vol.volume_name
         return array_vol
 
     def get_volume_name(self, volume_id):
@@ -134,7 +139,7 @@ class XIVArrayMediator(ArrayMediatorAbstract):
         """:rtype: float"""
         return float(size_in_bytes) / self.BLOCK_SIZE_IN_BYTES
 
-    def create_volume(self, name, size_in_bytes, capabilities, pool, volume_prefix=""):
+    def create_volume(self, name, size_in_bytes, capabilities, pool, volume_prefix="", raise_if_exists=False):
         logger.info("creating volume with name : {}. size : {} . in pool : {} with capabilities : {}".format(
             name, size_in_bytes, pool, capabilities))
 
@@ -144,7 +149,9 @@ class XIVArrayMediator(ArrayMediatorAbstract):
             cli_volume = self.client.cmd.vol_create(vol=name, size_blocks=size_in_blocks,
                                                     pool=pool).as_single_element
             logger.info("finished creating cli volume : {}".format(cli_volume))
-            return self._generate_volume_response(cli_volume)
+            array_vol = self._generate_volume_response(cli_volume)
+            get_volume_names_memo(self.endpoint)[array_vol.id] = array_vol.volume_name
+            return array_vol
         except xcli_errors.IllegalNameForObjectError as ex:
             logger.exception(ex)
             raise controller_errors.IllegalObjectName(ex.status)
@@ -159,14 +166,22 @@ class XIVArrayMediator(ArrayMediatorAbstract):
             raise controller_errors.PermissionDeniedError("create vol : {0}".format(name))
 
     def _get_vol_by_wwn(self, volume_id):
+        volume_names_memo = get_volume_names_memo(self.endpoint)
+        vol_name = volume_names_memo.get(volume_id)
+        if vol_name:
+            logger.debug("found volume name of the request : {0}".format(vol_name))
+            return vol_name
+
         vol_by_wwn = self.client.cmd.vol_list(wwn=volume_id).as_single_element
         if not vol_by_wwn:
             raise controller_errors.VolumeNotFoundError(volume_id)
 
         vol_name = vol_by_wwn.name
         logger.debug("found volume name : {0}".format(vol_name))
+        volume_names_memo[volume_id] = vol_name
         return vol_name
 
+    @invalidate_volume_name_on_not_found
     def delete_volume(self, volume_id):
         logger.info("Deleting volume with id : {0}".format(volume_id))
         vol_name = self._get_vol_by_wwn(volume_id)
@@ -181,6 +196,7 @@ class XIVArrayMediator(ArrayMediatorAbstract):
             logger.exception(ex)
             raise controller_errors.PermissionDeniedError("delete vol : {0}".format(vol_name))
 
+        get_volume_names_memo(self.endpoint).pop(volume_id, None)
         logger.info("Finished volume deletion. id : {0}".format(volume_id))
 
     def get_snapshot(self, snapshot_name):
@@ -242,6 +258,7 @@ class XIVArrayMediator(ArrayMediatorAbstract):
             raise controller_errors.MultipleHostsFoundError(initiators, matching_hosts)
         return matching_hosts[0], port_types
 
+    @invalidate_volume_name_on_not_found
     def get_volume_mappings(self, volume_id):
         logger.debug("Getting volume mappings for volume id : {0}".format(volume_id))
         vol_name = self._get_vol_by_wwn(volume_id)
@@ -254,7 +271,7 @@ class XIVArrayMediator(ArrayMediatorAbstract):
 
         return res
 
-    def _get_next_available_lun(self, host_name):
+    def _get_used_luns(self, host_name):
         logger.debug("getting host mapping list for host :{0}".format(host_name))
         try:
             host_mapping_list = self.client.cmd.mapping_list(host=host_name).as_list
@@ -264,23 +281,37 @@ class XIVArrayMediator(ArrayMediatorAbstract):
 
         luns_in_use = set([host_mapping.lun for host_mapping in host_mapping_list])
         logger.debug("luns in use : {0}".format(luns_in_use))
+        return luns_in_use
 
-        # try to use random lun number just in case there are many calls at the same time to reduce re-tries
-        all_available_luns = [i for i in range(self.MIN_LUN_NUMBER, self.MAX_LUN_NUMBER + 1) if i not in luns_in_use]
+    def _get_lun_allocator(self, host_name):
+        return get_lun_allocator(self.endpoint, host_name, self.MIN_LUN_NUMBER, self.MAX_LUN_NUMBER)
 
-        if len(all_available_luns) == 0:
+    def _get_next_available_lun(self, host_name):
+        # the lun is reserved, so concurrent mappings to the host get different luns
+        lun = self._get_lun_allocator(host_name).reserve(lambda: self._get_used_luns(host_name))
+        if lun is None:
             raise controller_errors.NoAvailableLunError(host_name)
 
-        index = randint(0, len(all_available_luns) - 1)
-        lun = all_available_luns[index]
-        logger.debug("next random available lun is : {0}".format(lun))
+        logger.debug("next available lun is : {0}".format(lun))
         return lun
 
+    @invalidate_volume_name_on_not_found
     def map_volume(self, volume_id, host_name):
         logger.debug("mapping volume : {0} to host : {1}".format(volume_id, host_name))
         vol_name = self._get_vol_by_wwn(volume_id)
+        lun_allocator = self._get_lun_allocator(host_name)
         lun = self._get_next_available_lun(host_name)
 
+        try:
+            self._map_vol(volume_id, vol_name, host_name, lun)
+        except Exception:
+            lun_allocator.release(lun)
+            raise
+
+        lun_allocator.confirm(lun, vol_name)
+        return str(lun)
+
+    def _map_vol(self, volume_id, vol_name, host_name, lun):
         try:
             self.client.cmd.map_vol(host=host_name, vol=vol_name, lun=lun)
         except xcli_errors.OperationForbiddenForUserCategoryError as ex:
@@ -295,12 +326,13 @@ class XIVArrayMediator(ArrayMediatorAbstract):
         except xcli_errors.CommandFailedRuntimeError as ex:
             logger.exception(ex)
             if "LUN is already in use" in ex.status:
+                # the used luns are reloaded from the array before the retry
+                self._get_lun_allocator(host_name).invalidate()
                 raise controller_errors.LunAlreadyInUseError(lun, host_name)
             else:
                 raise controller_errors.MappingError(vol_name, host_name, ex)
 
-        return str(lun)
-
+    @invalidate_volume_name_on_not_found
     def unmap_volume(self, volume_id, host_name):
         logger.debug("un-mapping volume : {0} from host : {1}".format(volume_id, host_name))
 
@@ -321,10 +353,13 @@ class XIVArrayMediator(ArrayMediatorAbstract):
         except xcli_errors.CommandFailedRuntimeError as ex:
             logger.exception(ex)
             if "The requested mapping is not defined" in ex.status:
+                self._get_lun_allocator(host_name).release_volume(vol_name)
                 raise controller_errors.VolumeAlreadyUnmappedError(vol_name)
             else:
                 raise controller_errors.UnMappingError(vol_name, host_name, ex)
 
+        self._get_lun_allocator(host_name).release_volume(vol_name)
+
     def _get_iscsi_targets(self):
         ip_interfaces = self.client.cmd.ipinterface_list()
         iscsi_interfaces = (i for i in ip_interfaces if i.type == "iSCSI")
@@ -8,3 +8,38 @@ CAPABILITY_THICK = 'thick'
 
 # volume context
 CONTEXT_POOL = "pool"
+
+# array connection pool
+CONNECTION_POOL_IDLE_TTL_IN_SECONDS = 5 * 60
+CONNECTION_WAIT_TIMEOUT_IN_SECONDS = 10
+CONNECTION_WAIT_POLL_INTERVAL_IN_SECONDS = 0.5
+# max number of requests waiting for a connection to an array, per connection of the array max_connections,
+# 0 for no limit
+CONNECTION_WAITERS_PER_CONNECTION = 5
+
+# detected array type per endpoint key, a failed detection is cached for a shorter time
+ARRAY_TYPE_CACHE_TTL_IN_SECONDS = 60 * 60
+ARRAY_TYPE_NEGATIVE_CACHE_TTL_IN_SECONDS = 30
+
+# locks of the operations on the same volume or host
+OBJECT_LOCK_STRIPES_COUNT = 1024
+OBJECT_LOCK_TIMEOUT_IN_SECONDS = 30
+
+# the used luns of a host are reloaded from the array after this interval, to find the luns unmapped by others
+LUN_ALLOCATOR_RELOAD_INTERVAL_IN_SECONDS = 10 * 60
+
+# max number of requests to the same host which are sent to the array in a single batch
+MAX_BATCH_SIZE = 50
+
+# a volume which is not found in the ds8k mappings index is re-checked against the array after this interval
+DS8K_MAPPINGS_INDEX_REFRESH_INTERVAL_IN_SECONDS = 60
+
+# a volume name which is not found in the ds8k pool volumes index is re-checked against the array after this interval
+DS8K_VOLUME_NAMES_INDEX_REFRESH_INTERVAL_IN_SECONDS = 60
+
+# ds8k host name by fc wwpn, per array
+DS8K_HOSTS_CACHE_TTL_IN_SECONDS = 5 * 60
+
+# ds8k system info per array, it is refreshed in the background after the refresh interval
+DS8K_SYSTEM_INFO_CACHE_TTL_IN_SECONDS = 24 * 60 * 60
+DS8K_SYSTEM_INFO_REFRESH_INTERVAL_IN_SECONDS = 60 * 60
@@ -0,0 +1,24 @@
+from threading import Lock
+
+from controller.array_action.config import DS8K_HOSTS_CACHE_TTL_IN_SECONDS
+from controller.common.ttl_cache import TTLCache
+
+# host name by lower-cased fc wwpn, per (array service address, user)
+hosts_caches_dict = {}
+_hosts_caches_dict_lock = Lock()
+
+
+def get_hosts_cache(service_address, user):
+    """
+    Args:
+        service_address : DS8K array address
+        user            : user name used to connect to the array
+
+    Returns:
+        TTLCache of the host names by lower-cased fc wwpn, shared between the connections to the array
+    """
+    key = (service_address, user)
+    with _hosts_caches_dict_lock:
+        if key not in hosts_caches_dict:
+            hosts_caches_dict[key] = TTLCache(DS8K_HOSTS_CACHE_TTL_IN_SECONDS)
+        return hosts_caches_dict[key]
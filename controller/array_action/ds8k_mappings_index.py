@@ -0,0 +1,101 @@
+from threading import Lock
+from time import time
+
+from controller.array_action.config import DS8K_MAPPINGS_INDEX_REFRESH_INTERVAL_IN_SECONDS
+from controller.array_action.ds8k_rest_client import scsilun_to_int
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+# mappings index per (array service address, user)
+mappings_index_dict = {}
+_mappings_index_dict_lock = Lock()
+
+
+def get_mappings_index(service_address, user):
+    """
+    Args:
+        service_address : DS8K array address
+        user            : user name used to connect to the array
+
+    Returns:
+        the shared DS8KMappingsIndex of the array
+    """
+    with _mappings_index_dict_lock:
+        key = (service_address, user)
+        if key not in mappings_index_dict:
+            mappings_index_dict[key] = DS8KMappingsIndex()
+        return mappings_index_dict[key]
+
+
+class DS8KMappingsIndex:
+    """
+    Index of the host mappings by array volume id, built from a single hosts listing and updated by the mappings done
+    through it, so that getting the mappings of a volume does not go over the mappings of all the array hosts.
+    A volume which is not in the index is re-checked against the array when the index is stale, and the index is
+    rebuilt after a mapping conflict.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # host name to lun, by array volume id, None until built
+        self._mappings_by_volume_id = None
+        self._build_time = None
+
+    def get_mappings(self, volume_id, get_hosts):
+        """
+        Args:
+            volume_id : array volume id
+            get_hosts : function that returns all the array hosts with their mappings briefs, it is called to build
+                        the index when it is not built, or when the volume is not found in a stale index
+
+        Returns:
+            dict of host name to lun of the volume mappings
+        """
+        with self._lock:
+            if self._mappings_by_volume_id is None or \
+                    (volume_id not in self._mappings_by_volume_id and self._is_stale()):
+                self._build(get_hosts())
+            return dict(self._mappings_by_volume_id.get(volume_id, {}))
+
+    def add(self, volume_id, host_name, lun):
+        with self._lock:
+            if self._mappings_by_volume_id is not None:
+                self._mappings_by_volume_id.setdefault(volume_id, {})[host_name] = lun
+
+    def remove(self, volume_id, host_name=None):
+        """
+        Args:
+            volume_id : array volume id
+            host_name : host the volume was unmapped from, or None if the volume was deleted
+        """
+        with self._lock:
+            if self._mappings_by_volume_id is None:
+                return
+            if host_name is None:
+                self._mappings_by_volume_id.pop(volume_id, None)
+                return
+            host_name_to_lun = self._mappings_by_volume_id.get(volume_id, {})
+            host_name_to_lun.pop(host_name, None)
+            if not host_name_to_lun:
+                self._mappings_by_volume_id.pop(volume_id, None)
+
+    def invalidate(self):
+        """
+        The index does not match the array, it will be rebuilt on the next lookup.
+        """
+        with self._lock:
+            self._mappings_by_volume_id = None
+
+    def _build(self, hosts):
+        mappings_by_volume_id = {}
+        for host in hosts:
+            for mapping in host.mappings_briefs:
+                mappings_by_volume_id.setdefault(mapping["volume_id"], {})[host.name] = \
+                    scsilun_to_int(mapping["lunid"])
+        self._mappings_by_volume_id = mappings_by_volume_id
+        self._build_time = time()
+        logger.debug("mappings index was built with {0} mapped volumes".format(len(mappings_by_volume_id)))
+
+    def _is_stale(self):
+        return time() - self._build_time > DS8K_MAPPINGS_INDEX_REFRESH_INTERVAL_IN_SECONDS
@@ -1,9 +1,53 @@
+from hashlib import sha256
+from threading import Lock
+
 from pyds8k.client.ds8k.v1.client import Client
 from pyds8k.exceptions import NotFound
+from requests.adapters import HTTPAdapter
 from controller.common.csi_logger import get_stdout_logger
 
 logger = get_stdout_logger()
 
+# (credentials hash, rest client) per (service address, user), the client is shared so that its http connections and
+# auth token are reused
+rest_clients_dict = {}
+_rest_clients_dict_lock = Lock()
+
+
+def get_rest_client(service_address, user, password, max_connections):
+    """
+    Args:
+        service_address : DS8K array address
+        user            : user name used to connect to the array
+        password        : password of the user, a new password replaces the shared client once it is authenticated
+        max_connections : max number of http connections kept open to the array
+
+    Returns:
+        the shared RESTClient of the user
+    """
+    key = (service_address, user)
+    credentials_hash = _hash_credentials(user, password)
+    with _rest_clients_dict_lock:
+        shared_credentials_hash, rest_client = rest_clients_dict.get(key, (None, None))
+    if shared_credentials_hash == credentials_hash:
+        return rest_client
+
+    rest_client = RESTClient(service_address=service_address,
+                             user=user,
+                             password=password,
+                             max_connections=max_connections,
+                             )
+    # the credentials are validated before the client is shared, so that a wrong password does not replace it,
+    # its requests re-authenticate on their own
+    rest_client.authenticate()
+    with _rest_clients_dict_lock:
+        rest_clients_dict[key] = (credentials_hash, rest_client)
+    return rest_client
+
+
+def _hash_credentials(user, password):
+    return sha256("{0}:{1}".format(user, password).encode()).hexdigest()
+
 
 def _int_lunid_to_hex(lunid):
     return '{0:0{1}x}'.format(int(lunid), 2)
@@ -60,6 +104,7 @@ class RESTClient(object):
     def __init__(self, service_address, user, password,
                  port=None,
                  hostname='',
+                 max_connections=None,
                  ):
         self.user = user
 
@@ -73,6 +118,15 @@ class RESTClient(object):
             client_kwargs.update({'hostname': hostname})
 
         self._client = Client(**client_kwargs)
+        if max_connections:
+            # the connections are kept alive between the requests, up to the array max connections
+            adapter = HTTPAdapter(pool_maxsize=max_connections)
+            self._client.client.session.mount('https://', adapter)
+            self._client.client.session.mount('http://', adapter)
+
+    def authenticate(self):
+        http_client = self._client.client
+        http_client.authenticate.authenticate(http_client)
 
     def get_system(self):
         return self._client.get_systems()[0]
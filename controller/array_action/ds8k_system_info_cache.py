@@ -0,0 +1,81 @@
+from threading import Lock, Thread
+from time import time
+
+from controller.array_action.config import DS8K_SYSTEM_INFO_CACHE_TTL_IN_SECONDS, \
+    DS8K_SYSTEM_INFO_REFRESH_INTERVAL_IN_SECONDS
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+# system info cache per array service address
+system_info_caches_dict = {}
+_system_info_caches_dict_lock = Lock()
+
+
+def get_system_info_cache(service_address):
+    """
+    Args:
+        service_address : DS8K array address
+
+    Returns:
+        the shared DS8KSystemInfoCache of the array
+    """
+    with _system_info_caches_dict_lock:
+        if service_address not in system_info_caches_dict:
+            system_info_caches_dict[service_address] = DS8KSystemInfoCache()
+        return system_info_caches_dict[service_address]
+
+
+class DS8KSystemInfoCache:
+    """
+    System info of an array (e.g. its bundle and wwnn), shared between the connections to the array so that
+    connecting to it does not get the system info again. The info is refreshed in the background once it is older
+    than the refresh interval, and is got again from the array by the connecting thread once it expires.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._system_info = None
+        self._load_time = None
+        self._is_refreshing = False
+
+    def get(self, get_system_info):
+        """
+        Args:
+            get_system_info : function that gets the system info from the array
+
+        Returns:
+            the system info
+        """
+        with self._lock:
+            system_info = self._system_info
+            age = None if system_info is None else time() - self._load_time
+            is_valid = age is not None and age <= DS8K_SYSTEM_INFO_CACHE_TTL_IN_SECONDS
+            should_refresh = is_valid and age > DS8K_SYSTEM_INFO_REFRESH_INTERVAL_IN_SECONDS and \
+                not self._is_refreshing
+            if should_refresh:
+                self._is_refreshing = True
+
+        if is_valid:
+            if should_refresh:
+                Thread(target=self._refresh, args=(get_system_info,), daemon=True).start()
+            return system_info
+
+        system_info = get_system_info()
+        self._set(system_info)
+        return system_info
+
+    def _refresh(self, get_system_info):
+        try:
+            self._set(get_system_info())
+            logger.debug("system info was refreshed")
+        except Exception as ex:
+            logger.warning("Failed to refresh the system info, reason is: {0}".format(ex))
+        finally:
+            with self._lock:
+                self._is_refreshing = False
+
+    def _set(self, system_info):
+        with self._lock:
+            self._system_info = system_info
+            self._load_time = time()
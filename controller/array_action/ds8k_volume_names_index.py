@@ -0,0 +1,105 @@
+from threading import Lock
+from time import time
+
+from controller.array_action.config import DS8K_VOLUME_NAMES_INDEX_REFRESH_INTERVAL_IN_SECONDS
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+# volume names index per (array service address, user)
+volume_names_index_dict = {}
+_volume_names_index_dict_lock = Lock()
+
+
+def get_volume_names_index(service_address, user):
+    """
+    Args:
+        service_address : DS8K array address
+        user            : user name used to connect to the array
+
+    Returns:
+        the shared DS8KVolumeNamesIndex of the array
+    """
+    with _volume_names_index_dict_lock:
+        key = (service_address, user)
+        if key not in volume_names_index_dict:
+            volume_names_index_dict[key] = DS8KVolumeNamesIndex()
+        return volume_names_index_dict[key]
+
+
+class DS8KVolumeNamesIndex:
+    """
+    Index of the array volume ids by pool and volume name, built from a single listing of the pool volumes and updated
+    by the volumes created and deleted through it, so that finding a volume by its name does not list the whole pool.
+    A name which is not in the index is re-checked against the array when the pool index is stale, or when a volume
+    creation in the pool failed, since the array may have created the volume anyway.
+    The volume names are not unique in DS8K, so the index keeps the first volume listed with each name.
+    The pool ids are case insensitive, so the pools are indexed by their upper case id.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # volume id by volume name, per pool id
+        self._volume_ids_by_pool = {}
+        self._build_times_by_pool = {}
+        # (pool id, volume name) by volume id
+        self._keys_by_volume_id = {}
+
+    def get_volume_id(self, pool_id, volume_name, get_pool_volumes):
+        """
+        Args:
+            pool_id          : id of the pool of the volume
+            volume_name      : name of the volume on the array (after shortening)
+            get_pool_volumes : function that returns all the pool volumes, it is called to build the pool index when
+                               it is not built, or when the name is not found in a stale pool index
+
+        Returns:
+            the array volume id, or None if the pool has no volume with the name
+        """
+        pool_id = pool_id.upper()
+        with self._lock:
+            volume_ids_by_name = self._volume_ids_by_pool.get(pool_id)
+            if volume_ids_by_name is None or (volume_name not in volume_ids_by_name and self._is_stale(pool_id)):
+                volume_ids_by_name = self._build(pool_id, get_pool_volumes())
+            return volume_ids_by_name.get(volume_name)
+
+    def add(self, pool_id, volume_name, volume_id):
+        pool_id = pool_id.upper()
+        with self._lock:
+            volume_ids_by_name = self._volume_ids_by_pool.get(pool_id)
+            if volume_ids_by_name is not None and volume_name not in volume_ids_by_name:
+                volume_ids_by_name[volume_name] = volume_id
+                self._keys_by_volume_id[volume_id] = (pool_id, volume_name)
+
+    def mark_stale(self, pool_id):
+        with self._lock:
+            self._build_times_by_pool.pop(pool_id.upper(), None)
+
+    def remove(self, volume_id):
+        with self._lock:
+            key = self._keys_by_volume_id.pop(volume_id, None)
+            if key is None:
+                return
+            pool_id, volume_name = key
+            volume_ids_by_name = self._volume_ids_by_pool.get(pool_id, {})
+            if volume_ids_by_name.get(volume_name) == volume_id:
+                del volume_ids_by_name[volume_name]
+
+    def _build(self, pool_id, volumes):
+        for volume_id, (indexed_pool_id, _) in list(self._keys_by_volume_id.items()):
+            if indexed_pool_id == pool_id:
+                del self._keys_by_volume_id[volume_id]
+        volume_ids_by_name = {}
+        for volume in volumes:
+            if volume.name not in volume_ids_by_name:
+                volume_ids_by_name[volume.name] = volume.id
+                self._keys_by_volume_id[volume.id] = (pool_id, volume.name)
+        self._volume_ids_by_pool[pool_id] = volume_ids_by_name
+        self._build_times_by_pool[pool_id] = time()
+        logger.debug("volume names index of pool {0} was built with {1} volumes".format(
+            pool_id, len(volume_ids_by_name)))
+        return volume_ids_by_name
+
+    def _is_stale(self, pool_id):
+        build_time = self._build_times_by_pool.get(pool_id)
+        return build_time is None or time() - build_time > DS8K_VOLUME_NAMES_INDEX_REFRESH_INTERVAL_IN_SECONDS
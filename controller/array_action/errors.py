@@ -179,3 +179,9 @@ class InvalidCliResponseError(BaseArrayActionException):
 
     def __init__(self, details):
         self.message = messages.InvalidCliResponseError_message.format(details)
+
+
+class ObjectLockTimeoutError(BaseArrayActionException):
+
+    def __init__(self, object_type, key):
+        self.message = messages.ObjectLockTimeoutError_message.format(object_type, key)
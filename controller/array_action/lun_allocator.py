@@ -0,0 +1,127 @@
+from threading import Lock
+from time import time
+
+from controller.array_action.config import LUN_ALLOCATOR_RELOAD_INTERVAL_IN_SECONDS
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+# lun allocator per (array endpoint, host name)
+lun_allocators_dict = {}
+_lun_allocators_dict_lock = Lock()
+
+
+def get_lun_allocator(endpoint, host_name, min_lun, max_lun):
+    """
+    Args:
+        endpoint  : array address, or list of addresses
+        host_name : name of the array host
+        min_lun   : lowest lun which can be assigned to a mapping
+        max_lun   : highest lun which can be assigned to a mapping
+
+    Returns:
+        the shared LunAllocator of the host
+    """
+    key = (tuple(endpoint) if isinstance(endpoint, list) else endpoint, host_name)
+    with _lun_allocators_dict_lock:
+        if key not in lun_allocators_dict:
+            lun_allocators_dict[key] = LunAllocator(min_lun, max_lun)
+        return lun_allocators_dict[key]
+
+
+class LunAllocator:
+    """
+    Bitmap of the luns used by an array host, loaded once from the array and updated by the mappings done through it,
+    so that choosing a free lun does not list the host mappings, and concurrent mappings to the host get different
+    luns. Luns which were unmapped by others stay marked as used until the bitmap is reloaded, which is done when no
+    free lun is left, when the array reports a conflict or when the bitmap is stale.
+    """
+
+    def __init__(self, min_lun, max_lun):
+        self.min_lun = min_lun
+        self.max_lun = max_lun
+        self._lock = Lock()
+        # the index is the lun, None until loaded
+        self._used_luns = None
+        self._load_time = None
+        # luns reserved for mappings which are in progress, they are kept when the bitmap is reloaded
+        self._reserved_luns = set()
+        self._luns_by_volume = {}
+
+    def reserve(self, get_used_luns):
+        """
+        Mark the first free lun as used.
+
+        Args:
+            get_used_luns : function that returns the luns used by the host on the array, it is called to load the
+                            bitmap when it is not loaded or has no free lun
+
+        Returns:
+            the reserved lun, or None if the host has no free lun
+        """
+        with self._lock:
+            is_loaded_now = self._used_luns is None or self._is_stale()
+            if is_loaded_now:
+                self._load(get_used_luns())
+            lun = self._find_free_lun()
+            if lun is None and not is_loaded_now:
+                logger.debug("no free lun was found locally, reloading the used luns from the array")
+                self._load(get_used_luns())
+                lun = self._find_free_lun()
+            if lun is not None:
+                self._used_luns[lun] = 1
+                self._reserved_luns.add(lun)
+            return lun
+
+    def confirm(self, lun, volume):
+        """
+        The mapping of the volume with the reserved lun succeeded.
+        """
+        with self._lock:
+            self._reserved_luns.discard(lun)
+            self._luns_by_volume[volume] = lun
+
+    def release(self, lun):
+        """
+        The mapping with the reserved lun failed.
+        """
+        with self._lock:
+            self._reserved_luns.discard(lun)
+            self._mark_free(lun)
+
+    def release_volume(self, volume):
+        """
+        The volume was unmapped from the host.
+        """
+        with self._lock:
+            lun = self._luns_by_volume.pop(volume, None)
+            if lun is not None:
+                self._mark_free(lun)
+
+    def invalidate(self):
+        """
+        The bitmap does not match the array, it will be reloaded on the next reservation.
+        """
+        with self._lock:
+            self._used_luns = None
+
+    def _load(self, used_luns):
+        used_luns = {int(lun) for lun in used_luns if str(lun).isdigit()}
+        self._used_luns = bytearray(self.max_lun + 1)
+        self._load_time = time()
+        for lun in used_luns | self._reserved_luns:
+            if self.min_lun <= lun <= self.max_lun:
+                self._used_luns[lun] = 1
+        self._luns_by_volume = {volume: lun for volume, lun in self._luns_by_volume.items() if lun in used_luns}
+        logger.debug("loaded {0} used luns".format(len(used_luns)))
+
+    def _is_stale(self):
+        return time() - self._load_time > LUN_ALLOCATOR_RELOAD_INTERVAL_IN_SECONDS
+
+    def _find_free_lun(self):
+        lun = self._used_luns.find(0, self.min_lun)
+        return None if lun == -1 else lun
+
+    def _mark_free(self, lun):
+        if self._used_luns is not None and self.min_lun <= lun <= self.max_lun:
+            self._used_luns[lun] = 0
@@ -54,3 +54,5 @@ SnapshotNameBelongsToVolumeError_message = "Snapshot not found. Volume with the
 SnapshotWrongVolumeError_message = "Snapshot {0} exists but it is of Volume {1} and not {2}"
 
 InvalidCliResponseError_message = "Invalid CLI response. Details : {0}"
+
+ObjectLockTimeoutError_message = "Timed out waiting for another operation on {0} {1}"
@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+from threading import Lock
+
+from controller.array_action.config import OBJECT_LOCK_STRIPES_COUNT, OBJECT_LOCK_TIMEOUT_IN_SECONDS
+from controller.array_action.errors import ObjectLockTimeoutError
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+
+class StripedLocks:
+    """
+    Fixed number of locks shared by hashing the object keys, so that the memory does not grow with the number of
+    objects. Objects whose keys fall on the same lock are serialized together, which is safe but not concurrent.
+    """
+
+    def __init__(self, object_type, stripes_count=OBJECT_LOCK_STRIPES_COUNT,
+                 timeout_in_seconds=OBJECT_LOCK_TIMEOUT_IN_SECONDS):
+        """
+        Args:
+            object_type        : name of the locked objects, for the logs and errors (e.g. volume)
+            stripes_count      : number of locks
+            timeout_in_seconds : default max seconds to wait for a lock
+        """
+        self.object_type = object_type
+        self.timeout_in_seconds = timeout_in_seconds
+        self._locks = [Lock() for _ in range(stripes_count)]
+
+    @contextmanager
+    def lock(self, key, timeout=None):
+        """
+        Args:
+            key     : object key (e.g. volume id)
+            timeout : max seconds to wait for the lock, the default timeout if not given
+
+        Raises:
+            ObjectLockTimeoutError
+        """
+        lock = self._locks[hash(key) % len(self._locks)]
+        logger.debug("acquiring the lock of {0} : {1}".format(self.object_type, key))
+        if timeout is None:
+            timeout = self.timeout_in_seconds
+        if not lock.acquire(timeout=max(timeout, 0)):
+            raise ObjectLockTimeoutError(self.object_type, key)
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+# when both locks are needed the volume lock is acquired first, so two operations never wait for each other
+volume_locks = StripedLocks("volume")
+host_locks = StripedLocks("host")
@@ -0,0 +1,104 @@
+from threading import Event, Lock
+
+from controller.array_action.config import MAX_BATCH_SIZE
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+# request batcher per key, e.g. (operation, array connection pool key, host initiators key)
+request_batchers_dict = {}
+_request_batchers_dict_lock = Lock()
+
+MAP_BATCH_OPERATION = 'map'
+UNMAP_BATCH_OPERATION = 'unmap'
+
+# the map and unmap requests of the same host are batched when the window is set
+batch_window_in_seconds = 0
+
+
+def set_batch_window(window_in_seconds):
+    global batch_window_in_seconds
+    batch_window_in_seconds = window_in_seconds
+
+
+def is_batching_enabled():
+    return batch_window_in_seconds > 0
+
+
+def get_request_batcher(key):
+    """
+    Returns:
+        the shared RequestBatcher of the key
+    """
+    with _request_batchers_dict_lock:
+        if key not in request_batchers_dict:
+            request_batchers_dict[key] = RequestBatcher()
+        return request_batchers_dict[key]
+
+
+class _BatchItem:
+    __slots__ = ("request", "result", "exception", "done")
+
+    def __init__(self, request):
+        self.request = request
+        self.result = None
+        self.exception = None
+        self.done = Event()
+
+
+class RequestBatcher:
+    """
+    Groups the requests which are submitted during a short window into a single batch. The thread which submitted the
+    first request of the batch executes it, and the other threads wait for their results.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pending_items = []
+        self._is_batch_full = Event()
+
+    def submit(self, request, execute_batch, max_batch_size=MAX_BATCH_SIZE):
+        """
+        Args:
+            request        : request to add to the batch (e.g. volume id)
+            execute_batch  : function that gets the batch requests, and returns a (result, exception) pair per
+                             request, it is called by the submitting thread if it starts the batch
+            max_batch_size : number of requests which executes the batch without waiting for the window end
+
+        Returns:
+            the result of the request
+
+        Raises:
+            the exception of the request
+        """
+        item = _BatchItem(request)
+        with self._lock:
+            is_batch_leader = not self._pending_items
+            self._pending_items.append(item)
+            if len(self._pending_items) >= max_batch_size:
+                self._is_batch_full.set()
+
+        if is_batch_leader:
+            self._is_batch_full.wait(batch_window_in_seconds)
+            with self._lock:
+                batch, self._pending_items = self._pending_items, []
+                self._is_batch_full.clear()
+            self._execute(batch, execute_batch)
+
+        item.done.wait()
+        if item.exception is not None:
+            raise item.exception
+        return item.result
+
+    def _execute(self, batch, execute_batch):
+        logger.debug("executing a batch of {0} requests".format(len(batch)))
+        try:
+            results = execute_batch([item.request for item in batch])
+            for item, (result, exception) in zip(batch, results):
+                item.result, item.exception = result, exception
+        except Exception as ex:
+            for item in batch:
+                item.exception = ex
+        finally:
+            for item in batch:
+                item.done.set()
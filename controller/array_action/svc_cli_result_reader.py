@@ -1,4 +1,9 @@
+from codecs import getincrementaldecoder
+from io import BytesIO, StringIO, TextIOWrapper
+from sys import intern
+
 import controller.array_action.errors as controller_errors
+from controller.array_action.utils import UTF_8
 from controller.common.csi_logger import get_stdout_logger
 
 logger = get_stdout_logger()
@@ -6,47 +11,90 @@ logger = get_stdout_logger()
 ID_PARAM_NAME = "id"
 
 
+def _iter_lines(raw_output):
+    """
+    Args:
+        raw_output : string, bytes or an iterator of string or bytes chunks
+
+    Returns:
+        iterator of the output lines, without reading all of them at once
+    """
+    if not raw_output:
+        return iter([])
+    if isinstance(raw_output, str):
+        return iter(StringIO(raw_output))
+    if isinstance(raw_output, (bytes, bytearray)):
+        return TextIOWrapper(BytesIO(raw_output), encoding=UTF_8)
+    return _iter_chunks_lines(raw_output)
+
+
+def _iter_chunks_lines(chunks):
+    # chunks may split a line or a multi-byte character, so the incomplete tail is kept for the next chunk
+    decoder = getincrementaldecoder(UTF_8)()
+    tail = ""
+    for chunk in chunks:
+        if isinstance(chunk, (bytes, bytearray)):
+            chunk = decoder.decode(chunk)
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
 class SVCListResultsReader:
     """
     Iterable object used to read raw command response from SVC array.
     Each object in response is translated to SVCListResultsElement.
-    Input is received as string which represents '\n'-separated list of returned lines from output.
+    Input is received as string, bytes or an iterator of string or bytes chunks, which represents '\n'-separated list
+    of returned lines from output. The input is read lazily, so only the lines of the current object are kept.
     Line with param 'id' (e.g. 'id 1') is recognized as first line of object ans used as separator between objects
     (e.g. in input "id 1\nname n3<new line>id 2<new line>name n2" first object starts with line 'id 1'
     and ends with 'id 2')
+    When fields are given, only these params (and 'id') are read and the lines of other params are skipped.
     """
 
-    def __init__(self, hosts_raw_list_as_string):
-        self._hosts_raw_list = hosts_raw_list_as_string.splitlines()
-        self._current_index = 0
+    def __init__(self, hosts_raw_list, fields=None):
+        """
+        Args:
+            hosts_raw_list : command output
+            fields : names of the params to read, all the params are read if not given
+        """
+        self._lines = _iter_lines(hosts_raw_list)
         self._next_object_id = None
+        self._fields = None
+        self._fields_prefixes = None
+        if fields is not None:
+            self._fields = {field: field for field in fields}
+            self._fields_prefixes = tuple(self._fields) + (ID_PARAM_NAME,)
         self._init_first_object_id()
 
     def _init_first_object_id(self):
         """
-        Set _next_object_id to id of the first object and _current_index to point to next line
+        Set _next_object_id to id of the first object and _lines to point to next line
 
         Raises:
             InvalidCliResponseError
         """
-        while not self._next_object_id and self._current_index < len(self._hosts_raw_list):
-            line = self._hosts_raw_list[self._current_index].strip()
-            self._current_index += 1
+        for line in self._lines:
+            line = line.strip()
             if line:
                 param_name, _, param_value = line.partition(' ')
                 param_value = param_value.strip()
                 if param_name == ID_PARAM_NAME:
                     self._next_object_id = param_value
-                else:
-                    raise controller_errors.InvalidCliResponseError(
-                        "First param is '{0}'. Expected param name '{1}'".format(line, ID_PARAM_NAME))
+                    return
+                raise controller_errors.InvalidCliResponseError(
+                    "First param is '{0}'. Expected param name '{1}'".format(line, ID_PARAM_NAME))
 
     def __iter__(self):
         return self
 
     def __next__(self):
         """
-        Assumed self._current_index points to the line after line 'id <id>' of the next object
+        Assumed self._lines points to the line after line 'id <id>' of the next object
 
         Returns:
             Next object as SVCListResultsElement.
@@ -60,9 +108,12 @@ class SVCListResultsReader:
         res = SVCListResultsElement()
         res.add(ID_PARAM_NAME, self._next_object_id)
         self._next_object_id = None
-        while self._current_index < len(self._hosts_raw_list):
-            line = self._hosts_raw_list[self._current_index].strip()
-            self._current_index += 1
+        fields, fields_prefixes = self._fields, self._fields_prefixes
+        for line in self._lines:
+            # a cheap check that skips most of the unwanted lines before splitting them
+            if fields_prefixes and not line.lstrip().startswith(fields_prefixes):
+                continue
+            line = line.strip()
             if not line:
                 continue
             param_name, _, param_value = line.partition(' ')
@@ -70,7 +121,13 @@ class SVCListResultsReader:
             if param_name == ID_PARAM_NAME:
                 self._next_object_id = param_value
                 return res
-            res.add(param_name, param_value)
+            if fields is None:
+                # the same few param names repeat in every object, so they are interned to be shared between objects
+                res.add(intern(param_name), param_value)
+            else:
+                param_name = fields.get(param_name)
+                if param_name:
+                    res.add(param_name, param_value)
         return res
 
     def _has_next(self):
@@ -80,31 +137,32 @@ class SVCListResultsReader:
 class SVCListResultsElement:
     """
     Single parsed object returned from SVC list command
+    The values of each param are kept in a list, since a param may appear more than once (e.g. WWPN).
     """
+    __slots__ = ("_dict",)
 
     def __init__(self):
         self._dict = {}
 
     def get(self, name, default_value=None):
-        return self._dict.get(name, default_value)
+        """
+        Returns:
+            the param value, or the list of its values if the param appears more than once
+        """
+        values = self._dict.get(name)
+        if values is None:
+            return default_value
+        return values[0] if len(values) == 1 else values
 
     def get_as_list(self, name):
-        if name in self._dict:
-            value = self._dict[name]
-            return value if isinstance(value, list) else [value]
-        else:
-            return []
+        return self._dict.get(name, [])
 
     def add(self, name, value):
-        if name in self._dict:
-            curr_val = self._dict[name]
-            if isinstance(curr_val, list):
-                curr_val.append(value)
-            else:
-                new_val = [curr_val, value]
-                self._dict[name] = new_val
+        values = self._dict.get(name)
+        if values is None:
+            self._dict[name] = [value]
         else:
-            self._dict[name] = value
+            values.append(value)
 
     def __str__(self):
         return self._dict.__str__()
@@ -0,0 +1,134 @@
+from threading import Lock
+
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+# hosts index per (array endpoint, user), since the hosts an user can see depend on its ownership group
+hosts_index_dict = {}
+_hosts_index_dict_lock = Lock()
+
+
+def get_hosts_index(endpoint, user):
+    """
+    Args:
+        endpoint : SVC cluster address
+        user     : user name used to connect to the cluster
+
+    Returns:
+        the shared SVCHostsIndex of the array
+    """
+    with _hosts_index_dict_lock:
+        key = (endpoint, user)
+        if key not in hosts_index_dict:
+            hosts_index_dict[key] = SVCHostsIndex()
+        return hosts_index_dict[key]
+
+
+class SVCHostsIndex:
+    """
+    Index of the array hosts by their lower-cased initiators (iscsi names and fc wwpns), shared between the
+    connections to the same array so that finding a host by its initiators does not list all the array hosts.
+    The index may be stale, so the hosts found in it should be verified against the array.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.is_built = False
+        self._hosts_by_id = {}
+        self._host_ids_by_name = {}
+        self._host_names_by_iscsi_name = {}
+        self._host_names_by_wwn = {}
+
+    def build(self, hosts):
+        """
+        Replace the index content with the given hosts.
+
+        Args:
+            hosts : list of all the array hosts, as Host objects
+        """
+        with self._lock:
+            self._hosts_by_id = {}
+            self._host_ids_by_name = {}
+            self._host_names_by_iscsi_name = {}
+            self._host_names_by_wwn = {}
+            for host in hosts:
+                self._add_host(host)
+            self.is_built = True
+        logger.debug("hosts index was built with {0} hosts".format(len(hosts)))
+
+    def update(self, hosts):
+        """
+        Add the given hosts to the index, replacing the hosts that are already indexed with the same id.
+
+        Args:
+            hosts : list of Host objects
+        """
+        with self._lock:
+            for host in hosts:
+                self._remove_host(host.id)
+                self._add_host(host)
+
+    def remove(self, host_ids):
+        with self._lock:
+            for host_id in host_ids:
+                self._remove_host(host_id)
+
+    def clear(self):
+        with self._lock:
+            self.is_built = False
+            self._hosts_by_id = {}
+            self._host_ids_by_name = {}
+            self._host_names_by_iscsi_name = {}
+            self._host_names_by_wwn = {}
+
+    def get_host_ids(self):
+        with self._lock:
+            return set(self._hosts_by_id)
+
+    def get_host_id(self, host_name):
+        with self._lock:
+            return self._host_ids_by_name.get(host_name)
+
+    def find_host_names(self, initiators):
+        """
+        Args:
+            initiators : Initiators of the wanted host
+
+        Returns:
+            iscsi_host : name of the host with the initiators iscsi iqn, or None
+            fc_host    : name of a host with one of the initiators fc wwns, or None
+        """
+        iscsi_host, fc_host = None, None
+        with self._lock:
+            if initiators.iscsi_iqn:
+                iscsi_host = self._host_names_by_iscsi_name.get(initiators.iscsi_iqn.lower())
+            for wwn in initiators.fc_wwns:
+                if wwn:
+                    fc_host = self._host_names_by_wwn.get(wwn.lower())
+                    if fc_host:
+                        break
+        return iscsi_host, fc_host
+
+    def _add_host(self, host):
+        self._hosts_by_id[host.id] = host
+        self._host_ids_by_name[host.name] = host.id
+        for iscsi_name in host.iscsi_names:
+            if iscsi_name:
+                self._host_names_by_iscsi_name[iscsi_name.lower()] = host.name
+        for wwn in host.wwns:
+            if wwn:
+                self._host_names_by_wwn[wwn.lower()] = host.name
+
+    def _remove_host(self, host_id):
+        host = self._hosts_by_id.pop(host_id, None)
+        if host is None:
+            return
+        if self._host_ids_by_name.get(host.name) == host_id:
+            del self._host_ids_by_name[host.name]
+        for iscsi_name in host.iscsi_names:
+            if self._host_names_by_iscsi_name.get(iscsi_name.lower()) == host.name:
+                del self._host_names_by_iscsi_name[iscsi_name.lower()]
+        for wwn in host.wwns:
+            if self._host_names_by_wwn.get(wwn.lower()) == host.name:
+                del self._host_names_by_wwn[wwn.lower()]
@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+
+import controller.array_action.errors as controller_errors
+
+# volume names by wwn per array endpoint, of the request handled by the thread
+_request = local()
+
+
+@contextmanager
+def request_volume_names_memo():
+    """
+    Scope of a request in which the volume names found by wwn are remembered, so that the request does not ask the
+    array for the same name twice. The names are not kept after the request, since the volume may be renamed, or
+    deleted and its name reused, before the next request.
+    """
+    if getattr(_request, "volume_names", None) is not None:
+        yield
+        return
+    _request.volume_names = {}
+    try:
+        yield
+    finally:
+        _request.volume_names = None
+
+
+def get_volume_names_memo(endpoint):
+    """
+    Args:
+        endpoint : array address, or list of addresses
+
+    Returns:
+        dict of the volume names by wwn found in the array during the current request, or an empty dict which is not
+        kept when the thread does not handle a request
+    """
+    volume_names = getattr(_request, "volume_names", None)
+    if volume_names is None:
+        return {}
+    key = tuple(endpoint) if isinstance(endpoint, list) else endpoint
+    return volume_names.setdefault(key, {})
+
+
+def invalidate_volume_name_on_not_found(function):
+    """
+    Decorator for mediator methods whose first argument is a volume wwn, which forgets the name of the wwn when the
+    volume was not found, so that a retry in the same request looks for it again.
+    """
+
+    @wraps(function)
+    def wrapper(self, volume_id, *args, **kwargs):
+        try:
+            return function(self, volume_id, *args, **kwargs)
+        except controller_errors.VolumeNotFoundError:
+            get_volume_names_memo(self.endpoint).pop(volume_id, None)
+            raise
+
+    return wrapper
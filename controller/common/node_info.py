@@ -52,5 +52,12 @@ class Initiators:
         host_iqns_lower = [iqn.lower() for iqn in host_iqns]
         return self._iscsi_iqn_lowercase in host_iqns_lower
 
+    def get_key(self):
+        """
+        Returns:
+           hashable key of the initiators, which ignores the case of the initiators and the order of the fc wwns
+        """
+        return self._iscsi_iqn_lowercase, tuple(sorted(self._fc_wwns_lowercase_set))
+
     def __str__(self):
         return "iscsi_iqn: " + self.iscsi_iqn + ", fc_wwns: " + ",".join(self.fc_wwns)
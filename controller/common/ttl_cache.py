@@ -0,0 +1,69 @@
+from threading import Lock
+from time import time
+
+
+class TTLCache(object):
+    """
+    Thread safe dict like cache whose entries expire after a time to live.
+    """
+
+    def __init__(self, ttl_in_seconds):
+        """
+        Args:
+            ttl_in_seconds : default time to live of the cache entries
+        """
+        self.ttl_in_seconds = ttl_in_seconds
+        self._lock = Lock()
+        self._entries = {}
+
+    def get(self, key, default=None):
+        """
+        Args:
+            key : cache key
+            default : value to return when the key is not cached or its entry expired
+
+        Returns:
+            the cached value or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expiration_time = entry
+            if expiration_time <= time():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl_in_seconds=None):
+        """
+        Args:
+            key : cache key
+            value : value to cache
+            ttl_in_seconds : time to live of this entry, the cache default if not given
+        """
+        if ttl_in_seconds is None:
+            ttl_in_seconds = self.ttl_in_seconds
+        with self._lock:
+            self._entries[key] = (value, time() + ttl_in_seconds)
+
+    def pop(self, key, default=None):
+        """
+        Remove the key from the cache.
+
+        Returns:
+            the removed value, or default if the key was not cached
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,65 @@
+from threading import BoundedSemaphore
+
+import grpc
+
+import controller.controller_server.messages as messages
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+
+def _get_service_and_method_names(full_method_name):
+    # full method name format is /<package>.<service>/<method>
+    service_name, _, method_name = full_method_name.lstrip("/").partition("/")
+    return service_name, method_name
+
+
+class ConcurrencyLimitInterceptor(grpc.ServerInterceptor):
+    """
+    Server interceptor that rejects RPCs with RESOURCE_EXHAUSTED instead of queueing them when too many are running.
+    RPCs of the unlimited services (e.g. Identity) are never rejected, so when the limit of the other RPCs is lower
+    than the server workers count, the remaining workers are kept for them.
+    """
+
+    def __init__(self, max_concurrent_rpcs, limits_by_method_name=None, unlimited_service_names=()):
+        """
+        Args:
+            max_concurrent_rpcs     : max number of RPCs of the limited services running at once
+            limits_by_method_name   : dict of max number of RPCs running at once per method name (e.g. CreateVolume)
+            unlimited_service_names : full names of the services whose RPCs are not limited (e.g. csi.v1.Identity)
+        """
+        self._total_semaphore = BoundedSemaphore(max_concurrent_rpcs)
+        self._semaphores_by_method_name = {method_name: BoundedSemaphore(limit)
+                                           for method_name, limit in (limits_by_method_name or {}).items()}
+        self._unlimited_service_names = set(unlimited_service_names)
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        service_name, method_name = _get_service_and_method_names(handler_call_details.method)
+        if handler is None or handler.unary_unary is None or service_name in self._unlimited_service_names:
+            return handler
+
+        semaphores = [self._total_semaphore]
+        if method_name in self._semaphores_by_method_name:
+            semaphores.append(self._semaphores_by_method_name[method_name])
+        return grpc.unary_unary_rpc_method_handler(self._get_limited_behavior(handler.unary_unary, method_name,
+                                                                              semaphores),
+                                                   request_deserializer=handler.request_deserializer,
+                                                   response_serializer=handler.response_serializer)
+
+    def _get_limited_behavior(self, behavior, method_name, semaphores):
+        def limited_behavior(request, context):
+            acquired_semaphores = []
+            try:
+                for semaphore in semaphores:
+                    if not semaphore.acquire(blocking=False):
+                        logger.warning("too many concurrent requests, rejecting {0}".format(method_name))
+                        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                      messages.too_many_concurrent_requests_message.format(method_name))
+                    acquired_semaphores.append(semaphore)
+                return behavior(request, context)
+            finally:
+                for semaphore in acquired_semaphores:
+                    semaphore.release()
+
+        return limited_behavior
@@ -27,3 +27,10 @@ SUPPORTED_CONNECTIVITY_TYPES = 2
 
 OBJECT_TYPE_NAME_VOLUME = "volume"
 OBJECT_TYPE_NAME_SNAPSHOT = "snapshot"
+
+# server concurrency, workers are kept for the identity RPCs (e.g. Probe) by rejecting controller RPCs beyond the rest
+SERVER_WORKERS = 12
+SERVER_IDENTITY_WORKERS = 2
+IDENTITY_SERVICE_NAME = csi_pb2.DESCRIPTOR.services_by_name['Identity'].full_name
+RPC_CONCURRENCY_LIMITS_DELIMITER = ","
+RPC_CONCURRENCY_LIMIT_DELIMITER = "="
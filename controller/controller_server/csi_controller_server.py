@@ -10,12 +10,21 @@ import controller.array_action.errors as controller_errors
 import controller.controller_server.config as config
 import controller.controller_server.utils as utils
 from controller.array_action import messages
-from controller.array_action.array_connection_manager import ArrayConnectionManager
+from controller.array_action.array_connection_manager import ArrayConnectionManager, \
+    set_connection_waiters_per_connection
+from controller.array_action.config import CONNECTION_WAITERS_PER_CONNECTION
+from controller.array_action.array_mediator_svc import set_array_assigned_lun as set_svc_array_assigned_lun
+from controller.array_action.object_locks import volume_locks
+from controller.array_action.request_batcher import set_batch_window as set_mapping_batch_window, \
+    get_request_batcher, is_batching_enabled, MAP_BATCH_OPERATION, UNMAP_BATCH_OPERATION
+from controller.array_action.volume_names_memo import request_volume_names_memo
 from controller.common import settings
 from controller.common.csi_logger import get_stdout_logger
 from controller.common.csi_logger import set_log_level
 from controller.common.node_info import NodeIdInfo
 from controller.common.utils import set_current_thread_name
+from controller.controller_server import single_flight
+from controller.controller_server.concurrency_limit_interceptor import ConcurrencyLimitInterceptor
 from controller.controller_server.errors import ValidationException
 from controller.csi_general import csi_pb2
 from controller.csi_general import csi_pb2_grpc
@@ -28,12 +37,14 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
     gRPC server for Digestor Service
     """
 
-    def __init__(self, array_endpoint):
+    def __init__(self, array_endpoint, optimistic_create=False):
         # init logger
         global logger
         logger = get_stdout_logger()
 
         self.endpoint = array_endpoint
+        # create new volumes without looking for them first, the volume is looked for only if it already exists
+        self.optimistic_create = optimistic_create
 
         my_path = os.path.abspath(os.path.dirname(__file__))
         path = os.path.join(my_path, "../../common/config.yaml")
@@ -41,6 +52,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         with open(path, 'r') as yamlfile:
             self.cfg = yaml.safe_load(yamlfile)  # TODO: add the following when possible : Loader=yaml.FullLoader)
 
+    @single_flight.deduplicate(lambda request: request.name, csi_pb2.CreateVolumeResponse)
+    @request_volume_names_memo()
     def CreateVolume(self, request, context):
         set_current_thread_name(request.name)
         logger.info("create volume")
@@ -68,7 +81,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
 
         try:
             # TODO : pass multiple array addresses
-            with ArrayConnectionManager(user, password, array_addresses) as array_mediator:
+            with ArrayConnectionManager(user, password, array_addresses,
+                                        **self._get_connection_wait_args(context)) as array_mediator:
                 logger.debug(array_mediator)
                 # TODO: CSI-1358 - remove try/except
                 try:
@@ -84,27 +98,33 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                     size = array_mediator.minimal_volume_size_in_bytes
                     logger.debug("requested size is 0 so the default size will be used : {0} ".format(
                         size))
-                try:
-                    vol = array_mediator.get_volume(
-                        volume_full_name,
-                        volume_context=request.parameters,
-                        volume_prefix=volume_prefix,
-                    )
-
-                except controller_errors.VolumeNotFoundError:
-                    logger.debug(
-                        "volume was not found. creating a new volume with parameters: {0}".format(request.parameters))
 
-                    array_mediator.validate_supported_capabilities(capabilities)
-                    vol = array_mediator.create_volume(volume_full_name, size, capabilities, pool, volume_prefix)
-
-                else:
-                    logger.debug("volume found : {}".format(vol))
-
-                    if not (vol.capacity_bytes == request.capacity_range.required_bytes):
-                        context.set_details("Volume was already created with different size.")
-                        context.set_code(grpc.StatusCode.ALREADY_EXISTS)
-                        return csi_pb2.CreateVolumeResponse()
+                vol = None
+                if self.optimistic_create:
+                    vol = self._create_volume_if_not_exists(array_mediator, volume_full_name, size, capabilities,
+                                                            pool, volume_prefix)
+                if vol is None:
+                    try:
+                        vol = array_mediator.get_volume(
+                            volume_full_name,
+                            volume_context=request.parameters,
+                            volume_prefix=volume_prefix,
+                        )
+
+                    except controller_errors.VolumeNotFoundError:
+                        logger.debug("volume was not found. creating a new volume with parameters: {0}".format(
+                            request.parameters))
+
+                        array_mediator.validate_supported_capabilities(capabilities)
+                        vol = array_mediator.create_volume(volume_full_name, size, capabilities, pool, volume_prefix)
+
+                    else:
+                        logger.debug("volume found : {}".format(vol))
+
+                        if not (vol.capacity_bytes == request.capacity_range.required_bytes):
+                            context.set_details("Volume was already created with different size.")
+                            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+                            return csi_pb2.CreateVolumeResponse()
 
                 logger.debug("generating create volume response")
                 res = utils.generate_csi_create_volume_response(vol)
@@ -124,6 +144,11 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_details(ex.message)
             context.set_code(grpc.StatusCode.ALREADY_EXISTS)
             return csi_pb2.CreateVolumeResponse()
+        except controller_errors.NoConnectionAvailableException as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return csi_pb2.CreateVolumeResponse()
         except Exception as ex:
             logger.error("an internal exception occurred")
             logger.exception(ex)
@@ -131,6 +156,22 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_details('an internal exception occurred : {}'.format(ex))
             return csi_pb2.CreateVolumeResponse()
 
+    def _create_volume_if_not_exists(self, array_mediator, volume_full_name, size, capabilities, pool, volume_prefix):
+        """
+        Returns:
+            the created volume, or None if a volume with the name already exists
+        """
+        logger.debug("creating a new volume before looking for it")
+        array_mediator.validate_supported_capabilities(capabilities)
+        try:
+            return array_mediator.create_volume(volume_full_name, size, capabilities, pool, volume_prefix,
+                                                raise_if_exists=True)
+        except controller_errors.VolumeAlreadyExists:
+            logger.debug("volume already exists, getting it to compare its size")
+            return None
+
+    @single_flight.deduplicate(lambda request: request.volume_id, csi_pb2.DeleteVolumeResponse)
+    @request_volume_names_memo()
     def DeleteVolume(self, request, context):
         set_current_thread_name(request.volume_id)
         logger.info("DeleteVolume")
@@ -147,7 +188,9 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                 logger.warning("volume id is invalid. error : {}".format(ex))
                 return csi_pb2.DeleteVolumeResponse()
 
-            with ArrayConnectionManager(user, password, array_addresses, array_type) as array_mediator:
+            with self._lock_volume(vol_id, context), \
+                    ArrayConnectionManager(user, password, array_addresses, array_type,
+                                           **self._get_connection_wait_args(context)) as array_mediator:
 
                 logger.debug(array_mediator)
 
@@ -162,12 +205,24 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                     context.set_details(ex)
                     return csi_pb2.DeleteVolumeResponse()
 
+        except controller_errors.ObjectLockTimeoutError as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.ABORTED)
+            return csi_pb2.DeleteVolumeResponse()
+
         except ValidationException as ex:
             logger.exception(ex)
             context.set_details(ex.message)
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             return csi_pb2.DeleteVolumeResponse()
 
+        except controller_errors.NoConnectionAvailableException as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return csi_pb2.DeleteVolumeResponse()
+
         except Exception as ex:
             logger.debug("an internal exception occurred")
             logger.exception(ex)
@@ -180,6 +235,9 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         logger.info("finished DeleteVolume")
         return res
 
+    @single_flight.deduplicate(lambda request: (request.volume_id, request.node_id),
+                               csi_pb2.ControllerPublishVolumeResponse)
+    @request_volume_names_memo()
     def ControllerPublishVolume(self, request, context):
         set_current_thread_name(request.volume_id)
         logger.info("ControllerPublishVolume")
@@ -195,9 +253,11 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             logger.debug("node name for this publish operation is : {0}".format(node_name))
 
             user, password, array_addresses = utils.get_array_connection_info_from_secret(request.secrets)
-            with ArrayConnectionManager(user, password, array_addresses, array_type) as array_mediator:
-                lun, connectivity_type, array_initiators = array_mediator.map_volume_by_initiators(vol_id,
-                                                                                                   initiators)
+            with self._lock_volume(vol_id, context):
+                array_connection_manager = ArrayConnectionManager(user, password, array_addresses, array_type,
+                                                                  **self._get_connection_wait_args(context))
+                lun, connectivity_type, array_initiators = self._map_volume(array_connection_manager, vol_id,
+                                                                            initiators, context)
             logger.info("finished ControllerPublishVolume")
             res = utils.generate_csi_publish_volume_response(lun,
                                                              connectivity_type,
@@ -216,6 +276,12 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_details(ex)
             return csi_pb2.ControllerPublishVolumeResponse()
 
+        except controller_errors.ObjectLockTimeoutError as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.ABORTED)
+            return csi_pb2.ControllerPublishVolumeResponse()
+
         except (controller_errors.LunAlreadyInUseError, controller_errors.NoAvailableLunError) as ex:
             logger.exception(ex)
             context.set_details(ex.message)
@@ -235,6 +301,12 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             return csi_pb2.ControllerPublishVolumeResponse()
 
+        except controller_errors.NoConnectionAvailableException as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return csi_pb2.ControllerPublishVolumeResponse()
+
         except Exception as ex:
             logger.debug("an internal exception occurred")
             logger.exception(ex)
@@ -242,6 +314,30 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_details('an internal exception occurred : {}'.format(ex))
             return csi_pb2.ControllerPublishVolumeResponse()
 
+    def _map_volume(self, array_connection_manager, vol_id, initiators, context):
+        """
+        When batching is enabled, the maps to the same host are queued before getting an array connection, and only
+        the thread which executes the batch gets a connection for all of them.
+
+        Returns:
+            lun, connectivity_type, array_initiators
+        """
+        if not is_batching_enabled():
+            with array_connection_manager as array_mediator:
+                return array_mediator.map_volume_by_initiators(vol_id, initiators,
+                                                               lock_timeout=context.time_remaining())
+
+        def map_volumes(vol_ids):
+            with array_connection_manager as array_mediator:
+                return array_mediator.map_volumes_by_initiators(vol_ids, initiators,
+                                                                lock_timeout=context.time_remaining())
+
+        batch_key = (MAP_BATCH_OPERATION, array_connection_manager.pool_key, initiators.get_key())
+        return get_request_batcher(batch_key).submit(vol_id, map_volumes)
+
+    @single_flight.deduplicate(lambda request: (request.volume_id, request.node_id),
+                               csi_pb2.ControllerUnpublishVolumeResponse)
+    @request_volume_names_memo()
     def ControllerUnpublishVolume(self, request, context):
         set_current_thread_name(request.volume_id)
         logger.info("ControllerUnpublishVolume")
@@ -263,8 +359,10 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
 
             user, password, array_addresses = utils.get_array_connection_info_from_secret(request.secrets)
 
-            with ArrayConnectionManager(user, password, array_addresses, array_type) as array_mediator:
-                array_mediator.unmap_volume_by_initiators(vol_id, initiators)
+            with self._lock_volume(vol_id, context):
+                array_connection_manager = ArrayConnectionManager(user, password, array_addresses, array_type,
+                                                                  **self._get_connection_wait_args(context))
+                self._unmap_volume(array_connection_manager, vol_id, initiators)
 
             logger.info("finished ControllerUnpublishVolume")
             return csi_pb2.ControllerUnpublishVolumeResponse()
@@ -288,6 +386,18 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_code(grpc.StatusCode.NOT_FOUND)
             return csi_pb2.ControllerUnpublishVolumeResponse()
 
+        except controller_errors.ObjectLockTimeoutError as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.ABORTED)
+            return csi_pb2.ControllerUnpublishVolumeResponse()
+
+        except controller_errors.NoConnectionAvailableException as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return csi_pb2.ControllerUnpublishVolumeResponse()
+
         except Exception as ex:
             logger.debug("an internal exception occurred")
             logger.exception(ex)
@@ -295,6 +405,23 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_details('an internal exception occurred : {}'.format(ex))
             return csi_pb2.ControllerUnpublishVolumeResponse()
 
+    def _unmap_volume(self, array_connection_manager, vol_id, initiators):
+        """
+        When batching is enabled, the unmaps from the same host are queued before getting an array connection, and
+        only the thread which executes the batch gets a connection for all of them.
+        """
+        if not is_batching_enabled():
+            with array_connection_manager as array_mediator:
+                array_mediator.unmap_volume_by_initiators(vol_id, initiators)
+            return
+
+        def unmap_volumes(vol_ids):
+            with array_connection_manager as array_mediator:
+                return array_mediator.unmap_volumes_by_initiators(vol_ids, initiators)
+
+        batch_key = (UNMAP_BATCH_OPERATION, array_connection_manager.pool_key, initiators.get_key())
+        get_request_batcher(batch_key).submit(vol_id, unmap_volumes)
+
     def ValidateVolumeCapabilities(self, request, context):
         logger.info("ValidateVolumeCapabilities")
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -307,6 +434,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         logger.info("finished ListVolumes")
         return csi_pb2.ListVolumesResponse()
 
+    @single_flight.deduplicate(lambda request: request.name, csi_pb2.CreateSnapshotResponse)
+    @request_volume_names_memo()
     def CreateSnapshot(self, request, context):
         set_current_thread_name(request.name)
         try:
@@ -323,8 +452,9 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         secrets = request.secrets
         user, password, array_addresses = utils.get_array_connection_info_from_secret(secrets)
         try:
-            _, vol_id = utils.get_volume_id_info(source_volume_id)
-            with ArrayConnectionManager(user, password, array_addresses) as array_mediator:
+            array_type, vol_id = utils.get_volume_id_info(source_volume_id)
+            with ArrayConnectionManager(user, password, array_addresses, array_type,
+                                        **self._get_connection_wait_args(context)) as array_mediator:
                 logger.debug(array_mediator)
                 # TODO: CSI-1358 - remove try/except
                 try:
@@ -367,6 +497,11 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             context.set_details(ex.message)
             context.set_code(grpc.StatusCode.ALREADY_EXISTS)
             return csi_pb2.CreateSnapshotResponse()
+        except controller_errors.NoConnectionAvailableException as ex:
+            logger.exception(ex)
+            context.set_details(ex.message)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return csi_pb2.CreateSnapshotResponse()
         except Exception as ex:
             logger.error("an internal exception occurred")
             logger.exception(ex)
@@ -423,6 +558,19 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         logger.info("finished GetPluginInfo")
         return csi_pb2.GetPluginInfoResponse(name=name, vendor_version=version)
 
+    def _get_connection_wait_args(self, context):
+        """
+        the time left until the request deadline bounds the wait for a free array connection,
+        and a cancelled request stops waiting.
+        """
+        return {"connection_timeout": context.time_remaining(), "is_active": context.is_active}
+
+    def _lock_volume(self, vol_id, context):
+        """
+        serialize the operations on the volume, waiting for the lock until the request deadline
+        """
+        return volume_locks.lock(vol_id, context.time_remaining())
+
     def _get_volume_name_and_prefix(self, request, array_mediator):
         return self._get_object_name_and_prefix(request, array_mediator.max_volume_prefix_length,
                                                 array_mediator.max_volume_name_length,
@@ -483,8 +631,22 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         context.set_code(grpc.StatusCode.OK)
         return csi_pb2.ProbeResponse()
 
-    def start_server(self):
-        controller_server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    def start_server(self, workers=config.SERVER_WORKERS, identity_workers=config.SERVER_IDENTITY_WORKERS,
+                     max_concurrent_rpcs=None, rpc_concurrency_limits=None):
+        """
+        Args:
+            workers                : number of server worker threads
+            identity_workers       : number of workers kept for the identity RPCs, controller RPCs beyond the other
+                                     workers are rejected with RESOURCE_EXHAUSTED
+            max_concurrent_rpcs    : max number of RPCs handled or queued at once, not limited if not given
+            rpc_concurrency_limits : dict of max number of concurrent RPCs per method name (e.g. CreateVolume)
+        """
+        concurrency_limit_interceptor = ConcurrencyLimitInterceptor(max(workers - identity_workers, 1),
+                                                                    rpc_concurrency_limits,
+                                                                    [config.IDENTITY_SERVICE_NAME])
+        controller_server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers),
+                                        interceptors=[concurrency_limit_interceptor],
+                                        maximum_concurrent_rpcs=max_concurrent_rpcs)
 
         csi_pb2_grpc.add_ControllerServicer_to_server(self, controller_server)
         csi_pb2_grpc.add_IdentityServicer_to_server(self, controller_server)
@@ -512,16 +674,41 @@ def main():
     parser = OptionParser()
     parser.add_option("-e", "--csi-endpoint", dest="endpoint", help="grpc endpoint")
     parser.add_option("-l", "--loglevel", dest="loglevel", help="log level")
+    parser.add_option("--workers", dest="workers", type="int", default=config.SERVER_WORKERS,
+                      help="number of grpc worker threads")
+    parser.add_option("--identity-workers", dest="identity_workers", type="int",
+                      default=config.SERVER_IDENTITY_WORKERS,
+                      help="number of grpc worker threads kept for identity requests (e.g. Probe)")
+    parser.add_option("--max-concurrent-rpcs", dest="max_concurrent_rpcs", type="int",
+                      help="max number of requests handled or queued at once")
+    parser.add_option("--connection-waiters-per-connection", dest="connection_waiters_per_connection", type="int",
+                      default=CONNECTION_WAITERS_PER_CONNECTION,
+                      help="max number of requests waiting for a connection to an array, per array connection "
+                           "(0 for no limit)")
+    parser.add_option("--svc-array-assigned-lun", dest="svc_array_assigned_lun", action="store_true", default=False,
+                      help="let SVC arrays assign the lun of new mappings instead of choosing a free lun first")
+    parser.add_option("--mapping-batch-window", dest="mapping_batch_window", type="float", default=0,
+                      help="seconds to wait for more maps or unmaps of a host to send them to the array together")
+    parser.add_option("--optimistic-create", dest="optimistic_create", action="store_true", default=False,
+                      help="create new volumes without looking for them first, and look for them only if they exist")
+    parser.add_option("--rpc-concurrency-limits", dest="rpc_concurrency_limits", default="",
+                      help="max number of concurrent requests per method, e.g. CreateVolume=4,DeleteVolume=4")
     (options, args) = parser.parse_args()
 
     # set logger level and init logger
     log_level = options.loglevel
     set_log_level(log_level)
 
+    set_connection_waiters_per_connection(options.connection_waiters_per_connection)
+    set_svc_array_assigned_lun(options.svc_array_assigned_lun)
+    set_mapping_batch_window(options.mapping_batch_window)
+
     # start the server
     endpoint = options.endpoint
-    curr_server = ControllerServicer(endpoint)
-    curr_server.start_server()
+    curr_server = ControllerServicer(endpoint, optimistic_create=options.optimistic_create)
+    curr_server.start_server(workers=options.workers, identity_workers=options.identity_workers,
+                             max_concurrent_rpcs=options.max_concurrent_rpcs,
+                             rpc_concurrency_limits=utils.get_rpc_concurrency_limits(options.rpc_concurrency_limits))
 
 
 if __name__ == '__main__':
@@ -4,6 +4,10 @@ VolumeIdError_message = "Wrong volume id format : {0}"
 
 more_then_one_mapping_message = "Volume is already mapped to a different host : {0}"
 
+too_many_concurrent_requests_message = "Too many concurrent {0} requests, try again later"
+
+request_in_flight_timeout_message = "Timed out waiting for an identical request in progress"
+
 # validation error messages
 invalid_secret_message = "invalid secret was passed"
 secret_missing_message = 'secret is missing'
@@ -20,3 +24,4 @@ params_are_missing_message = 'parameters are missing'
 volume_id_wrong_format_message = 'volume id has wrong format'
 readonly_not_supported_message = 'readonly parameter is not supported'
 node_id_wrong_format_message = 'node id has wrong format'
+rpc_concurrency_limits_wrong_format_message = 'rpc concurrency limits should be <method>=<limit>,... : {}'
@@ -0,0 +1,130 @@
+from functools import wraps
+from threading import Event, Lock
+
+import grpc
+
+import controller.controller_server.messages as messages
+from controller.common.csi_logger import get_stdout_logger
+
+logger = get_stdout_logger()
+
+
+class _Flight:
+
+    def __init__(self, request):
+        self.request = request
+        self.done = Event()
+        self.response = None
+        self.exception = None
+        self.code = None
+        self.details = None
+
+
+class _RecordingContext:
+    """
+    Context of the leading request, which records the status it sets so it can be replayed to the duplicate requests.
+    """
+
+    def __init__(self, context, flight):
+        self._context = context
+        self._flight = flight
+
+    def set_code(self, code):
+        self._flight.code = code
+        self._context.set_code(code)
+
+    def set_details(self, details):
+        self._flight.details = details
+        self._context.set_details(details)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+class SingleFlight:
+    """
+    Runs a single request at a time per key, the identical requests that arrive while it runs get its result.
+    """
+
+    def __init__(self, response_class):
+        """
+        Args:
+            response_class : class of the response returned to a request whose deadline passed while waiting
+        """
+        self._response_class = response_class
+        self._lock = Lock()
+        self._flights = {}
+
+    def run(self, key, function, request, context):
+        """
+        Args:
+            key      : idempotency key of the request (e.g. (method name, volume name))
+            function : function(request, context) handling the request
+            request  : request message, a request which differs from the one in flight with the same key is not merged
+            context  : grpc servicer context
+
+        Returns:
+            the response of the function, or of the identical request in flight
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight(request)
+                self._flights[key] = flight
+
+        if is_leader:
+            return self._lead(key, flight, function, request, context)
+        if flight.request != request:
+            logger.debug("request {0} differs from the request in flight, handling it separately".format(key))
+            return function(request, context)
+        return self._follow(key, flight, context)
+
+    def _lead(self, key, flight, function, request, context):
+        try:
+            flight.response = function(request, _RecordingContext(context, flight))
+            return flight.response
+        except Exception as ex:
+            flight.exception = ex
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _follow(self, key, flight, context):
+        logger.info("request {0} is already in flight, waiting for its result".format(key))
+        if not flight.done.wait(context.time_remaining()):
+            context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+            context.set_details(messages.request_in_flight_timeout_message)
+            return self._response_class()
+        if flight.exception is not None:
+            raise flight.exception
+        if flight.code is not None:
+            context.set_code(flight.code)
+        if flight.details is not None:
+            context.set_details(flight.details)
+        return flight.response
+
+
+def deduplicate(get_idempotency_key, response_class):
+    """
+    Decorator for servicer methods, which merges the identical requests that are handled at the same time (e.g. the
+    requests resent by the sidecars after a timeout) into a single call of the method.
+
+    Args:
+        get_idempotency_key : function that returns the idempotency key of the request
+        response_class      : class of the method response
+    """
+
+    def decorator(method):
+        single_flight = SingleFlight(response_class)
+
+        @wraps(method)
+        def wrapper(self, request, context):
+            key = (method.__name__, get_idempotency_key(request))
+            return single_flight.run(key, lambda request, context: method(self, request, context), request, context)
+
+        return wrapper
+
+    return decorator
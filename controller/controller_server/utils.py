@@ -5,6 +5,7 @@ import controller.controller_server.messages as messages
 from controller.array_action.config import FC_CONNECTIVITY_TYPE, ISCSI_CONNECTIVITY_TYPE
 from controller.array_action.errors import HostNotFoundError, VolumeNotFoundError
 from controller.common.csi_logger import get_stdout_logger
+from controller.common.utils import string_to_array
 from controller.controller_server.errors import ValidationException
 from controller.csi_general import csi_pb2
 
@@ -18,6 +19,27 @@ def get_array_connection_info_from_secret(secrets):
     return user, password, array_addresses
 
 
+def get_rpc_concurrency_limits(rpc_concurrency_limits):
+    """
+    Args:
+        rpc_concurrency_limits : string in the format <method name>=<limit>,... (e.g. CreateVolume=4,DeleteVolume=4)
+
+    Returns:
+        dict of limit by method name
+
+    Raises:
+        ValidationException
+    """
+    limits_by_method_name = {}
+    for method_limit in string_to_array(rpc_concurrency_limits, config.RPC_CONCURRENCY_LIMITS_DELIMITER):
+        method_name, _, limit = method_limit.partition(config.RPC_CONCURRENCY_LIMIT_DELIMITER)
+        if not method_name or not limit.strip().isdigit() or int(limit) < 1:
+            raise ValidationException(messages.rpc_concurrency_limits_wrong_format_message.format(
+                rpc_concurrency_limits))
+        limits_by_method_name[method_name.strip()] = int(limit)
+    return limits_by_method_name
+
+
 def get_vol_id(new_vol):
     return _get_object_id(new_vol)
 
@@ -1,28 +1,71 @@
+import socket
 import unittest
+from collections import deque
+from threading import Thread, Event
+from time import time
 import controller.array_action.array_connection_manager as array_connection_manager
 from controller.array_action.array_connection_manager import ArrayConnectionManager, NoConnectionAvailableException
-from mock import patch
-from controller.array_action.errors import FailedToFindStorageSystemType
+from mock import patch, Mock
+from controller.array_action.errors import FailedToFindStorageSystemType, VolumeNotFoundError
 from controller.array_action.array_mediator_xiv import XIVArrayMediator
 from controller.array_action.array_mediator_svc import SVCArrayMediator
 from controller.array_action.array_mediator_ds8k import DS8KArrayMediator
 
 
+def _reset_connection_pool():
+    array_connection_manager.array_connections_dict = {}
+    array_connection_manager.idle_connections_dict = {}
+    array_connection_manager.connection_waiters_dict = {}
+    array_connection_manager.array_types_cache.clear()
+
+
+def _get_socket_connect_tests_side_effect(open_ports_by_host):
+    def socket_connect_tests(host_ports, timeout=1):
+        for host, port in host_ports:
+            yield host, port, port in open_ports_by_host.get(host, [])
+    return socket_connect_tests
+
+
 class TestWithFunctionality(unittest.TestCase):
 
     def setUp(self):
         self.fqdn = "fqdn"
         self.array_connection = ArrayConnectionManager(
             "user", "password", [self.fqdn, self.fqdn], XIVArrayMediator.array_type)
+        _reset_connection_pool()
+
+    def tearDown(self):
+        _reset_connection_pool()
 
     @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
     @patch("controller.array_action.array_connection_manager.XIVArrayMediator.disconnect")
-    def test_with_opens_and_closes_the_connection(self, close, connect):
+    def test_with_opens_and_returns_the_connection_to_the_pool(self, close, connect):
         with self.array_connection as array_mediator:
             self.assertEqual(self.array_connection.connected, True)
             self.assertEqual(array_mediator.endpoint, [self.fqdn, self.fqdn])
         connect.assert_called_with()
+        close.assert_not_called()
+        self.assertEqual(self.array_connection.connected, False)
+        self.assertEqual(len(array_connection_manager.idle_connections_dict[self.array_connection.pool_key]), 1)
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator.disconnect")
+    def test_with_closes_the_connection_on_unexpected_error(self, close, connect):
+        with self.assertRaises(ValueError):
+            with self.array_connection:
+                raise ValueError()
         close.assert_called_with()
+        self.assertEqual(array_connection_manager.idle_connections_dict, {})
+        self.assertEqual(array_connection_manager.array_connections_dict, {})
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator.disconnect")
+    def test_with_returns_the_connection_to_the_pool_on_array_error(self, close, connect):
+        with self.assertRaises(VolumeNotFoundError):
+            with self.array_connection:
+                raise VolumeNotFoundError("vol")
+        close.assert_not_called()
+        self.assertEqual(len(array_connection_manager.idle_connections_dict[self.array_connection.pool_key]), 1)
 
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.get_array_connection")
     def test_with_throws_error_if_other_error_occures(self, get_connection):
@@ -44,10 +87,10 @@ class TestGetconnection(unittest.TestCase):
         self.connection_key = ",".join(self.connections)
         self.array_connection = ArrayConnectionManager(
             "user", "password", self.connections, XIVArrayMediator.array_type)
-        array_connection_manager.array_connections_dict = {}
+        _reset_connection_pool()
 
     def tearDown(self):
-        array_connection_manager.array_connections_dict = {}
+        _reset_connection_pool()
 
     @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
     def test_connection_adds_the_new_endpoint_for_the_first_time(self, connect):
@@ -74,8 +117,10 @@ class TestGetconnection(unittest.TestCase):
     def test_connection_returns_error_on_too_many_connection(self, connect):
         array_connection_manager.array_connections_dict = {
             self.connection_key: array_connection_manager.XIVArrayMediator.max_connections}
+        self.array_connection.connection_timeout = 0
         with self.assertRaises(NoConnectionAvailableException):
             self.array_connection.get_array_connection()
+        self.assertEqual(array_connection_manager.connection_waiters_dict, {})
 
     @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
     def test_connection_returns_error_from_connect_function(self, connect):
@@ -87,8 +132,8 @@ class TestGetconnection(unittest.TestCase):
 
         self.assertTrue(error_msg in str(ex.exception))
 
-    @patch("controller.array_action.array_connection_manager._socket_connect_test")
-    def test_detect_array_type(self, socket_connect_test_mock):
+    @patch("controller.array_action.array_connection_manager._socket_connect_tests")
+    def test_detect_array_type(self, socket_connect_tests_mock):
 
         # arrays is a [host, open_ports] dict, note that both port 22 and 8452 are opened in ds8k
         arrays = {
@@ -98,12 +143,7 @@ class TestGetconnection(unittest.TestCase):
 
         }
 
-        def side_effect(host, port):
-            if host in arrays and port in arrays[host]:
-                return 0
-            return 1
-
-        socket_connect_test_mock.side_effect = side_effect
+        socket_connect_tests_mock.side_effect = _get_socket_connect_tests_side_effect(arrays)
 
         self.assertEqual(
             ArrayConnectionManager("", "", ["svc_host", ]).detect_array_type(),
@@ -120,24 +160,305 @@ class TestGetconnection(unittest.TestCase):
             XIVArrayMediator.array_type
         )
 
+        self.assertEqual(
+            ArrayConnectionManager("", "", ["unkonwn_host", "ds8k_host"]).detect_array_type(),
+            DS8KArrayMediator.array_type
+        )
+
         with self.assertRaises(FailedToFindStorageSystemType):
             ArrayConnectionManager("", "", ["unkonwn_host", ]).detect_array_type()
 
+    @patch("controller.array_action.array_connection_manager._socket_connect_tests")
+    def test_detect_array_type_waits_for_higher_priority_type(self, socket_connect_tests_mock):
+        # the ds8k port answers first, but the xiv port of the other endpoint is still tested
+        socket_connect_tests_mock.return_value = (result for result in [
+            ("ds8k_host", DS8KArrayMediator.port, True),
+            ("ds8k_host", XIVArrayMediator.port, False),
+            ("xiv_host", XIVArrayMediator.port, True)])
+        self.assertEqual(ArrayConnectionManager("", "", ["xiv_host", "ds8k_host"]).array_type,
+                         XIVArrayMediator.array_type)
+
+    @patch("controller.array_action.array_connection_manager._socket_connect_tests")
+    def test_detect_array_type_returns_once_settled(self, socket_connect_tests_mock):
+        def socket_connect_tests(host_ports, timeout=1):
+            yield "xiv_host", XIVArrayMediator.port, True
+            self.fail("detection did not return once the array type was settled")
+        socket_connect_tests_mock.side_effect = socket_connect_tests
+        self.assertEqual(ArrayConnectionManager("", "", ["xiv_host"]).array_type, XIVArrayMediator.array_type)
+
+    def test_socket_connect_tests(self):
+        listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listening_socket.bind(("127.0.0.1", 0))
+        listening_socket.listen(1)
+        closed_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed_socket.bind(("127.0.0.1", 0))
+        open_port = listening_socket.getsockname()[1]
+        closed_port = closed_socket.getsockname()[1]
+        closed_socket.close()
+        try:
+            results = set(array_connection_manager._socket_connect_tests([("127.0.0.1", open_port),
+                                                                          ("127.0.0.1", closed_port)]))
+        finally:
+            listening_socket.close()
+        self.assertEqual(results, {("127.0.0.1", open_port, True), ("127.0.0.1", closed_port, False)})
+
+    @patch("controller.array_action.array_connection_manager.socket.getaddrinfo")
+    def test_socket_connect_tests_with_unresolvable_host(self, getaddrinfo):
+        getaddrinfo.side_effect = socket.gaierror("unknown host")
+        results = list(array_connection_manager._socket_connect_tests([("unknown_host", 22), ("unknown_host", 7778)]))
+        self.assertEqual(results, [("unknown_host", 22, False), ("unknown_host", 7778, False)])
+        getaddrinfo.assert_called_once_with("unknown_host", None, socket.AF_INET, socket.SOCK_STREAM)
+
+    @patch("controller.array_action.array_connection_manager.socket.getaddrinfo")
+    def test_socket_connect_tests_resolves_hosts_together_with_timeout(self, getaddrinfo):
+        resolved = Event()
+
+        def getaddrinfo_side_effect(host, *args):
+            if host == "slow_host":
+                resolved.wait(5)
+                raise socket.gaierror("timed out")
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+
+        getaddrinfo.side_effect = getaddrinfo_side_effect
+        listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listening_socket.bind(("127.0.0.1", 0))
+        listening_socket.listen(1)
+        open_port = listening_socket.getsockname()[1]
+        start_time = time()
+        try:
+            results = set(array_connection_manager._socket_connect_tests([("slow_host", open_port),
+                                                                          ("local_host", open_port)], timeout=0.2))
+        finally:
+            resolved.set()
+            listening_socket.close()
+        self.assertEqual(results, {("slow_host", open_port, False), ("local_host", open_port, True)})
+        self.assertLess(time() - start_time, 1)
+
+    @patch("controller.array_action.array_connection_manager._socket_connect_tests")
+    def test_detect_array_type_is_cached(self, socket_connect_tests_mock):
+        socket_connect_tests_mock.side_effect = _get_socket_connect_tests_side_effect(
+            {"host": [XIVArrayMediator.port]})
+        self.assertEqual(ArrayConnectionManager("", "", ["host"]).array_type, XIVArrayMediator.array_type)
+        self.assertEqual(ArrayConnectionManager("", "", ["host"]).array_type, XIVArrayMediator.array_type)
+        self.assertEqual(socket_connect_tests_mock.call_count, 1)
+
+    @patch("controller.array_action.array_connection_manager._socket_connect_tests")
+    def test_detect_array_type_failure_is_cached(self, socket_connect_tests_mock):
+        socket_connect_tests_mock.side_effect = _get_socket_connect_tests_side_effect({})
+        for _ in range(2):
+            with self.assertRaises(FailedToFindStorageSystemType):
+                ArrayConnectionManager("", "", ["host"])
+        self.assertEqual(socket_connect_tests_mock.call_count, 1)
+
+    @patch("controller.array_action.array_connection_manager._socket_connect_tests")
+    def test_array_type_cache_is_seeded_from_given_array_type(self, socket_connect_tests_mock):
+        ArrayConnectionManager("", "", ["host"], SVCArrayMediator.array_type)
+        self.assertEqual(ArrayConnectionManager("", "", ["host"]).array_type, SVCArrayMediator.array_type)
+        socket_connect_tests_mock.assert_not_called()
+
     @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
-    def test_exit_reduces_connection_to_zero(self, connect):
+    def test_array_type_cache_is_invalidated_on_connection_failure(self, connect):
+        array_connection_manager.array_types_cache.set(self.connection_key, XIVArrayMediator.array_type)
+        connect.side_effect = [Exception("error")]
+        with self.assertRaises(Exception):
+            self.array_connection.get_array_connection()
+        self.assertIsNone(array_connection_manager.array_types_cache.get(self.connection_key))
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_exit_returns_connection_to_pool(self, connect):
         self.array_connection.get_array_connection()
         self.assertEqual(array_connection_manager.array_connections_dict, {self.connection_key: 1})
 
         self.array_connection.__exit__("", "", None)
-        self.assertEqual(array_connection_manager.array_connections_dict, {})
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.connection_key: 1})
+        self.assertEqual(len(array_connection_manager.idle_connections_dict[self.array_connection.pool_key]), 1)
 
     @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
-    def test_exit_reduces_connection(self, connect):
+    def test_exit_with_unexpected_error_reduces_connection(self, connect):
         self.array_connection.get_array_connection()
-        self.assertEqual(array_connection_manager.array_connections_dict, {self.connection_key: 1})
-
         self.array_connection.get_array_connection()
         self.assertEqual(array_connection_manager.array_connections_dict, {self.connection_key: 2})
 
-        self.array_connection.__exit__("", "", None)
+        self.array_connection.__exit__(Exception, Exception(), None)
         self.assertEqual(array_connection_manager.array_connections_dict, {self.connection_key: 1})
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.fqdn = "fqdn"
+        _reset_connection_pool()
+
+    def tearDown(self):
+        _reset_connection_pool()
+
+    def _get_manager(self, user="user", password="password"):
+        return ArrayConnectionManager(user, password, [self.fqdn], XIVArrayMediator.array_type)
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_pooled_connection_is_reused(self, connect):
+        with self._get_manager() as first_mediator:
+            first_mediator.client = Mock()
+        stats_before = array_connection_manager.get_connection_pool_stats()
+        with self._get_manager() as second_mediator:
+            pass
+        self.assertIs(first_mediator, second_mediator)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.fqdn: 1})
+        self.assertEqual(array_connection_manager.get_connection_pool_stats()["hits"], stats_before["hits"] + 1)
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_pooled_connection_is_not_shared_between_credentials(self, connect):
+        with self._get_manager() as first_mediator:
+            first_mediator.client = Mock()
+        with self._get_manager(password="other") as second_mediator:
+            pass
+        self.assertIsNot(first_mediator, second_mediator)
+        self.assertEqual(connect.call_count, 2)
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.fqdn: 2})
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_disconnected_pooled_connection_is_replaced(self, connect):
+        with self._get_manager() as first_mediator:
+            first_mediator.client = Mock()
+        first_mediator.client.is_connected.return_value = False
+        with self._get_manager() as second_mediator:
+            pass
+        self.assertIsNot(first_mediator, second_mediator)
+        self.assertEqual(connect.call_count, 2)
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.fqdn: 1})
+
+    @patch("controller.array_action.array_connection_manager.CONNECTION_POOL_IDLE_TTL_IN_SECONDS", -1)
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_expired_pooled_connection_is_closed(self, connect):
+        with self._get_manager() as first_mediator:
+            first_mediator.client = Mock()
+            first_mediator.client.is_connected.return_value = True
+        with self._get_manager() as second_mediator:
+            pass
+        self.assertIsNot(first_mediator, second_mediator)
+        first_mediator.client.close.assert_called_once_with()
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.fqdn: 1})
+
+    @patch("controller.array_action.array_connection_manager.CONNECTION_POOL_IDLE_TTL_IN_SECONDS", -1)
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_expired_pooled_connection_is_closed_when_connection_is_returned(self, connect):
+        with self._get_manager() as returned_mediator:
+            returned_mediator.client = Mock()
+            with self._get_manager(password="other") as first_mediator:
+                first_mediator.client = Mock()
+            first_mediator.client.close.assert_not_called()
+        first_mediator.client.close.assert_called_once_with()
+        returned_mediator.client.close.assert_not_called()
+        self.assertEqual(list(array_connection_manager.idle_connections_dict), [self._get_manager().pool_key])
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.fqdn: 1})
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_idle_connection_of_other_credentials_is_evicted_when_pool_is_full(self, connect):
+        idle_mediators = []
+        for password in range(XIVArrayMediator.max_connections):
+            with self._get_manager(password=str(password)) as mediator:
+                mediator.client = Mock()
+                idle_mediators.append(mediator)
+        with self._get_manager(password="new"):
+            self.assertEqual(array_connection_manager.array_connections_dict,
+                             {self.fqdn: XIVArrayMediator.max_connections})
+        self.assertEqual(sum(mediator.client.close.call_count for mediator in idle_mediators), 1)
+
+
+class TestConnectionWaitQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.fqdn = "fqdn"
+        _reset_connection_pool()
+        array_connection_manager.array_connections_dict = {self.fqdn: XIVArrayMediator.max_connections}
+
+    def tearDown(self):
+        _reset_connection_pool()
+
+    def _get_manager(self, **kwargs):
+        return ArrayConnectionManager("user", "password", [self.fqdn], XIVArrayMediator.array_type, **kwargs)
+
+    def _wait_for_waiters(self, count):
+        for _ in range(100):
+            if len(array_connection_manager.connection_waiters_dict.get(self.fqdn, [])) == count:
+                return
+            array_connection_manager.Event().wait(0.01)
+        self.fail("{} waiters were not queued".format(count))
+
+    def _start_waiter(self, results, name):
+        manager = self._get_manager()
+
+        def get_connection():
+            results.append((name, manager.get_array_connection()))
+        thread = Thread(target=get_connection)
+        thread.start()
+        return manager, thread
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_waiter_gets_released_connection(self, connect):
+        results = []
+        _, thread = self._start_waiter(results, "first")
+        self._wait_for_waiters(1)
+
+        self._get_manager()._unreserve_connection()
+        thread.join(5)
+
+        self.assertEqual([name for name, _ in results], ["first"])
+        self.assertEqual(array_connection_manager.connection_waiters_dict, {})
+        self.assertEqual(array_connection_manager.array_connections_dict, {self.fqdn: XIVArrayMediator.max_connections})
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_waiters_get_connections_in_fifo_order(self, connect):
+        results = []
+        _, first_thread = self._start_waiter(results, "first")
+        self._wait_for_waiters(1)
+        _, second_thread = self._start_waiter(results, "second")
+        self._wait_for_waiters(2)
+
+        returned_mediator = Mock()
+        self._get_manager()._return_connection(returned_mediator)
+        first_thread.join(5)
+        self.assertEqual(results, [("first", returned_mediator)])
+
+        self._get_manager()._unreserve_connection()
+        second_thread.join(5)
+        self.assertEqual([name for name, _ in results], ["first", "second"])
+
+    @patch("controller.array_action.array_connection_manager.XIVArrayMediator._connect")
+    def test_new_request_does_not_overtake_waiters(self, connect):
+        array_connection_manager.array_connections_dict = {}
+        queued_waiter = array_connection_manager.Event()
+        array_connection_manager.connection_waiters_dict = {self.fqdn: deque([queued_waiter])}
+        with self.assertRaises(NoConnectionAvailableException):
+            self._get_manager(connection_timeout=0).get_array_connection()
+        connect.assert_not_called()
+        self.assertEqual(list(array_connection_manager.connection_waiters_dict[self.fqdn]), [queued_waiter])
+
+    @patch("controller.array_action.array_connection_manager.CONNECTION_WAIT_POLL_INTERVAL_IN_SECONDS", 0.01)
+    def test_cancelled_request_stops_waiting(self):
+        is_active = Mock(side_effect=[True, False])
+        with self.assertRaises(NoConnectionAvailableException):
+            self._get_manager(is_active=is_active).get_array_connection()
+        self.assertEqual(is_active.call_count, 2)
+        self.assertEqual(array_connection_manager.connection_waiters_dict, {})
+
+    def test_request_is_rejected_when_wait_queue_is_full(self):
+        queued_waiters = [array_connection_manager.Event()
+                          for _ in range(XIVArrayMediator.max_connections *
+                                         array_connection_manager.connection_waiters_per_connection)]
+        array_connection_manager.connection_waiters_dict = {self.fqdn: deque(queued_waiters)}
+        is_active = Mock(return_value=True)
+        with self.assertRaises(NoConnectionAvailableException):
+            self._get_manager(is_active=is_active).get_array_connection()
+        is_active.assert_not_called()
+        self.assertEqual(list(array_connection_manager.connection_waiters_dict[self.fqdn]), queued_waiters)
+
+    @patch("controller.array_action.array_connection_manager.connection_waiters_per_connection", 0)
+    def test_request_waits_when_wait_queue_is_not_limited(self):
+        queued_waiters = [array_connection_manager.Event() for _ in range(XIVArrayMediator.max_connections * 10)]
+        array_connection_manager.connection_waiters_dict = {self.fqdn: deque(queued_waiters)}
+        is_active = Mock(return_value=False)
+        with self.assertRaises(NoConnectionAvailableException):
+            self._get_manager(is_active=is_active).get_array_connection()
+        is_active.assert_called_once_with()
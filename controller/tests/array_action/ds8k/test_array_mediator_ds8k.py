@@ -7,6 +7,11 @@ from controller.array_action.array_mediator_ds8k import LOGIN_PORT_WWPN, LOGIN_P
 from pyds8k.exceptions import ClientError, ClientException, NotFound
 from controller.common import settings
 import controller.array_action.errors as array_errors
+import controller.array_action.ds8k_hosts_cache as ds8k_hosts_cache
+import controller.array_action.ds8k_mappings_index as ds8k_mappings_index
+import controller.array_action.ds8k_rest_client as ds8k_rest_client
+import controller.array_action.ds8k_system_info_cache as ds8k_system_info_cache
+import controller.array_action.ds8k_volume_names_index as ds8k_volume_names_index
 from controller.array_action import config
 from controller.common.node_info import Initiators
 
@@ -16,7 +21,7 @@ class TestArrayMediatorDS8K(unittest.TestCase):
     def setUp(self):
         self.endpoint = ["1.2.3.4"]
         self.client_mock = NonCallableMagicMock()
-        patcher = patch('controller.array_action.array_mediator_ds8k.RESTClient')
+        patcher = patch('controller.array_action.ds8k_rest_client.RESTClient')
         self.connect_mock = patcher.start()
         self.addCleanup(patcher.stop)
         self.connect_mock.return_value = self.client_mock
@@ -45,6 +50,11 @@ class TestArrayMediatorDS8K(unittest.TestCase):
              }
         )
 
+        ds8k_hosts_cache.hosts_caches_dict.clear()
+        ds8k_mappings_index.mappings_index_dict.clear()
+        ds8k_rest_client.rest_clients_dict.clear()
+        ds8k_system_info_cache.system_info_caches_dict.clear()
+        ds8k_volume_names_index.volume_names_index_dict.clear()
         self.array = DS8KArrayMediator("user", "password", self.endpoint)
 
     def test_shorten_volume_name(self):
@@ -60,17 +70,59 @@ class TestArrayMediatorDS8K(unittest.TestCase):
         self.assertTrue(new_name.startswith(test_prefix + settings.NAME_PREFIX_SEPARATOR))
 
     def test_connect_with_incorrect_credentials(self):
-        self.client_mock.get_system.side_effect = \
+        ds8k_rest_client.rest_clients_dict.clear()
+        self.client_mock.authenticate.side_effect = \
             ClientError("400", "BE7A002D")
         with self.assertRaises(array_errors.CredentialsError):
             DS8KArrayMediator("user", "password", self.endpoint)
 
+    def test_connect_with_incorrect_password_keeps_shared_rest_client(self):
+        self.client_mock.authenticate.side_effect = ClientError("400", "BE7A002D")
+        with self.assertRaises(array_errors.CredentialsError):
+            DS8KArrayMediator("user", "wrong_password", self.endpoint)
+        self.assertEqual(len(ds8k_rest_client.rest_clients_dict), 1)
+        self.assertIs(DS8KArrayMediator("user", "password", self.endpoint).client, self.array.client)
+
     def test_connect_to_unsupported_system(self):
+        ds8k_system_info_cache.system_info_caches_dict.clear()
         self.client_mock.get_system.return_value = \
             Munch({"bundle": "87.50.34.0"})
         with self.assertRaises(array_errors.UnsupportedStorageVersionError):
             DS8KArrayMediator("user", "password", self.endpoint)
 
+    def test_connect_shares_rest_client(self):
+        array = DS8KArrayMediator("user", "password", self.endpoint)
+        self.assertIs(array.client, self.array.client)
+        self.connect_mock.assert_called_once_with(service_address=self.endpoint[0], user="user", password="password",
+                                                  max_connections=DS8KArrayMediator.max_connections)
+
+    def test_connect_with_changed_password_creates_rest_client(self):
+        DS8KArrayMediator("user", "new_password", self.endpoint)
+        self.assertEqual(self.connect_mock.call_count, 2)
+
+    def test_connect_with_new_password_replaces_shared_rest_client(self):
+        new_client_mock = NonCallableMagicMock()
+        self.connect_mock.return_value = new_client_mock
+        DS8KArrayMediator("user", "new_password", self.endpoint)
+        array = DS8KArrayMediator("user", "new_password", self.endpoint)
+        self.assertIs(array.client, new_client_mock)
+        self.assertEqual(self.connect_mock.call_count, 2)
+        self.assertEqual(len(ds8k_rest_client.rest_clients_dict), 1)
+
+    def test_connect_uses_cached_system_info(self):
+        array = DS8KArrayMediator("user", "password", self.endpoint)
+        self.assertEqual(array.wwnn, "5005076306FFD2F0")
+        self.client_mock.get_system.assert_called_once_with()
+
+    @patch("controller.array_action.ds8k_system_info_cache.DS8K_SYSTEM_INFO_REFRESH_INTERVAL_IN_SECONDS", -1)
+    @patch("controller.array_action.ds8k_system_info_cache.Thread")
+    def test_connect_refreshes_system_info_in_background(self, thread_mock):
+        thread_mock.side_effect = lambda target, args, daemon: Munch(start=lambda: target(*args))
+        self.client_mock.get_system.return_value = Munch({"bundle": "87.51.47.0", "wwnn": "new_wwnn"})
+        array = DS8KArrayMediator("user", "password", self.endpoint)
+        self.assertEqual(array.wwnn, "5005076306FFD2F0")
+        self.assertEqual(DS8KArrayMediator("user", "password", self.endpoint).wwnn, "new_wwnn")
+
     def test_validate_capabilities_passed(self):
         self.array.validate_supported_capabilities(
             {config.CAPABILITIES_SPACEEFFICIENCY: config.CAPABILITY_THIN}
@@ -91,6 +143,7 @@ class TestArrayMediatorDS8K(unittest.TestCase):
         self.client_mock.get_volumes_by_pool.return_value = [
             self.volume_response,
         ]
+        self.client_mock.get_volume.return_value = self.volume_response
         vol = self.array.get_volume(
             self.volume_response.name,
             volume_context={
@@ -105,6 +158,7 @@ class TestArrayMediatorDS8K(unittest.TestCase):
         volume_res = self.volume_response
         volume_res.name = short_name
         self.client_mock.get_volumes_by_pool.return_value = [volume_res, ]
+        self.client_mock.get_volume.return_value = volume_res
         vol = self.array.get_volume(
             volume_name,
             volume_context={
@@ -125,6 +179,49 @@ class TestArrayMediatorDS8K(unittest.TestCase):
                 }
             )
 
+    def test_get_volume_lists_pool_once(self):
+        self.client_mock.get_volumes_by_pool.return_value = [self.volume_response]
+        self.client_mock.get_volume.return_value = self.volume_response
+        volume_context = {config.CONTEXT_POOL: self.volume_response.pool}
+        self.array.get_volume(self.volume_response.name, volume_context=volume_context)
+        with self.assertRaises(array_errors.VolumeNotFoundError):
+            self.array.get_volume("fake_name", volume_context=volume_context)
+        vol = self.array.get_volume(self.volume_response.name, volume_context=volume_context)
+
+        self.assertEqual(vol.volume_name, self.volume_response.name)
+        self.client_mock.get_volumes_by_pool.assert_called_once_with(self.volume_response.pool)
+        self.client_mock.get_volume.assert_called_with(self.volume_response.id)
+
+    def test_get_volume_of_deleted_volume_in_index(self):
+        self.client_mock.get_volumes_by_pool.return_value = [self.volume_response]
+        self.client_mock.get_volume.side_effect = NotFound("404")
+        with self.assertRaises(array_errors.VolumeNotFoundError):
+            self.array.get_volume(self.volume_response.name,
+                                  volume_context={config.CONTEXT_POOL: self.volume_response.pool})
+
+    def test_create_volume_lists_pool_once(self):
+        self.client_mock.create_volume.return_value = self.volume_response
+        self.client_mock.get_volume.return_value = self.volume_response
+        self.client_mock.get_volumes_by_pool.return_value = []
+        pool_id = self.volume_response.pool
+        with self.assertRaises(array_errors.VolumeNotFoundError):
+            self.array.get_volume(self.volume_response.name, volume_context={config.CONTEXT_POOL: pool_id})
+        self.array.create_volume(self.volume_response.name, self.volume_response.cap, {}, pool_id)
+        vol = self.array.get_volume(self.volume_response.name, volume_context={config.CONTEXT_POOL: pool_id})
+
+        self.assertEqual(vol.volume_name, self.volume_response.name)
+        self.client_mock.get_volumes_by_pool.assert_called_once_with(pool_id)
+
+    def test_create_volume_with_pool_id_in_other_case_returns_existing(self):
+        self.client_mock.get_volumes_by_pool.return_value = [self.volume_response]
+        self.client_mock.get_volume.return_value = self.volume_response
+        pool_id = self.volume_response.pool.upper()
+        vol = self.array.create_volume(self.volume_response.name, self.volume_response.cap, {}, pool_id)
+        self.assertEqual(vol.volume_name, self.volume_response.name)
+        self.client_mock.create_volume.assert_not_called()
+        self.array.get_volume(self.volume_response.name, volume_context={config.CONTEXT_POOL: pool_id.lower()})
+        self.client_mock.get_volumes_by_pool.assert_called_once_with(pool_id)
+
     def test_create_volume_with_default_capabilities_succeeded(self):
         self._test_create_volume_with_capabilities_succeeded(False)
 
@@ -155,16 +252,34 @@ class TestArrayMediatorDS8K(unittest.TestCase):
             name='test_name',
         )
         self.assertEqual(vol.volume_name, self.volume_response.name)
+        self.assertEqual(vol.capacity_bytes, int(self.volume_response.cap))
+        self.assertEqual(vol.pool_name, pool_id)
+        self.assertTrue(vol.id.endswith(self.volume_response.id))
+        self.client_mock.get_volume.assert_not_called()
 
     def test_create_volume_return_existing(self):
         self.client_mock.get_volumes_by_pool.return_value = [
             self.volume_response,
         ]
+        self.client_mock.get_volume.return_value = self.volume_response
         pool_id = self.volume_response.pool
         vol = self.array.create_volume(
             self.volume_response.name, "1", {}, pool_id,
         )
         self.assertEqual(vol.volume_name, self.volume_response.name)
+        self.client_mock.create_volume.assert_not_called()
+
+    def test_create_volume_already_exists(self):
+        self.client_mock.get_volumes_by_pool.return_value = [
+            self.volume_response,
+        ]
+        self.client_mock.get_volume.return_value = self.volume_response
+        pool_id = self.volume_response.pool
+        with self.assertRaises(array_errors.VolumeAlreadyExists):
+            self.array.create_volume(
+                self.volume_response.name, "1", {}, pool_id, raise_if_exists=True,
+            )
+        self.client_mock.create_volume.assert_not_called()
 
     def test_create_volume_with_long_name_succeeded(self):
         volume_name = "it is a very long name, more than 16 characters"
@@ -193,6 +308,18 @@ class TestArrayMediatorDS8K(unittest.TestCase):
         with self.assertRaises(array_errors.VolumeCreationError):
             self.array.create_volume("fake_name", 1, {}, "fake_pool")
 
+    def test_create_volume_after_failed_creation_lists_pool_again(self):
+        self.client_mock.get_volumes_by_pool.return_value = []
+        self.client_mock.create_volume.side_effect = ClientException("500")
+        pool_id = self.volume_response.pool
+        with self.assertRaises(array_errors.VolumeCreationError):
+            self.array.create_volume(self.volume_response.name, self.volume_response.cap, {}, pool_id)
+        self.client_mock.get_volumes_by_pool.return_value = [self.volume_response]
+        self.client_mock.get_volume.return_value = self.volume_response
+        self.array.create_volume(self.volume_response.name, self.volume_response.cap, {}, pool_id)
+        self.assertEqual(self.client_mock.get_volumes_by_pool.call_count, 2)
+        self.client_mock.create_volume.assert_called_once()
+
     def test_create_volume_failed_with_pool_not_found(self):
         self.client_mock.create_volume.side_effect = NotFound("404", message="BE7A0001")
         with self.assertRaises(array_errors.PoolDoesNotExist):
@@ -226,7 +353,8 @@ class TestArrayMediatorDS8K(unittest.TestCase):
                 "mappings_briefs": [{
                     "volume_id": "0000",
                     "lunid": "1",
-                }]
+                }],
+                "name": "test_host",
             })
         ]
         self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {})
@@ -247,6 +375,55 @@ class TestArrayMediatorDS8K(unittest.TestCase):
         ]
         self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {host_name: int(lunid)})
 
+    def _prepare_mapped_volume(self, volume_id, host_name, lunid):
+        self.client_mock.get_hosts.return_value = [
+            Munch({
+                "mappings_briefs": [{
+                    "volume_id": volume_id,
+                    "lunid": lunid,
+                }],
+                "name": host_name,
+            })
+        ]
+
+    def test_get_volume_mappings_lists_hosts_once(self):
+        self._prepare_mapped_volume("0001", "test_host", "1")
+        self.array.get_volume_mappings("6005076306FFD3010000000000000001")
+        self.assertDictEqual(self.array.get_volume_mappings("6005076306FFD3010000000000000002"), {})
+        self.client_mock.get_hosts.assert_called_once_with()
+
+    def test_get_volume_mappings_after_map_and_unmap(self):
+        scsi_id = "6005076306FFD3010000000000000002"
+        self._prepare_mapped_volume("0001", "test_host", "1")
+        self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {})
+        self.client_mock.map_volume_to_host.return_value = Munch({"lunid": "02"})
+        self.array.map_volume(scsi_id, "test_host")
+        self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {"test_host": 2})
+
+        self.client_mock.get_host_mappings.return_value = [Munch({"volume": "0002", "lunid": "2"})]
+        self.array.unmap_volume(scsi_id, "test_host")
+        self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {})
+        self.client_mock.get_hosts.assert_called_once_with()
+
+    @patch("controller.array_action.ds8k_mappings_index.DS8K_MAPPINGS_INDEX_REFRESH_INTERVAL_IN_SECONDS", -1)
+    def test_get_volume_mappings_rechecks_missing_volume_in_stale_index(self):
+        scsi_id = "6005076306FFD3010000000000000002"
+        self._prepare_mapped_volume("0001", "test_host", "1")
+        self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {})
+        self._prepare_mapped_volume("0002", "test_host", "3")
+        self.assertDictEqual(self.array.get_volume_mappings(scsi_id), {"test_host": 3})
+        self.assertEqual(self.client_mock.get_hosts.call_count, 2)
+
+    def test_get_volume_mappings_after_mapping_conflict(self):
+        scsi_id = "6005076306FFD3010000000000000001"
+        self._prepare_mapped_volume("0001", "test_host", "1")
+        self.array.get_volume_mappings(scsi_id)
+        self.client_mock.map_volume_to_host.side_effect = ClientException("500")
+        with self.assertRaises(array_errors.MappingError):
+            self.array.map_volume(scsi_id, "other_host")
+        self.array.get_volume_mappings(scsi_id)
+        self.assertEqual(self.client_mock.get_hosts.call_count, 2)
+
     def test_map_volume_host_not_found(self):
         self.client_mock.map_volume_to_host.side_effect = NotFound("404")
         with self.assertRaises(array_errors.HostNotFoundError):
@@ -341,34 +518,32 @@ class TestArrayMediatorDS8K(unittest.TestCase):
             ]})
         self.assertListEqual(self.array.get_array_fc_wwns(), [wwpn])
 
+    def _prepare_host_ports(self, host_name_by_wwpn):
+        def get_host_port(wwpn):
+            if wwpn not in host_name_by_wwpn:
+                raise NotFound("404")
+            return Munch({"wwpn": wwpn, "host": host_name_by_wwpn[wwpn]})
+        self.client_mock.get_host_port.side_effect = get_host_port
+
     def test_get_host_by_identifiers(self):
         host_name = "test_host"
         wwpn1 = "wwpn1"
         wwpn2 = "wwpn2"
-        self.client_mock.get_hosts.return_value = [
-            Munch({
-                "name": host_name,
-                "host_ports_briefs": [{"wwpn": wwpn1}, {"wwpn": wwpn2}]
-            })
-        ]
+        self._prepare_host_ports({wwpn1: host_name, wwpn2: host_name})
         host, connectivity_type = self.array.get_host_by_host_identifiers(
             Initiators('', [wwpn1, wwpn2])
         )
         self.assertEqual(host, host_name)
         self.assertEqual([config.FC_CONNECTIVITY_TYPE], connectivity_type)
+        self.client_mock.get_hosts.assert_not_called()
 
     def test_get_host_by_identifiers_partial_match(self):
         host_name = "test_host"
         wwpn1 = "wwpn1"
         wwpn2 = "wwpn2"
-        self.client_mock.get_hosts.return_value = [
-            Munch({
-                "name": host_name,
-                "host_ports_briefs": [{"wwpn": wwpn1}, {"wwpn": wwpn2}]
-            })
-        ]
+        self._prepare_host_ports({wwpn1: host_name, wwpn2: host_name})
         host, connectivity_type = self.array.get_host_by_host_identifiers(
-            Initiators('', [wwpn1, "another_wwpn"])
+            Initiators('', ["another_wwpn", wwpn1])
         )
         self.assertEqual(host, host_name)
         self.assertEqual([config.FC_CONNECTIVITY_TYPE], connectivity_type)
@@ -377,13 +552,24 @@ class TestArrayMediatorDS8K(unittest.TestCase):
         host_name = "test_host"
         wwpn1 = "wwpn1"
         wwpn2 = "wwpn2"
-        self.client_mock.get_hosts.return_value = [
-            Munch({
-                "name": host_name,
-                "host_ports_briefs": [{"wwpn": wwpn1}, {"wwpn": wwpn2}]
-            })
-        ]
+        self._prepare_host_ports({wwpn1: host_name, wwpn2: host_name, "unattached_wwpn": ""})
         with self.assertRaises(array_errors.HostNotFoundError):
             self.array.get_host_by_host_identifiers(
-                Initiators('', ["new_wwpn", "another_wwpn"])
+                Initiators('', ["new_wwpn", "unattached_wwpn"])
             )
+
+    def test_get_host_by_identifiers_is_cached(self):
+        self._prepare_host_ports({"wwpn1": "test_host"})
+        self.array.get_host_by_host_identifiers(Initiators('', ["WWPN1"]))
+        host, _ = self.array.get_host_by_host_identifiers(Initiators('', ["wwpn1"]))
+        self.assertEqual(host, "test_host")
+        self.client_mock.get_host_port.assert_called_once_with("wwpn1")
+
+    def test_get_host_by_identifiers_after_host_not_found(self):
+        self._prepare_host_ports({"wwpn1": "test_host"})
+        self.array.get_host_by_host_identifiers(Initiators('', ["wwpn1"]))
+        self.client_mock.map_volume_to_host.side_effect = NotFound("404")
+        with self.assertRaises(array_errors.HostNotFoundError):
+            self.array.map_volume("6005076306FFD3010000000000000001", "test_host")
+        self.array.get_host_by_host_identifiers(Initiators('', ["wwpn1"]))
+        self.assertEqual(self.client_mock.get_host_port.call_count, 2)
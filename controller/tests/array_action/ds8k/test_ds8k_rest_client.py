@@ -0,0 +1,21 @@
+import unittest
+
+from mock import patch
+
+from controller.array_action.ds8k_rest_client import RESTClient
+
+
+class TestDS8KRESTClient(unittest.TestCase):
+
+    def test_rest_client_keeps_max_connections_alive(self):
+        rest_client = RESTClient("1.2.3.4", "user", "password", max_connections=50)
+        adapter = rest_client._client.client.session.get_adapter("https://1.2.3.4:8452")
+        self.assertEqual(adapter._pool_maxsize, 50)
+
+    def test_rest_client_authenticates_with_its_credentials(self):
+        rest_client = RESTClient("1.2.3.4", "user", "password")
+        with patch.object(rest_client._client.client, "post") as post_mock:
+            post_mock.return_value = (None, {"data": {"token": [{"token": "abc"}]}})
+            rest_client.authenticate()
+        post_mock.assert_called_once()
+        self.assertEqual(rest_client._client.client.defaultHeaders["X-Auth-Token"], "abc")
@@ -0,0 +1,67 @@
+import unittest
+from threading import Thread
+
+from mock import Mock, patch
+
+from controller.array_action.lun_allocator import LunAllocator
+
+
+class TestLunAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.allocator = LunAllocator(1, 4)
+        self.get_used_luns = Mock(return_value={"1", "3"})
+
+    def test_reserve_loads_used_luns_once(self):
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), 2)
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), 4)
+        self.get_used_luns.assert_called_once_with()
+
+    def test_reserve_reloads_used_luns_when_no_free_lun(self):
+        self.allocator.reserve(self.get_used_luns)
+        self.allocator.reserve(self.get_used_luns)
+        self.get_used_luns.return_value = {"2", "3", "4"}
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), 1)
+        self.assertEqual(self.get_used_luns.call_count, 2)
+
+    def test_reserve_returns_none_when_host_has_no_free_lun(self):
+        self.get_used_luns.return_value = {"1", "2", "3", "4"}
+        self.assertIsNone(self.allocator.reserve(self.get_used_luns))
+
+    def test_reserved_luns_are_kept_when_reloaded(self):
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), 2)
+        self.allocator.invalidate()
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), 4)
+        self.assertEqual(self.get_used_luns.call_count, 2)
+
+    def test_released_lun_is_reserved_again(self):
+        lun = self.allocator.reserve(self.get_used_luns)
+        self.allocator.release(lun)
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), lun)
+
+    def test_unmapped_volume_lun_is_reserved_again(self):
+        lun = self.allocator.reserve(self.get_used_luns)
+        self.allocator.confirm(lun, "volume")
+        self.allocator.reserve(self.get_used_luns)
+        self.allocator.release_volume("volume")
+        self.assertEqual(self.allocator.reserve(self.get_used_luns), lun)
+
+    def test_concurrent_reservations_get_different_luns(self):
+        allocator = LunAllocator(0, 511)
+        luns = []
+
+        def reserve():
+            for _ in range(50):
+                luns.append(allocator.reserve(lambda: []))
+        threads = [Thread(target=reserve) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(luns), list(range(200)))
+
+    @patch("controller.array_action.lun_allocator.LUN_ALLOCATOR_RELOAD_INTERVAL_IN_SECONDS", -1)
+    def test_stale_used_luns_are_reloaded(self):
+        self.allocator.reserve(self.get_used_luns)
+        self.allocator.reserve(self.get_used_luns)
+        self.assertEqual(self.get_used_luns.call_count, 2)
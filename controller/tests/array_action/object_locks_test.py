@@ -0,0 +1,46 @@
+import unittest
+from threading import Thread, Event
+
+from controller.array_action.errors import ObjectLockTimeoutError
+from controller.array_action.object_locks import StripedLocks
+
+
+class TestStripedLocks(unittest.TestCase):
+
+    def setUp(self):
+        self.locks = StripedLocks("volume", stripes_count=4, timeout_in_seconds=0)
+
+    def test_lock_is_released_after_operation(self):
+        with self.locks.lock("volume1"):
+            pass
+        with self.locks.lock("volume1"):
+            pass
+
+    def test_locked_object_times_out(self):
+        with self.locks.lock("volume1"):
+            with self.assertRaises(ObjectLockTimeoutError):
+                with self.locks.lock("volume1"):
+                    pass
+
+    def test_lock_is_released_after_exception(self):
+        with self.assertRaises(ValueError):
+            with self.locks.lock("volume1"):
+                raise ValueError()
+        with self.locks.lock("volume1"):
+            pass
+
+    def test_waiting_operation_gets_lock_when_released(self):
+        locked = Event()
+        release = Event()
+
+        def hold_lock():
+            with self.locks.lock("volume1"):
+                locked.set()
+                release.wait(5)
+        thread = Thread(target=hold_lock)
+        thread.start()
+        self.assertTrue(locked.wait(5))
+        release.set()
+        with self.locks.lock("volume1", timeout=5):
+            pass
+        thread.join(5)
@@ -0,0 +1,52 @@
+import unittest
+from threading import Thread
+
+from mock import Mock, patch
+
+from controller.array_action.request_batcher import RequestBatcher
+
+
+class TestRequestBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.batcher = RequestBatcher()
+        self.execute_batch = Mock(side_effect=lambda requests: [(request + "_result", None) for request in requests])
+
+    def _submit_in_threads(self, requests, max_batch_size):
+        results = {}
+
+        def submit(request):
+            results[request] = self.batcher.submit(request, self.execute_batch, max_batch_size)
+        threads = [Thread(target=submit, args=(request,)) for request in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    @patch("controller.array_action.request_batcher.batch_window_in_seconds", 5)
+    def test_submit_executes_requests_of_window_in_single_batch(self):
+        results = self._submit_in_threads(["vol1", "vol2", "vol3"], max_batch_size=3)
+
+        self.execute_batch.assert_called_once()
+        self.assertEqual(sorted(self.execute_batch.call_args[0][0]), ["vol1", "vol2", "vol3"])
+        self.assertEqual(results, {"vol1": "vol1_result", "vol2": "vol2_result", "vol3": "vol3_result"})
+
+    @patch("controller.array_action.request_batcher.batch_window_in_seconds", 0.01)
+    def test_submit_executes_batch_at_window_end(self):
+        self.assertEqual(self.batcher.submit("vol1", self.execute_batch), "vol1_result")
+        self.assertEqual(self.batcher.submit("vol2", self.execute_batch), "vol2_result")
+        self.assertEqual(self.execute_batch.call_count, 2)
+
+    @patch("controller.array_action.request_batcher.batch_window_in_seconds", 0.01)
+    def test_submit_raises_exception_of_request(self):
+        self.execute_batch.side_effect = lambda requests: [(None, ValueError("error"))]
+        with self.assertRaises(ValueError):
+            self.batcher.submit("vol", self.execute_batch)
+
+    @patch("controller.array_action.request_batcher.batch_window_in_seconds", 0.01)
+    def test_submit_raises_exception_of_batch(self):
+        self.execute_batch.side_effect = ValueError("error")
+        with self.assertRaises(ValueError):
+            self.batcher.submit("vol", self.execute_batch)
+        self.assertEqual(self.batcher.submit("vol", Mock(return_value=[("result", None)])), "result")
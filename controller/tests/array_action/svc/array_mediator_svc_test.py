@@ -7,9 +7,12 @@ from pysvc.unified.response import CLIFailureError
 
 import controller.array_action.config as config
 import controller.array_action.errors as array_errors
+import controller.array_action.lun_allocator as lun_allocator
+import controller.array_action.svc_hosts_index as svc_hosts_index
 from controller.array_action.array_mediator_svc import SVCArrayMediator, build_kwargs_from_capabilities, \
     HOST_ID_PARAM, HOST_NAME_PARAM, HOST_ISCSI_NAMES_PARAM, HOST_WWPNS_PARAM
 from controller.array_action.svc_cli_result_reader import SVCListResultsElement
+from controller.array_action.volume_names_memo import get_volume_names_memo, request_volume_names_memo
 from controller.common.node_info import Initiators
 
 EMPTY_BYTES = b''
@@ -28,6 +31,8 @@ class TestArrayMediatorSVC(unittest.TestCase):
         self.svc.client.svcinfo.lsnode.return_value = [node]
         port = Munch({'node_id': '1', 'IP_address': '1.1.1.1', 'IP_address_6': None})
         self.svc.client.svcinfo.lsportip.return_value = [port]
+        svc_hosts_index.hosts_index_dict.clear()
+        lun_allocator.lun_allocators_dict.clear()
 
     @patch(
         "controller.array_action.array_mediator_svc.SVCArrayMediator._connect")
@@ -53,6 +58,18 @@ class TestArrayMediatorSVC(unittest.TestCase):
         self.svc.disconnect()
         self.svc.client.close.assert_called_with()
 
+    def test_is_connected(self):
+        self.svc.client.transport.is_connected.return_value = True
+        self.svc.client.transport.transport.get_transport.return_value.is_active.return_value = True
+        self.assertTrue(self.svc.is_connected())
+
+    def test_is_connected_when_ssh_session_was_closed_by_array(self):
+        self.svc.client.transport.is_connected.return_value = True
+        self.svc.client.transport.transport.get_transport.return_value.is_active.return_value = False
+        self.assertFalse(self.svc.is_connected())
+        self.svc.client.transport.transport.get_transport.return_value = None
+        self.assertFalse(self.svc.is_connected())
+
     @patch("controller.array_action.array_mediator_svc.is_warning_message")
     def test_get_volume_return_CLI_Failure_errors(self, mock_warning):
         mock_warning.return_value = False
@@ -139,6 +156,8 @@ class TestArrayMediatorSVC(unittest.TestCase):
         self.assertEqual(volume.capacity_bytes, 1024)
         self.assertEqual(volume.array_type, 'SVC')
         self.assertEqual(volume.id, 'vol_id')
+        self.assertEqual(volume.pool_name, 'pool_name')
+        self.svc.client.svcinfo.lsvdisk.assert_called_once_with(bytes=True, filtervalue='name=test_vol')
 
     def test_get_vol_by_wwn_return_error(self):
         vol_ret = Mock(as_single_element=Munch({}))
@@ -357,6 +376,103 @@ class TestArrayMediatorSVC(unittest.TestCase):
         self.assertEqual([config.ISCSI_CONNECTIVITY_TYPE,
                           config.FC_CONNECTIVITY_TYPE], connectivity_type)
 
+    def _prepare_hosts_index(self, result_reader_iter, hosts):
+        self.svc.client.svcinfo.lshost = Mock()
+        self.svc.client.svcinfo.lshost.return_value = self._get_hosts_list_result(hosts)
+        self.svc.client.send_raw_command = Mock()
+        self.svc.client.send_raw_command.return_value = EMPTY_BYTES, EMPTY_BYTES
+        result_reader_iter.return_value = self._get_detailed_hosts_list_result(hosts)
+        self.svc.get_host_by_host_identifiers(Initiators('iqn.test.1', []))
+        self.svc.client.svcinfo.lshost.reset_mock()
+        self.svc.client.send_raw_command.reset_mock()
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_verifies_only_indexed_host(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        host_2 = self._get_host_as_dictionary('host_id_2', 'test_host_2', ['iqn.test.2'], ['abc2'])
+        self._prepare_hosts_index(result_reader_iter, [host_1, host_2])
+        result_reader_iter.return_value = self._get_detailed_hosts_list_result([host_2])
+        host, connectivity_type = self.svc.get_host_by_host_identifiers(Initiators('iqn.test.2', ['ABC2']))
+        self.assertEqual('test_host_2', host)
+        self.assertEqual([config.ISCSI_CONNECTIVITY_TYPE, config.FC_CONNECTIVITY_TYPE], connectivity_type)
+        self.svc.client.svcinfo.lshost.assert_not_called()
+        self.svc.client.send_raw_command.assert_called_once_with('lshost host_id_2;')
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_adds_new_hosts_to_index(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        host_2 = self._get_host_as_dictionary('host_id_2', 'test_host_2', ['iqn.test.2'], [])
+        self._prepare_hosts_index(result_reader_iter, [host_1])
+        self.svc.client.svcinfo.lshost.return_value = self._get_hosts_list_result([host_1, host_2])
+        result_reader_iter.side_effect = [self._get_detailed_hosts_list_result([host_2]),
+                                          self._get_detailed_hosts_list_result([host_2])]
+        host, _ = self.svc.get_host_by_host_identifiers(Initiators('iqn.test.2', []))
+        self.assertEqual('test_host_2', host)
+        self.assertEqual(self.svc.client.send_raw_command.call_args_list[0][0], ('lshost host_id_2;',))
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_finds_fc_of_new_host_when_iscsi_is_indexed(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        host_2 = self._get_host_as_dictionary('host_id_2', 'test_host_2', [], ['abc2'])
+        self._prepare_hosts_index(result_reader_iter, [host_1])
+        self.svc.client.svcinfo.lshost.return_value = self._get_hosts_list_result([host_1, host_2])
+        result_reader_iter.side_effect = [self._get_detailed_hosts_list_result([host_2]),
+                                          self._get_detailed_hosts_list_result([host_1, host_2])]
+        with self.assertRaises(array_errors.MultipleHostsFoundError):
+            self.svc.get_host_by_host_identifiers(Initiators('iqn.test.1', ['abc2']))
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_uses_refreshed_indexed_host(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        self._prepare_hosts_index(result_reader_iter, [host_1])
+        refreshed_host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], ['abc1'])
+        result_reader_iter.return_value = self._get_detailed_hosts_list_result([refreshed_host_1])
+        host, connectivity_type = self.svc.get_host_by_host_identifiers(Initiators('iqn.test.1', ['abc1']))
+        self.assertEqual('test_host_1', host)
+        self.assertEqual([config.ISCSI_CONNECTIVITY_TYPE, config.FC_CONNECTIVITY_TYPE], connectivity_type)
+        self.svc.client.svcinfo.lshost.assert_called_once_with()
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_rebuilds_stale_index(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        host_2 = self._get_host_as_dictionary('host_id_2', 'test_host_2', ['iqn.test.2'], [])
+        self._prepare_hosts_index(result_reader_iter, [host_1, host_2])
+        moved_host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', [], [])
+        moved_host_2 = self._get_host_as_dictionary('host_id_2', 'test_host_2', ['iqn.test.2', 'iqn.test.1'], [])
+        result_reader_iter.side_effect = [self._get_detailed_hosts_list_result([moved_host_1]),
+                                          self._get_detailed_hosts_list_result([moved_host_1, moved_host_2])]
+        host, _ = self.svc.get_host_by_host_identifiers(Initiators('iqn.test.1', []))
+        self.assertEqual('test_host_2', host)
+        self.svc.client.svcinfo.lshost.assert_called_once_with()
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_host_not_found_keeps_rebuilt_index(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        self._prepare_hosts_index(result_reader_iter, [host_1])
+        result_reader_iter.side_effect = [self._get_detailed_hosts_list_result([host_1]),
+                                          self._get_detailed_hosts_list_result([host_1])]
+        with self.assertRaises(array_errors.HostNotFoundError):
+            self.svc.get_host_by_host_identifiers(Initiators('iqn.test.2', []))
+        self.assertEqual(self.svc.client.send_raw_command.call_count, 1)
+        self.svc.client.svcinfo.lshost.reset_mock()
+        self.svc.client.send_raw_command.reset_mock()
+
+        host, _ = self.svc.get_host_by_host_identifiers(Initiators('iqn.test.1', []))
+        self.assertEqual('test_host_1', host)
+        self.svc.client.svcinfo.lshost.assert_not_called()
+        self.svc.client.send_raw_command.assert_called_once_with('lshost host_id_1;')
+
+    @patch("controller.array_action.svc_cli_result_reader.SVCListResultsReader.__iter__")
+    def test_get_host_by_identifiers_multiple_hosts_found_keeps_index(self, result_reader_iter):
+        host_1 = self._get_host_as_dictionary('host_id_1', 'test_host_1', ['iqn.test.1'], [])
+        host_2 = self._get_host_as_dictionary('host_id_2', 'test_host_2', [], ['abc2'])
+        self._prepare_hosts_index(result_reader_iter, [host_1, host_2])
+        result_reader_iter.return_value = self._get_detailed_hosts_list_result([host_1, host_2])
+        with self.assertRaises(array_errors.MultipleHostsFoundError):
+            self.svc.get_host_by_host_identifiers(Initiators('iqn.test.1', ['abc2']))
+        self.svc.client.svcinfo.lshost.assert_not_called()
+        self.assertTrue(svc_hosts_index.get_hosts_index(self.svc.endpoint, self.svc.user).is_built)
+
     def _get_host_as_dictionary(self, id, name, iscsi_names_list, wwpns_list):
         res = {HOST_ID_PARAM: id, HOST_NAME_PARAM: name}
         if iscsi_names_list:
@@ -406,6 +522,37 @@ class TestArrayMediatorSVC(unittest.TestCase):
         mappings = self.svc.get_volume_mappings("vol")
         self.assertEqual(mappings, {'Test_P': '0', 'Test_W': '1'})
 
+    def test_get_volume_mappings_uses_volume_name_found_in_request(self):
+        vol_ret = Mock(as_single_element=Munch({'vdisk_UID': 'vol_id',
+                                                'name': 'test_vol',
+                                                'capacity': '1024',
+                                                'mdisk_grp_name': 'pool_name'
+                                                }))
+        self.svc.client.svcinfo.lsvdisk.return_value = vol_ret
+        self.svc.client.svcinfo.lsvdiskhostmap.return_value = []
+        with request_volume_names_memo():
+            self.svc.get_volume("test_vol")
+            self.svc.get_volume_mappings("vol_id")
+        self.svc.client.svcinfo.lsvdisk.assert_called_once_with(bytes=True, object_id="test_vol")
+        self.svc.client.svcinfo.lsvdiskhostmap.assert_called_once_with(vdisk_name="test_vol")
+
+    def test_get_volume_mappings_does_not_use_volume_name_of_previous_request(self):
+        self.svc.client.svcinfo.lsvdisk.return_value = Mock(as_single_element=Munch({'name': 'test_vol'}))
+        self.svc.client.svcinfo.lsvdiskhostmap.return_value = []
+        with request_volume_names_memo():
+            get_volume_names_memo(self.svc.endpoint)["vol_id"] = "stale_vol"
+        with request_volume_names_memo():
+            self.svc.get_volume_mappings("vol_id")
+        self.svc.client.svcinfo.lsvdiskhostmap.assert_called_once_with(vdisk_name="test_vol")
+
+    def test_get_volume_mappings_on_volume_not_found_forgets_volume_name(self):
+        self.svc.client.svcinfo.lsvdiskhostmap.side_effect = [svc_errors.CommandExecutionError('Failed')]
+        with request_volume_names_memo():
+            get_volume_names_memo(self.svc.endpoint)["vol_id"] = "test_vol"
+            with self.assertRaises(array_errors.VolumeNotFoundError):
+                self.svc.get_volume_mappings("vol_id")
+            self.assertNotIn("vol_id", get_volume_names_memo(self.svc.endpoint))
+
     def test_get_first_free_lun_raises_host_not_found_error(self):
         self.svc.client.svcinfo.lshostvdiskmap.side_effect = [
             svc_errors.CommandExecutionError('Failed')]
@@ -442,6 +589,30 @@ class TestArrayMediatorSVC(unittest.TestCase):
         with self.assertRaises(array_errors.NoAvailableLunError):
             self.svc.get_first_free_lun('Test_P')
 
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    def test_map_volume_reserves_luns_locally(self):
+        map1 = Munch({'id': '51', 'name': 'peng', 'SCSI_id': '0',
+                      'host_id': '12', 'host_name': 'Test_P'})
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = [map1]
+        self.assertEqual(self.svc.map_volume("vol1", "Test_P"), '1')
+        self.assertEqual(self.svc.map_volume("vol2", "Test_P"), '2')
+        self.svc.client.svcinfo.lshostvdiskmap.assert_called_once_with(host="Test_P")
+
+        self.svc.unmap_volume("vol1", "Test_P")
+        self.assertEqual(self.svc.map_volume("vol3", "Test_P"), '1')
+
+    @patch("controller.array_action.array_mediator_svc.is_warning_message")
+    def test_map_volume_reloads_used_luns_after_conflict(self, mock_is_warning_message):
+        mock_is_warning_message.return_value = False
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = []
+        self.svc.client.svctask.mkvdiskhostmap.side_effect = [svc_errors.CommandExecutionError('CMMVC5878E'), None]
+        with self.assertRaises(array_errors.LunAlreadyInUseError):
+            self.svc.map_volume("vol", "host")
+
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = [Munch({'SCSI_id': '0'})]
+        self.assertEqual(self.svc.map_volume("vol", "host"), '1')
+        self.assertEqual(self.svc.client.svcinfo.lshostvdiskmap.call_count, 2)
+
     @patch("controller.array_action.array_mediator_svc.is_warning_message")
     @patch("controller.array_action.array_mediator_svc.SVCArrayMediator.get_first_free_lun")
     def test_map_volume_vol_not_found(self, mock_get_first_free_lun,
@@ -498,6 +669,104 @@ class TestArrayMediatorSVC(unittest.TestCase):
         lun = self.svc.map_volume("vol", "host")
         self.assertEqual(lun, '5')
 
+    @patch("controller.array_action.array_mediator_svc.SVCArrayMediator.get_first_free_lun")
+    def test_map_volume_uses_volume_name_found_in_request(self, mock_get_first_free_lun):
+        mock_get_first_free_lun.return_value = '5'
+        self.svc.client.svcinfo.lsvdisk.return_value = Mock(as_single_element=Munch({'name': 'vol_name'}))
+        self.svc.client.svcinfo.lsvdiskhostmap.return_value = []
+        with request_volume_names_memo():
+            self.svc.get_volume_mappings("vol")
+            self.svc.map_volume("vol", "host")
+        self.svc.client.svcinfo.lsvdisk.assert_called_once_with(filtervalue="vdisk_UID=vol")
+        self.assertEqual(self.svc.client.svctask.mkvdiskhostmap.call_args[1]['object_id'], 'vol_name')
+
+    @patch("controller.array_action.array_mediator_svc.array_assigned_lun", True)
+    def test_map_volume_with_array_assigned_lun(self):
+        self.svc.client.svctask.mkvdiskhostmap.return_value = Mock(
+            response=(b"Virtual Disk to Host map, id [7], successfully created\n", b""))
+        lun = self.svc.map_volume("vol", "host")
+        self.assertEqual(lun, '7')
+        self.svc.client.svcinfo.lshostvdiskmap.assert_not_called()
+        self.assertNotIn('scsi', self.svc.client.svctask.mkvdiskhostmap.call_args[1])
+
+    @patch("controller.array_action.array_mediator_svc.array_assigned_lun", True)
+    @patch("controller.array_action.array_mediator_svc.is_warning_message")
+    def test_map_volume_with_array_assigned_lun_already_mapped(self, mock_is_warning_message):
+        mock_is_warning_message.return_value = False
+        self.svc.client.svctask.mkvdiskhostmap.side_effect = [svc_errors.CommandExecutionError('CMMVC5878E')]
+        self.svc.get_volume_mappings = Mock(return_value={"host": "3"})
+        lun = self.svc.map_volume("vol", "host")
+        self.assertEqual(lun, '3')
+
+    @patch("controller.array_action.array_mediator_svc.array_assigned_lun", True)
+    @patch("controller.array_action.array_mediator_svc.is_warning_message")
+    def test_map_volume_with_array_assigned_lun_host_not_found(self, mock_is_warning_message):
+        mock_is_warning_message.return_value = False
+        self.svc.client.svctask.mkvdiskhostmap.side_effect = [svc_errors.CommandExecutionError('CMMVC5754E')]
+        with self.assertRaises(array_errors.HostNotFoundError):
+            self.svc.map_volume("vol", "host")
+
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    def test_map_volumes_in_batch(self):
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = [Munch({'SCSI_id': '0'})]
+        self.svc.client.send_raw_command.return_value = (
+            b"Virtual Disk to Host map, id [1], successfully created\n"
+            b"Virtual Disk to Host map, id [2], successfully created\n", b"")
+        results = self.svc._map_volumes(["vol1", "vol2"], "host")
+        self.assertEqual(results, [('1', None), ('2', None)])
+        self.svc.client.send_raw_command.assert_called_once_with(
+            'mkvdiskhostmap -force -host host -scsi 1 vol1_name;mkvdiskhostmap -force -host host -scsi 2 vol2_name;')
+        self.svc.client.svctask.mkvdiskhostmap.assert_not_called()
+
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    @patch("controller.array_action.array_mediator_svc.is_warning_message")
+    def test_map_volumes_batch_maps_failed_volumes_separately(self, mock_is_warning_message):
+        mock_is_warning_message.return_value = False
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = []
+        self.svc.client.send_raw_command.return_value = (
+            b"Virtual Disk to Host map, id [0], successfully created\n", b"CMMVC5804E")
+        self.svc.client.svctask.mkvdiskhostmap.side_effect = [svc_errors.CommandExecutionError('CMMVC5804E')]
+        results = self.svc._map_volumes(["vol1", "vol2"], "host")
+
+        self.svc.client.send_raw_command.assert_called_once_with(
+            'mkvdiskhostmap -force -host host -scsi 0 vol1_name;mkvdiskhostmap -force -host host -scsi 1 vol2_name;')
+        self.assertEqual(results[0], ('0', None))
+        self.assertIsInstance(results[1][1], array_errors.VolumeNotFoundError)
+        self.assertEqual(self.svc.client.svctask.mkvdiskhostmap.call_args[1]['scsi'], '1')
+
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    def test_map_volumes_in_batch_raise_exception(self):
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = []
+        self.svc.client.send_raw_command.side_effect = [Exception]
+        with self.assertRaises(Exception):
+            self.svc._map_volumes(["vol1", "vol2"], "host")
+        self.svc.client.send_raw_command.side_effect = None
+        self.svc.client.send_raw_command.return_value = (
+            b"Virtual Disk to Host map, id [0], successfully created\n"
+            b"Virtual Disk to Host map, id [1], successfully created\n", b"")
+        self.assertEqual(self.svc._map_volumes(["vol1", "vol2"], "host"), [('0', None), ('1', None)])
+
+    def test_map_volumes_releases_luns_when_volume_lookup_fails(self):
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = []
+        self.svc.client.svcinfo.lsvdisk.side_effect = [
+            Mock(as_single_element=Munch({'name': 'vol1_name'})),
+            Mock(as_single_element=Munch({'name': 'vol2_name'})),
+            CLIFailureError("Failed")]
+        with self.assertRaises(CLIFailureError):
+            self.svc._map_volumes(["vol1", "vol2", "vol3"], "host")
+        self.svc.client.send_raw_command.assert_not_called()
+        self.assertEqual(self.svc._get_lun_allocator("host").reserve(lambda: set()), 0)
+
+    @patch("controller.array_action.array_mediator_svc.array_assigned_lun", True)
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    def test_map_volumes_with_array_assigned_lun_maps_each_volume(self):
+        self.svc.client.svctask.mkvdiskhostmap.side_effect = [
+            Mock(response=(b"Virtual Disk to Host map, id [3], successfully created\n", b"")),
+            Mock(response=(b"Virtual Disk to Host map, id [4], successfully created\n", b""))]
+        results = self.svc._map_volumes(["vol1", "vol2"], "host")
+        self.assertEqual(results, [('3', None), ('4', None)])
+        self.svc.client.send_raw_command.assert_not_called()
+
     @patch("controller.array_action.array_mediator_svc.is_warning_message")
     def test_unmap_volume_vol_not_found(self, mock_is_warning_message):
         mock_is_warning_message.return_value = False
@@ -539,6 +808,32 @@ class TestArrayMediatorSVC(unittest.TestCase):
         self.svc.client.svctask.rmvdiskhostmap.return_value = None
         self.svc.unmap_volume("vol", "host")
 
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    def test_unmap_volumes_by_initiators_in_batch(self):
+        self.svc.get_host_by_host_identifiers = Mock(return_value=("host", ["iscsi"]))
+        self.svc.client.send_raw_command.return_value = (b"", b"")
+        results = self.svc.unmap_volumes_by_initiators(["vol1", "vol2"], Initiators("iqn", []))
+        self.assertEqual(results, [(None, None), (None, None)])
+        self.svc.get_host_by_host_identifiers.assert_called_once()
+        self.svc.client.send_raw_command.assert_called_once_with(
+            'rmvdiskhostmap -host host vol1_name;rmvdiskhostmap -host host vol2_name;')
+        self.svc.client.svctask.rmvdiskhostmap.assert_not_called()
+
+    @patch("controller.array_action.array_mediator_svc.is_warning_message")
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    def test_unmap_volumes_unmaps_still_mapped_volumes_separately(self, mock_is_warning_message):
+        mock_is_warning_message.return_value = False
+        self.svc.client.send_raw_command.return_value = (b"", b"CMMVC5842E")
+        self.svc.client.svcinfo.lshostvdiskmap.return_value = [Munch({'vdisk_name': 'vol2_name'})]
+        self.svc.client.svctask.rmvdiskhostmap.side_effect = [svc_errors.CommandExecutionError('Failed')]
+        results = self.svc._unmap_volumes(["vol1", "vol2"], "host")
+
+        self.svc.client.send_raw_command.assert_called_once_with(
+            'rmvdiskhostmap -host host vol1_name;rmvdiskhostmap -host host vol2_name;')
+        self.assertEqual(results[0], (None, None))
+        self.assertIsInstance(results[1][1], array_errors.UnMappingError)
+        self.svc.client.svctask.rmvdiskhostmap.assert_called_once_with(host="host", vdisk_id="vol2_name")
+
     def test_get_iscsi_targets_cmd_error_raise_no_targets_error(self):
         self.svc.client.svcinfo.lsportip.side_effect = [
             svc_errors.CommandExecutionError('Failed')]
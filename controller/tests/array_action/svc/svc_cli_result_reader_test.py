@@ -36,6 +36,57 @@ class TestSVCListReader(unittest.TestCase):
         hosts_list = list(hosts_reader)
         self.assertFalse(hosts_list)
 
+    def test_multiple_hosts_bytes_input(self):
+        hosts_raw_input = "\n".join((host_1, host_2, host_3)).encode()
+        hosts_list = list(SVCListResultsReader(hosts_raw_input))
+        self.assertEqual(len(hosts_list), 3)
+        self._assert_host_1(hosts_list[0])
+        self._assert_host_3(hosts_list[2])
+
+    def test_multiple_hosts_chunks_input(self):
+        hosts_raw_input = "\n".join((host_1, host_2, host_3, "name \u05d4")).encode()
+        # chunks split lines and the multi-byte character at the end
+        chunks = [hosts_raw_input[i:i + 5] for i in range(0, len(hosts_raw_input), 5)]
+        hosts_list = list(SVCListResultsReader(iter(chunks)))
+        self.assertEqual(len(hosts_list), 3)
+        self._assert_host_1(hosts_list[0])
+        self._assert_host_2(hosts_list[1])
+        self.assertEqual(hosts_list[2].get_as_list("name"), ["host_3", "\u05d4"])
+
+    def test_chunks_input_is_read_lazily(self):
+        read_chunks = []
+
+        def chunks():
+            for host in (host_1, host_2, host_3):
+                read_chunks.append(host)
+                yield host + "\n"
+        hosts_reader = SVCListResultsReader(chunks())
+        self._assert_host_1(next(hosts_reader))
+        self.assertEqual(len(read_chunks), 2)
+
+    def test_no_hosts_empty_bytes_input(self):
+        self.assertFalse(list(SVCListResultsReader(b"")))
+
+    def test_multiple_hosts_with_fields(self):
+        hosts_raw_input = "\n".join((host_1, host_2, host_3))
+        hosts_list = list(SVCListResultsReader(hosts_raw_input, fields=("name", "WWPN")))
+        self.assertEqual(len(hosts_list), 3)
+        self.assertEqual(hosts_list[0].get("id"), "1")
+        self.assertEqual(hosts_list[0].get("name"), "host_1")
+        self.assertEqual(hosts_list[0].get_as_list("WWPN"), ["wwpn1", "wwpn2"])
+        self.assertIsNone(hosts_list[0].get("protocol"))
+        self.assertIsNone(hosts_list[1].get("status"))
+        self.assertEqual(hosts_list[2].get_as_list("name"), ["host_3"])
+        self.assertEqual(hosts_list[2].get_as_list("iscsi"), [])
+
+    def test_fields_skip_params_with_same_prefix(self):
+        hosts_raw_input = "\n".join(("id 1", "name host_1", "name_x x", "identifier 5", "id 2"))
+        hosts_list = list(SVCListResultsReader(hosts_raw_input, fields=("name",)))
+        self.assertEqual(len(hosts_list), 2)
+        self.assertEqual(hosts_list[0].get_as_list("name"), ["host_1"])
+        self.assertIsNone(hosts_list[0].get("name_x"))
+        self.assertIsNone(hosts_list[0].get("identifier"))
+
     def test_illegal_input(self):
         illegal_input = "\n".join(("name host_3", "id 3"))
         with self.assertRaises(errors.InvalidCliResponseError):
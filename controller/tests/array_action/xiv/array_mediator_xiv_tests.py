@@ -3,9 +3,11 @@ import unittest
 from mock import patch, Mock
 
 import controller.array_action.errors as array_errors
+import controller.array_action.lun_allocator as lun_allocator
 from controller.array_action.array_mediator_xiv import XIVArrayMediator
 from controller.array_action.config import FC_CONNECTIVITY_TYPE
 from controller.array_action.config import ISCSI_CONNECTIVITY_TYPE
+from controller.array_action.volume_names_memo import get_volume_names_memo, request_volume_names_memo
 from controller.common.node_info import Initiators
 from controller.tests.array_action.xiv import utils
 from pyxcli import errors as xcli_errors
@@ -18,6 +20,45 @@ class TestArrayMediatorXIV(unittest.TestCase):
         self.fqdn = "fqdn"
         self.mediator = XIVArrayMediator("user", "password", self.fqdn)
         self.mediator.client = Mock()
+        lun_allocator.lun_allocators_dict.clear()
+
+    def _prepare_vol_by_wwn(self, vol_name):
+        self.mediator.client.cmd.vol_list.return_value = Mock(as_single_element=Mock())
+        self.mediator.client.cmd.vol_list.return_value.as_single_element.name = vol_name
+        self.mediator.client.cmd.vol_mapping_list.return_value = Mock(as_list=[])
+
+    def test_get_vol_by_wwn_is_remembered_in_request(self):
+        self._prepare_vol_by_wwn("vol_name")
+        self.mediator.client.cmd.mapping_list.return_value = Mock(as_list=[])
+        with request_volume_names_memo():
+            self.mediator.get_volume_mappings("wwn")
+            self.mediator.map_volume("wwn", "host")
+        self.mediator.client.cmd.vol_list.assert_called_once_with(wwn="wwn")
+
+    def test_get_vol_by_wwn_is_forgotten_on_volume_not_found(self):
+        self._prepare_vol_by_wwn("vol_name")
+        self.mediator.client.cmd.unmap_vol.side_effect = [xcli_errors.VolumeBadNameError("", "", "")]
+        with request_volume_names_memo():
+            with self.assertRaises(array_errors.VolumeNotFoundError):
+                self.mediator.unmap_volume("wwn", "host")
+            self.mediator.get_volume_mappings("wwn")
+        self.assertEqual(self.mediator.client.cmd.vol_list.call_count, 2)
+
+    def test_delete_volume_forgets_name(self):
+        self._prepare_vol_by_wwn("vol_name")
+        with request_volume_names_memo():
+            self.mediator.delete_volume("wwn")
+            self.assertNotIn("wwn", get_volume_names_memo(self.fqdn))
+
+    def test_map_volume_does_not_use_name_of_previous_request(self):
+        with request_volume_names_memo():
+            get_volume_names_memo(self.fqdn)["wwn"] = "stale_vol_name"
+        self._prepare_vol_by_wwn("vol_name")
+        self.mediator.client.cmd.mapping_list.return_value = Mock(as_list=[])
+        with request_volume_names_memo():
+            self.mediator.map_volume("wwn", "host")
+        self.mediator.client.cmd.vol_list.assert_called_once_with(wwn="wwn")
+        self.assertEqual(self.mediator.client.cmd.map_vol.call_args[1]['vol'], "vol_name")
 
     def test_get_volume_return_correct_errors(self):
         error_msg = "ex"
@@ -319,6 +360,25 @@ class TestArrayMediatorXIV(unittest.TestCase):
         with self.assertRaises(array_errors.NoAvailableLunError):
             self.mediator._get_next_available_lun("host")
 
+    def test_map_volume_reserves_luns_locally(self):
+        self._prepare_vol_by_wwn("vol_name")
+        res = Mock()
+        res.as_list = [utils.get_mock_xiv_host_mapping("1")]
+        self.mediator.client.cmd.mapping_list.return_value = res
+        self.assertEqual(self.mediator.map_volume("vol1", "host"), "2")
+        self.assertEqual(self.mediator.map_volume("vol2", "host"), "3")
+        self.mediator.client.cmd.mapping_list.assert_called_once_with(host="host")
+
+    def test_map_volume_releases_lun_on_failure(self):
+        self._prepare_vol_by_wwn("vol_name")
+        res = Mock()
+        res.as_list = []
+        self.mediator.client.cmd.mapping_list.return_value = res
+        self.mediator.client.cmd.map_vol.side_effect = [xcli_errors.HostBadNameError("", "host", ""), None]
+        with self.assertRaises(array_errors.HostNotFoundError):
+            self.mediator.map_volume("vol", "host")
+        self.assertEqual(self.mediator.map_volume("vol", "host"), "1")
+
     def test_map_volume_vol_bot_found(self):
         vol = Mock()
         vol.as_single_element = None
@@ -404,6 +464,29 @@ class TestArrayMediatorXIV(unittest.TestCase):
         self.mediator.client.cmd.unmap_vol.return_value = None
         self.mediator.unmap_volume("vol", "host")
 
+    def test_unmap_volumes_resolves_host_once(self):
+        self.mediator.get_host_by_host_identifiers = Mock(return_value=("host", ["iscsi"]))
+        self.mediator.client.cmd.unmap_vol.side_effect = [None, xcli_errors.HostBadNameError("", "", "")]
+        results = self.mediator.unmap_volumes_by_initiators(["vol1", "vol2"], Initiators("iqn", []))
+
+        self.mediator.get_host_by_host_identifiers.assert_called_once()
+        self.assertEqual(self.mediator.client.cmd.unmap_vol.call_count, 2)
+        self.assertEqual(results[0], (None, None))
+        self.assertIsInstance(results[1][1], array_errors.HostNotFoundError)
+
+    def test_map_volumes_by_initiators_finds_host_once(self):
+        array_initiators = {"iqn1": ["1.1.1.1"]}
+        self.mediator.get_host_by_host_identifiers = Mock(return_value=("host", [ISCSI_CONNECTIVITY_TYPE]))
+        self.mediator.get_iscsi_targets_by_iqn = Mock(return_value=array_initiators)
+        self.mediator.get_volume_mappings = Mock(side_effect=[{"host": "1"}, {"other_host": "2"}, {}])
+        self.mediator.map_volume = Mock(return_value="3")
+        results = self.mediator.map_volumes_by_initiators(["vol1", "vol2", "vol3"], Initiators("iqn", []))
+        self.assertEqual(results[0], (("1", ISCSI_CONNECTIVITY_TYPE, array_initiators), None))
+        self.assertIsInstance(results[1][1], array_errors.VolumeMappedToMultipleHostsError)
+        self.assertEqual(results[2], (("3", ISCSI_CONNECTIVITY_TYPE, array_initiators), None))
+        self.mediator.get_host_by_host_identifiers.assert_called_once()
+        self.mediator.map_volume.assert_called_once_with("vol3", "host")
+
     def test_get_iscsi_targets_by_iqn_fail(self):
         self.mediator.client.cmd.config_get.return_value = Mock(as_list=[])
         self.mediator.client.cmd.ipinterface_list.return_value = []
@@ -0,0 +1,35 @@
+import unittest
+
+from mock import patch
+
+from controller.common.ttl_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache(10)
+
+    def test_get_returns_cached_value(self):
+        self.cache.set("key", "value")
+        self.assertEqual(self.cache.get("key"), "value")
+        self.assertEqual(len(self.cache), 1)
+
+    def test_get_returns_default_for_missing_key(self):
+        self.assertEqual(self.cache.get("key", "default"), "default")
+
+    @patch("controller.common.ttl_cache.time")
+    def test_get_returns_default_for_expired_key(self, time):
+        time.return_value = 100
+        self.cache.set("key", "value")
+        self.cache.set("other_key", "value", ttl_in_seconds=30)
+        time.return_value = 110
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.get("other_key"), "value")
+        self.assertEqual(len(self.cache), 1)
+
+    def test_pop_removes_key(self):
+        self.cache.set("key", "value")
+        self.assertEqual(self.cache.pop("key"), "value")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertIsNone(self.cache.pop("key"))
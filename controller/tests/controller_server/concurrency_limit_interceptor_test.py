@@ -0,0 +1,66 @@
+import unittest
+
+import grpc
+from mock import Mock
+
+from controller.controller_server.concurrency_limit_interceptor import ConcurrencyLimitInterceptor
+
+
+class AbortError(Exception):
+    pass
+
+
+class TestConcurrencyLimitInterceptor(unittest.TestCase):
+
+    def setUp(self):
+        self.interceptor = ConcurrencyLimitInterceptor(2, {"DeleteVolume": 1}, ["csi.v1.Identity"])
+        self.context = Mock()
+        self.context.abort.side_effect = AbortError
+
+    def _get_behavior(self, method, behavior):
+        handler = grpc.unary_unary_rpc_method_handler(behavior)
+        handler_call_details = Mock(method=method)
+        return self.interceptor.intercept_service(lambda _: handler, handler_call_details).unary_unary
+
+    def _call_while_running(self, running_methods, method):
+        """
+        call the method while the running methods are in progress, each one from within the previous one
+        """
+        if not running_methods:
+            return self._get_behavior(method, lambda request, context: "response")("request", self.context)
+
+        def behavior(request, context):
+            return self._call_while_running(running_methods[1:], method)
+
+        return self._get_behavior(running_methods[0], behavior)("request", self.context)
+
+    def test_rpc_is_handled_under_the_limit(self):
+        response = self._call_while_running(["/csi.v1.Controller/CreateVolume"], "/csi.v1.Controller/CreateVolume")
+        self.assertEqual(response, "response")
+        self.context.abort.assert_not_called()
+
+    def test_rpc_is_rejected_over_the_total_limit(self):
+        with self.assertRaises(AbortError):
+            self._call_while_running(["/csi.v1.Controller/CreateVolume", "/csi.v1.Controller/CreateVolume"],
+                                     "/csi.v1.Controller/CreateVolume")
+        self.context.abort.assert_called_once()
+        self.assertEqual(self.context.abort.call_args[0][0], grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+    def test_rpc_is_rejected_over_the_method_limit(self):
+        with self.assertRaises(AbortError):
+            self._call_while_running(["/csi.v1.Controller/DeleteVolume"], "/csi.v1.Controller/DeleteVolume")
+        self.assertEqual(self.context.abort.call_args[0][0], grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+    def test_identity_rpc_is_not_limited(self):
+        response = self._call_while_running(["/csi.v1.Controller/CreateVolume", "/csi.v1.Controller/CreateVolume"],
+                                            "/csi.v1.Identity/Probe")
+        self.assertEqual(response, "response")
+        self.context.abort.assert_not_called()
+
+    def test_limits_are_released_after_rpc(self):
+        for _ in range(3):
+            self._call_while_running(["/csi.v1.Controller/DeleteVolume"], "/csi.v1.Controller/CreateVolume")
+        with self.assertRaises(AbortError):
+            self._call_while_running(["/csi.v1.Controller/DeleteVolume"], "/csi.v1.Controller/DeleteVolume")
+        response = self._call_while_running([], "/csi.v1.Controller/DeleteVolume")
+        self.assertEqual(response, "response")
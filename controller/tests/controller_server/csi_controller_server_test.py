@@ -1,13 +1,20 @@
+import re
 import unittest
+from threading import Thread
 
 # from unittest import mock as umock
 import grpc
 import abc
 from mock import patch, Mock, call
 
+import controller.array_action.array_connection_manager as array_connection_manager
 import controller.array_action.errors as array_errors
+import controller.array_action.lun_allocator as lun_allocator
+import controller.array_action.request_batcher as request_batcher
 import controller.controller_server.errors as controller_errors
+from controller.array_action.array_mediator_svc import SVCArrayMediator
 from controller.array_action.array_mediator_xiv import XIVArrayMediator
+from controller.array_action.object_locks import volume_locks, host_locks
 from controller.controller_server.config import PARAMETERS_VOLUME_NAME_PREFIX, PARAMETERS_SNAPSHOT_NAME_PREFIX
 from controller.controller_server.csi_controller_server import ControllerServicer
 from controller.controller_server.test_settings import vol_name, snap_name, snap_vol_name
@@ -147,8 +154,12 @@ class TestControllerServerCreateSnapshot(AbstractControllerTest):
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.detect_array_type")
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__exit__")
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
-    def test_create_snapshot_with_get_array_type_exception(self, a_enter, a_exit, array_type):
-        self._test_create_object_with_get_array_type_exception(a_enter, array_type)
+    def test_create_snapshot_uses_array_type_of_source_volume(self, a_enter, a_exit, array_type):
+        a_enter.return_value = self.mediator
+        context = utils.FakeContext()
+        self.servicer.CreateSnapshot(self.request, context)
+        array_type.assert_not_called()
+        self.assertEqual(context.code, grpc.StatusCode.OK)
 
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.detect_array_type")
     @patch("controller.array_action.array_mediator_xiv.XIVArrayMediator.get_snapshot")
@@ -296,6 +307,38 @@ class TestControllerServerCreateVolume(AbstractControllerTest):
         self.mediator.get_volume.assert_called_once_with(vol_name, volume_context={'pool': 'pool1'}, volume_prefix="")
         self.mediator.create_volume.assert_called_once_with(vol_name, 10, {}, 'pool1', "")
 
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.detect_array_type")
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
+    def test_create_volume_optimistically(self, a_enter, array_type):
+        a_enter.return_value = self.mediator
+        context = utils.FakeContext()
+        self.servicer.optimistic_create = True
+
+        self.mediator.create_volume = Mock()
+        self.mediator.create_volume.return_value = utils.get_mock_mediator_response_volume(10, "vol", "wwn", "xiv")
+        array_type.return_value = "a9k"
+        self.servicer.CreateVolume(self.request, context)
+        self.assertEqual(context.code, grpc.StatusCode.OK)
+        self.mediator.get_volume.assert_not_called()
+        self.mediator.create_volume.assert_called_once_with(vol_name, 10, {}, 'pool1', "", raise_if_exists=True)
+
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.detect_array_type")
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
+    def test_create_volume_optimistically_when_volume_exists(self, a_enter, array_type):
+        a_enter.return_value = self.mediator
+        context = utils.FakeContext()
+        self.servicer.optimistic_create = True
+
+        self.mediator.create_volume = Mock()
+        self.mediator.create_volume.side_effect = [array_errors.VolumeAlreadyExists(vol_name, "endpoint")]
+        self.mediator.get_volume.side_effect = None
+        self.mediator.get_volume.return_value = utils.get_mock_mediator_response_volume(20, "vol", "wwn", "xiv")
+        array_type.return_value = "a9k"
+        self.servicer.CreateVolume(self.request, context)
+        self.assertEqual(context.code, grpc.StatusCode.ALREADY_EXISTS)
+        self.mediator.get_volume.assert_called_once_with(vol_name, volume_context={'pool': 'pool1'}, volume_prefix="")
+        self.mediator.create_volume.assert_called_once_with(vol_name, 10, {}, 'pool1', "", raise_if_exists=True)
+
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
     def test_create_volume_with_wrong_secrets(self, a_enter):
         self._test_create_object_with_wrong_secrets(a_enter)
@@ -614,6 +657,39 @@ class TestControllerServerPublishVolume(unittest.TestCase):
         self.servicer.ControllerPublishVolume(self.request, context)
         self.assertEqual(context.code, grpc.StatusCode.NOT_FOUND)
 
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
+    def test_publish_volume_aborted_when_volume_is_locked(self, enter):
+        enter.return_value = self.mediator
+        context = utils.FakeContext()
+        context.time_remaining = Mock(return_value=0)
+
+        with volume_locks.lock("wwn1"):
+            self.servicer.ControllerPublishVolume(self.request, context)
+        self.assertEqual(context.code, grpc.StatusCode.ABORTED)
+        enter.assert_not_called()
+
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
+    def test_publish_volume_aborted_when_host_is_locked(self, enter):
+        enter.return_value = self.mediator
+        context = utils.FakeContext()
+        context.time_remaining = Mock(return_value=0)
+
+        with host_locks.lock((self.fqdn, self.hostname)):
+            self.servicer.ControllerPublishVolume(self.request, context)
+        self.assertEqual(context.code, grpc.StatusCode.ABORTED)
+        self.mediator.map_volume.assert_not_called()
+
+    @patch("controller.array_action.array_mediator_abstract.host_locks")
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
+    def test_publish_volume_locks_array_host_until_deadline(self, enter, mock_host_locks):
+        enter.return_value = self.mediator
+        context = utils.FakeContext()
+        context.time_remaining = Mock(return_value=5)
+
+        self.servicer.ControllerPublishVolume(self.request, context)
+        self.assertEqual(context.code, grpc.StatusCode.OK)
+        mock_host_locks.lock.assert_called_once_with((self.fqdn, self.hostname), 5)
+
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
     def test_publish_volume_get_host_by_host_identifiers_exception(self, enter):
         context = utils.FakeContext()
@@ -826,6 +902,13 @@ class TestControllerServerPublishVolume(unittest.TestCase):
         self.servicer.ControllerPublishVolume(self.request, context)
         self.assertEqual(context.code, grpc.StatusCode.RESOURCE_EXHAUSTED)
 
+    @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
+    def test_publish_volume_no_connection_available(self, enter):
+        context = utils.FakeContext()
+        enter.side_effect = [array_errors.NoConnectionAvailableException("endpoint")]
+        self.servicer.ControllerPublishVolume(self.request, context)
+        self.assertEqual(context.code, grpc.StatusCode.RESOURCE_EXHAUSTED)
+
     @patch("controller.array_action.array_connection_manager.ArrayConnectionManager.__enter__")
     def test_publish_volume_get_iscsi_targets_by_iqn_excpetions(self, enter):
         context = utils.FakeContext()
@@ -847,6 +930,107 @@ class TestControllerServerPublishVolume(unittest.TestCase):
         self.assertEqual(context.code, grpc.StatusCode.INVALID_ARGUMENT)
 
 
+class TestControllerServerPublishVolumeInBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.servicer = ControllerServicer("fqdn")
+        self.client = Mock()
+        self.client.svcinfo.lshostvdiskmap.return_value = []
+        self.client.send_raw_command.side_effect = self._get_map_volumes_output
+        for cached_dict in (array_connection_manager.array_connections_dict,
+                            array_connection_manager.idle_connections_dict,
+                            array_connection_manager.connection_waiters_dict, request_batcher.request_batchers_dict,
+                            lun_allocator.lun_allocators_dict):
+            cached_dict.clear()
+
+    def _get_map_volumes_output(self, cmd):
+        output = "".join("Virtual Disk to Host map, id [{0}], successfully created\n".format(lun)
+                         for lun in re.findall(r"-scsi (\d+)", cmd))
+        return output.encode(), b""
+
+    def _get_request(self, vol_id, iscsi_iqn="iqn.1994-05.com.redhat:686358c930fe"):
+        request = Mock()
+        request.volume_id = "{0}:{1}".format(SVCArrayMediator.array_type, vol_id)
+        request.node_id = "hostname;{0};".format(iscsi_iqn)
+        request.readonly = False
+        request.secrets = {"username": "user", "password": "pass", "management_address": "mg"}
+        request.volume_context = {}
+        request.volume_capability.mount.fs_type = "ext4"
+        request.volume_capability.access_mode.mode = csi_pb2.VolumeCapability.AccessMode.SINGLE_NODE_WRITER
+        return request
+
+    @patch("controller.array_action.request_batcher.batch_window_in_seconds", 0.5)
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    @patch.object(SVCArrayMediator, "get_volume_mappings", Mock(return_value={}))
+    @patch.object(SVCArrayMediator, "get_iscsi_targets_by_iqn", Mock(return_value={"iqn1": ["1.1.1.1"]}))
+    @patch.object(SVCArrayMediator, "get_host_by_host_identifiers")
+    @patch.object(SVCArrayMediator, "_connect", autospec=True)
+    def test_publish_volumes_to_same_host_in_single_batch(self, connect, get_host_by_host_identifiers):
+        connect.side_effect = lambda mediator: setattr(mediator, "client", self.client)
+        get_host_by_host_identifiers.return_value = "host", ["iscsi"]
+        requests_count = SVCArrayMediator.max_connections + 3
+        requests = [self._get_request("wwn{0}".format(index)) for index in range(requests_count)]
+        contexts, responses = self._call_concurrently(self.servicer.ControllerPublishVolume, requests)
+
+        self.assertEqual([context.code for context in contexts], [grpc.StatusCode.OK] * requests_count)
+        self.assertEqual(set(response.publish_context["PUBLISH_CONTEXT_LUN"] for response in responses),
+                         set(str(lun) for lun in range(requests_count)))
+        self.client.send_raw_command.assert_called_once()
+        self.assertEqual(self.client.send_raw_command.call_args[0][0].count("mkvdiskhostmap"), requests_count)
+        connect.assert_called_once()
+        get_host_by_host_identifiers.assert_called_once()
+
+    @patch.object(SVCArrayMediator, "get_iscsi_targets_by_iqn", Mock(return_value={"iqn1": ["1.1.1.1"]}))
+    @patch.object(SVCArrayMediator, "get_host_by_host_identifiers", Mock(return_value=("host", ["iscsi"])))
+    @patch.object(SVCArrayMediator, "_connect", autospec=True)
+    def test_publish_volume_finds_volume_name_once(self, connect):
+        connect.side_effect = lambda mediator: setattr(mediator, "client", self.client)
+        self.client.svcinfo.lsvdisk.return_value.as_single_element.name = "vol_name"
+        self.client.svcinfo.lsvdiskhostmap.return_value = []
+        self.client.svctask.mkvdiskhostmap.return_value = None
+        context = utils.FakeContext()
+        self.servicer.ControllerPublishVolume(self._get_request("wwn"), context)
+
+        self.assertEqual(context.code, grpc.StatusCode.OK)
+        self.client.svcinfo.lsvdisk.assert_called_once_with(filtervalue="vdisk_UID=wwn")
+        self.assertEqual(self.client.svctask.mkvdiskhostmap.call_args[1]["object_id"], "vol_name")
+
+    @patch("controller.array_action.request_batcher.batch_window_in_seconds", 0.5)
+    @patch.object(SVCArrayMediator, "_get_vol_by_wwn", lambda self, volume_id: volume_id + "_name")
+    @patch.object(SVCArrayMediator, "get_host_by_host_identifiers")
+    @patch.object(SVCArrayMediator, "_connect", autospec=True)
+    def test_unpublish_volumes_from_same_host_in_single_batch(self, connect, get_host_by_host_identifiers):
+        connect.side_effect = lambda mediator: setattr(mediator, "client", self.client)
+        get_host_by_host_identifiers.return_value = "host", ["iscsi"]
+        self.client.send_raw_command.side_effect = None
+        self.client.send_raw_command.return_value = b"", b""
+        requests_count = SVCArrayMediator.max_connections + 3
+        iscsi_iqn = "iqn.1994-05.com.redhat:686358c930fe"
+        requests = [self._get_request("wwn{0}".format(index), iscsi_iqn.upper() if index % 2 else iscsi_iqn)
+                    for index in range(requests_count)]
+        contexts, _ = self._call_concurrently(self.servicer.ControllerUnpublishVolume, requests)
+
+        self.assertEqual([context.code for context in contexts], [grpc.StatusCode.OK] * requests_count)
+        self.client.send_raw_command.assert_called_once()
+        self.assertEqual(self.client.send_raw_command.call_args[0][0].count("rmvdiskhostmap"), requests_count)
+        connect.assert_called_once()
+        get_host_by_host_identifiers.assert_called_once()
+
+    def _call_concurrently(self, method, requests):
+        contexts = [utils.FakeContext() for _ in requests]
+        responses = [None] * len(requests)
+
+        def call_method(index):
+            responses[index] = method(requests[index], contexts[index])
+
+        threads = [Thread(target=call_method, args=(index,)) for index in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return contexts, responses
+
+
 class TestControllerServerUnPublishVolume(unittest.TestCase):
 
     @patch("controller.array_action.array_mediator_xiv.XIVArrayMediator._connect")
@@ -0,0 +1,143 @@
+import unittest
+from threading import Event, Thread
+
+import grpc
+from mock import Mock
+
+from controller.controller_server.single_flight import SingleFlight
+from controller.csi_general import csi_pb2
+from controller.tests import utils
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight(csi_pb2.CreateVolumeResponse)
+        self.request = csi_pb2.CreateVolumeRequest(name="volume")
+        self.started = Event()
+        self.release = Event()
+        self.function = Mock(side_effect=self._handle_request)
+
+    def _handle_request(self, request, context):
+        self.started.set()
+        self.release.wait(5)
+        context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+        context.set_details("details")
+        return csi_pb2.CreateVolumeResponse(volume=csi_pb2.Volume(volume_id=request.name))
+
+    def _start_leader(self, results):
+        context = utils.FakeContext()
+
+        def run():
+            results.append(self.single_flight.run("key", self.function, self.request, context))
+        thread = Thread(target=run)
+        thread.start()
+        self.assertTrue(self.started.wait(5))
+        return thread, context
+
+    def _start_follower(self, results, request, context):
+        def run():
+            results.append(self.single_flight.run("key", self.function, request, context))
+        thread = Thread(target=run)
+        thread.start()
+        self._wait_for_follower(context)
+        return thread
+
+    def _wait_for_follower(self, context):
+        # the follower gets its time remaining right before waiting for the request in flight
+        for _ in range(500):
+            if context.waiting.is_set():
+                return
+            context.waiting.wait(0.01)
+        self.fail("follower did not wait for the request in flight")
+
+    def _get_follower_context(self):
+        context = utils.FakeContext()
+        context.waiting = Event()
+        context.time_remaining = Mock(side_effect=lambda: context.waiting.set())
+        return context
+
+    def test_identical_request_gets_result_of_request_in_flight(self):
+        results = []
+        leader_thread, leader_context = self._start_leader(results)
+        follower_context = self._get_follower_context()
+        follower_thread = self._start_follower(results, csi_pb2.CreateVolumeRequest(name="volume"), follower_context)
+
+        self.release.set()
+        leader_thread.join(5)
+        follower_thread.join(5)
+
+        self.function.assert_called_once()
+        self.assertEqual(len(results), 2)
+        self.assertIs(results[0], results[1])
+        self.assertEqual(follower_context.code, grpc.StatusCode.ALREADY_EXISTS)
+        self.assertEqual(follower_context.details, "details")
+        self.assertEqual(leader_context.code, grpc.StatusCode.ALREADY_EXISTS)
+
+    def test_different_request_with_same_key_is_handled_separately(self):
+        results = []
+        leader_thread, _ = self._start_leader(results)
+        self.release.set()
+        response = self.single_flight.run("key", self.function, csi_pb2.CreateVolumeRequest(name="other"),
+                                          utils.FakeContext())
+        leader_thread.join(5)
+
+        self.assertEqual(self.function.call_count, 2)
+        self.assertEqual(response.volume.volume_id, "other")
+
+    def test_follower_gets_exception_of_request_in_flight(self):
+        self.function.side_effect = lambda request, context: self._raise_after_release()
+        results = []
+        errors = []
+
+        def run_leader():
+            try:
+                self.single_flight.run("key", self.function, self.request, utils.FakeContext())
+            except ValueError as ex:
+                errors.append(ex)
+        leader_thread = Thread(target=run_leader)
+        leader_thread.start()
+        self.assertTrue(self.started.wait(5))
+
+        follower_context = self._get_follower_context()
+
+        def run_follower():
+            try:
+                results.append(self.single_flight.run("key", self.function, self.request, follower_context))
+            except ValueError as ex:
+                errors.append(ex)
+        follower_thread = Thread(target=run_follower)
+        follower_thread.start()
+        self._wait_for_follower(follower_context)
+
+        self.release.set()
+        leader_thread.join(5)
+        follower_thread.join(5)
+        self.function.assert_called_once()
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+    def _raise_after_release(self):
+        self.started.set()
+        self.release.wait(5)
+        raise ValueError("error")
+
+    def test_follower_stops_waiting_at_deadline(self):
+        results = []
+        leader_thread, _ = self._start_leader(results)
+        follower_context = utils.FakeContext()
+        follower_context.time_remaining = Mock(return_value=0)
+        response = self.single_flight.run("key", self.function, self.request, follower_context)
+
+        self.assertEqual(response, csi_pb2.CreateVolumeResponse())
+        self.assertEqual(follower_context.code, grpc.StatusCode.DEADLINE_EXCEEDED)
+        self.release.set()
+        leader_thread.join(5)
+        self.function.assert_called_once()
+
+    def test_request_after_flight_is_handled_again(self):
+        self.release.set()
+        self.single_flight.run("key", self.function, self.request, utils.FakeContext())
+        self.single_flight.run("key", self.function, self.request, utils.FakeContext())
+        self.assertEqual(self.function.call_count, 2)
@@ -309,3 +309,12 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(res.publish_context["lun"], '1')
         self.assertEqual(res.publish_context["connectivity_type"], "fc")
         self.assertEqual(res.publish_context["fc_wwns"], "wwn1,wwn2")
+
+    def test_get_rpc_concurrency_limits(self):
+        self.assertEqual(utils.get_rpc_concurrency_limits(""), {})
+        self.assertEqual(utils.get_rpc_concurrency_limits("CreateVolume=4, DeleteVolume=2"),
+                         {"CreateVolume": 4, "DeleteVolume": 2})
+
+        for rpc_concurrency_limits in ["CreateVolume", "CreateVolume=a", "CreateVolume=0", "=4"]:
+            with self.assertRaises(ValidationException):
+                utils.get_rpc_concurrency_limits(rpc_concurrency_limits)
@@ -37,3 +37,9 @@ class FakeContext:
 
     def set_details(self, details):
         self.details = details
+
+    def time_remaining(self):
+        return None
+
+    def is_active(self):
+        return True